@@ -0,0 +1,255 @@
+"""Convert weights of torch ENet into npz and load them into keras ENet
+
+Torch modules with weights are converted to layouts of keras layers and
+written into npz without pickled objects, one array per weight:
+
+    python convert_weights.py model-best.net --npz model_pretrained.npz --keras-weights ENet_pretrained.h5
+
+Keras layers are matched to torch modules by position in graph: layers are
+ordered by forward pass where inputs of every layer are visited in order, so
+main branch of bottleneck (first input of `add`) comes before other branch as
+in torch. Order of creation of layers is not used, it differs from torch in
+upsampling bottlenecks, where both branches end with BatchNormalization of the
+same shape. Type and shapes of weights of every pair are checked, report of
+every layer is printed, `--strict` makes mismatched layers and unused modules
+an error for use in CI. Number of classes is taken from the last full
+convolution unless `--classes` is given. Source may be .npz written before,
+then torchfile is not needed.
+"""
+
+import argparse
+import os
+import sys
+
+import keras.backend as K
+import numpy as np
+from keras.layers import BatchNormalization, Conv2D, Conv2DTranspose, PReLU
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# torch convolution weight is [out, in, h, w], full convolution is [in, out, h, w]
+CONV_TRANSPOSE = (2, 3, 1, 0)
+# type of keras layer for each torch module
+TORCH_TYPES = {
+    'cudnn.SpatialConvolution': 'Conv2D',
+    'nn.SpatialConvolution': 'Conv2D',
+    'nn.SpatialDilatedConvolution': 'Conv2D',
+    'nn.SpatialFullConvolution': 'Conv2DTranspose',
+    'nn.SpatialBatchNormalization': 'BatchNormalization',
+    'nn.PReLU': 'PReLU',
+}
+KERAS_TYPES = {Conv2DTranspose: 'Conv2DTranspose', Conv2D: 'Conv2D', BatchNormalization: 'BatchNormalization',
+               PReLU: 'PReLU'}
+
+
+def _field(module, name):
+    # keys are bytes or str depending on version of torchfile
+    obj = module._obj
+    return obj[name.encode()] if name.encode() in obj else obj.get(name)
+
+
+def torch_modules(path):
+    """Modules with weights of torch model in order of forward pass
+
+    :path (str): path to .net file
+
+    :return (generator of tuple(str, list of arrays)): type of module and its weights in keras layout
+    """
+    import torchfile
+
+    stack = [torchfile.load(path)]
+    while stack:
+        module = stack.pop()
+        submodules = _field(module, 'modules')
+        if _field(module, 'weight') is None:
+            stack.extend(reversed(list(submodules or [])))
+            continue
+        typename = module.torch_typename()
+        typename = typename.decode() if isinstance(typename, bytes) else typename
+        if typename not in TORCH_TYPES:
+            print('Unhandled torch module: {}'.format(typename))
+            continue
+        if TORCH_TYPES[typename] in ('Conv2D', 'Conv2DTranspose'):
+            weights = [np.transpose(_field(module, 'weight'), CONV_TRANSPOSE)]
+            if _field(module, 'bias') is not None:
+                weights.append(_field(module, 'bias'))
+        elif typename == 'nn.SpatialBatchNormalization':
+            weights = [_field(module, _name) for _name in ('weight', 'bias', 'running_mean', 'running_var')]
+        else:
+            # PReLU of keras has shared_axes=[1, 2]
+            weights = [_field(module, 'weight')[np.newaxis, np.newaxis]]
+        yield typename, [np.ascontiguousarray(_w, dtype=np.float32) for _w in weights]
+
+
+def save_npz(modules, path):
+    """Write converted modules without pickle
+
+    :modules (iterable of tuple(str, list of arrays)): result of `torch_modules`
+    :path (str): path to .npz file
+
+    :return (int): number of modules
+    """
+    arrays, typenames = {}, []
+    for idx, (typename, weights) in enumerate(modules):
+        typenames.append(typename)
+        for number, weight in enumerate(weights):
+            arrays['{:03d}_{}'.format(idx, number)] = weight
+    np.savez(path, typenames=np.array(typenames), **arrays)
+    return len(typenames)
+
+
+def load_npz(path):
+    """Read modules written by `save_npz`, all arrays are read into memory
+
+    :path (str): path to .npz file
+
+    :return (list of tuple(str, list of arrays)): type of module and its weights
+    """
+    with np.load(path, allow_pickle=False) as data:
+        counts = {}
+        for key in data.files:
+            if key != 'typenames':
+                idx = int(key.split('_')[0])
+                counts[idx] = counts.get(idx, 0) + 1
+        return [
+            (str(_typename), [data['{:03d}_{}'.format(_idx, _n)] for _n in range(counts.get(_idx, 0))])
+            for _idx, _typename in enumerate(data['typenames'])
+        ]
+
+
+def n_classes(modules):
+    """Number of classes of torch model, outputs of its last full convolution
+
+    :modules (list of tuple(str, list of arrays)): converted torch modules
+
+    :return (int): number of classes
+    """
+    for typename, weights in reversed(modules):
+        if TORCH_TYPES.get(typename) == 'Conv2DTranspose':
+            # keras layout of kernel is [h, w, out, in]
+            return weights[0].shape[2]
+    raise ValueError('No full convolution in torch modules, pass --classes')
+
+
+def _keras_type(layer):
+    for layer_type, name in KERAS_TYPES.items():
+        if type(layer) is layer_type:
+            return name
+    return None
+
+
+def _inbound_layers(layer):
+    # attribute is private since keras 2.1.3
+    nodes = getattr(layer, '_inbound_nodes', None) or layer.inbound_nodes
+    return nodes[0].inbound_layers
+
+
+def graph_order(model):
+    """Layers of model in order of forward pass, inputs of every layer are visited in order
+
+    :model (keras.Model): model
+
+    :return (list of keras.layers.Layer): layers, each one after all its inputs
+    """
+    order, visited = [], set()
+    stack = [(_out._keras_history[0], False) for _out in reversed(model.outputs)]
+    while stack:
+        layer, expanded = stack.pop()
+        if expanded:
+            order.append(layer)
+            continue
+        if layer.name in visited:
+            continue
+        visited.add(layer.name)
+        stack.append((layer, True))
+        stack.extend((_l, False) for _l in reversed(_inbound_layers(layer)))
+    return order
+
+
+def match_layers(model, modules):
+    """Match layers of model with torch modules by position in graph
+
+    :model (keras.Model): ENet
+    :modules (list of tuple(str, list of arrays)): converted torch modules
+
+    :return (tuple(list, list)): pairs of layer and index of module or None if type or shapes differ,
+    indices of unused modules
+    """
+    layers = [_l for _l in graph_order(model) if _l.weights]
+    pairs = []
+    for idx, layer in enumerate(layers):
+        match = None
+        if idx < len(modules):
+            typename, weights = modules[idx]
+            shapes = [K.int_shape(_w) for _w in layer.weights]
+            if TORCH_TYPES[typename] == _keras_type(layer) and [_w.shape for _w in weights] == shapes:
+                match = idx
+        pairs.append((layer, match))
+    matched = set(_idx for _, _idx in pairs)
+    return pairs, [_idx for _idx in range(len(modules)) if _idx not in matched]
+
+
+def transfer(model, modules):
+    """Set weights of matched layers
+
+    :model (keras.Model): ENet
+    :modules (list of tuple(str, list of arrays)): converted torch modules
+
+    :return (tuple(list of lists, list)): report rows of layers, indices of unused modules
+    """
+    pairs, unused = match_layers(model, modules)
+    rows, values = [], []
+    for layer, idx in pairs:
+        shapes = ' '.join('x'.join(map(str, _w.shape)) for _w in layer.weights)
+        if idx is None:
+            rows.append([layer.name, type(layer).__name__, shapes, '-', 'mismatch'])
+            continue
+        values.extend(zip(layer.weights, modules[idx][1]))
+        rows.append([layer.name, type(layer).__name__, shapes, '{} {}'.format(idx, modules[idx][0]), 'loaded'])
+    # single session call instead of one per layer
+    K.batch_set_value(values)
+    return rows, unused
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert weights of torch ENet and load them into keras ENet')
+    parser.add_argument('source', help='path to .net file of torch ENet or to converted .npz')
+    parser.add_argument('--npz', default=None, help='path to write converted weights')
+    parser.add_argument('--keras-weights', default=None, help='path to write weights of keras model')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--classes', type=int, default=None,
+                        help='number of classes, outputs of last full convolution of torch model if None')
+    parser.add_argument('--strict', action='store_true',
+                        help='fail if some keras layer is mismatched or some torch module is unused')
+    args = parser.parse_args()
+
+    if args.source.endswith('.npz'):
+        modules = load_npz(args.source)
+    else:
+        modules = list(torch_modules(args.source))
+        if args.npz is not None:
+            save_npz(modules, args.npz)
+
+    from export_tflite import build
+
+    classes = args.classes if args.classes is not None else n_classes(modules)
+    model = build(args.height, args.width, classes, 'max_pool_with_argmax', 'scatter_nd')
+    rows, unused = transfer(model, modules)
+    print('| Layer | Type | Weights | Torch module | Status |')
+    print('|-------|------|---------|--------------|--------|')
+    for row in rows:
+        print('| ' + ' | '.join(row) + ' |')
+    mismatched = sum(_r[-1] == 'mismatch' for _r in rows)
+    print('Loaded {} of {} layers, {} torch modules unused'.format(len(rows) - mismatched, len(rows), len(unused)))
+    for idx in unused:
+        print('Unused torch module {} {}'.format(idx, modules[idx][0]))
+    if args.keras_weights is not None:
+        model.save_weights(args.keras_weights)
+    if args.strict and (mismatched or unused):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
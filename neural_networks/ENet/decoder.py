@@ -6,7 +6,7 @@ from keras.layers.normalization import BatchNormalization
 from pooling_layers import MaxUnpooling2D
 
 
-def bottleneck(encoder, output, upsample=False, reverse_module=False):
+def bottleneck(encoder, output, upsample=False, reverse_module=False, unpooling='scatter_nd'):
     internal = output // 4
 
     x = Conv2D(internal, (1, 1), use_bias=False)(encoder)
@@ -28,7 +28,7 @@ def bottleneck(encoder, output, upsample=False, reverse_module=False):
         other = Conv2D(output, (1, 1), padding='same', use_bias=False)(other)
         other = BatchNormalization(momentum=0.1)(other)
         if upsample and reverse_module is not False:
-            other = MaxUnpooling2D()([other, reverse_module])
+            other = MaxUnpooling2D(method=unpooling)([other, reverse_module])
 
     if upsample and reverse_module is False:
         decoder = x
@@ -41,12 +41,15 @@ def bottleneck(encoder, output, upsample=False, reverse_module=False):
     return decoder
 
 
-def build(encoder, nc):
+def build(encoder, nc, unpooling='scatter_nd'):
+    """
+    :unpooling (str): method of MaxUnpooling2D, 'depth_to_space' for tflite export
+    """
     network, index_stack = encoder
-    enet = bottleneck(network, 64, upsample=True, reverse_module=index_stack.pop())  # bottleneck 4.0
+    enet = bottleneck(network, 64, upsample=True, reverse_module=index_stack.pop(), unpooling=unpooling)  # bottleneck 4.0
     enet = bottleneck(enet, 64)  # bottleneck 4.1
     enet = bottleneck(enet, 64)  # bottleneck 4.2
-    enet = bottleneck(enet, 16, upsample=True, reverse_module=index_stack.pop())  # bottleneck 5.0
+    enet = bottleneck(enet, 16, upsample=True, reverse_module=index_stack.pop(), unpooling=unpooling)  # bottleneck 5.0
     enet = bottleneck(enet, 16)  # bottleneck 5.1
 
     enet = Conv2DTranspose(filters=nc, kernel_size=(2, 2), strides=(2, 2), padding='same')(enet)
@@ -6,14 +6,15 @@ from keras.layers.normalization import BatchNormalization
 from pooling_layers import MaxPoolingWithArgmax2D
 
 
-def initial_block(inp, nb_filter=13, nb_row=3, nb_col=3, strides=(2, 2)):
+def initial_block(inp, nb_filter=13, nb_row=3, nb_col=3, strides=(2, 2), pooling='max_pool_with_argmax'):
     conv = Conv2D(nb_filter, (nb_row, nb_col), padding='same', strides=strides)(inp)
-    max_pool, indices = MaxPoolingWithArgmax2D()(inp)
+    max_pool, indices = MaxPoolingWithArgmax2D(method=pooling)(inp)
     merged = concatenate([conv, max_pool], axis=3)
     return merged, indices
 
 
-def bottleneck(inp, output, internal_scale=4, asymmetric=0, dilated=0, downsample=False, dropout_rate=0.1):
+def bottleneck(inp, output, internal_scale=4, asymmetric=0, dilated=0, downsample=False, dropout_rate=0.1,
+               pooling='max_pool_with_argmax'):
     # main branch
     internal = output // internal_scale
     encoder = inp
@@ -50,7 +51,7 @@ def bottleneck(inp, output, internal_scale=4, asymmetric=0, dilated=0, downsampl
     other = inp
     # other branch
     if downsample:
-        other, indices = MaxPoolingWithArgmax2D()(other)
+        other, indices = MaxPoolingWithArgmax2D(method=pooling)(other)
 
         other = Permute((1, 3, 2))(other)
         pad_feature_maps = output - inp.get_shape().as_list()[3]
@@ -67,18 +68,21 @@ def bottleneck(inp, output, internal_scale=4, asymmetric=0, dilated=0, downsampl
         return encoder
 
 
-def build(inp, dropout_rate=0.01):
+def build(inp, dropout_rate=0.01, pooling='max_pool_with_argmax'):
+    """
+    :pooling (str): method of MaxPoolingWithArgmax2D, 'space_to_depth' for tflite export
+    """
     pooling_indices = []
-    enet, indices_single = initial_block(inp)
+    enet, indices_single = initial_block(inp, pooling=pooling)
     enet = BatchNormalization(momentum=0.1)(enet)  # enet_unpooling uses momentum of 0.1, keras default is 0.99
     enet = PReLU(shared_axes=[1, 2])(enet)
     pooling_indices.append(indices_single)
-    enet, indices_single = bottleneck(enet, 64, downsample=True, dropout_rate=dropout_rate)  # bottleneck 1.0
+    enet, indices_single = bottleneck(enet, 64, downsample=True, dropout_rate=dropout_rate, pooling=pooling)  # bottleneck 1.0
     pooling_indices.append(indices_single)
     for _ in range(4):
         enet = bottleneck(enet, 64, dropout_rate=dropout_rate)  # bottleneck 1.i
     
-    enet, indices_single = bottleneck(enet, 128, downsample=True)  # bottleneck 2.0
+    enet, indices_single = bottleneck(enet, 128, downsample=True, pooling=pooling)  # bottleneck 2.0
     pooling_indices.append(indices_single)
     # bottleneck 2.x and 3.x
     for _ in range(2):
@@ -0,0 +1,155 @@
+"""Export ENet to tflite with builtin operations only
+
+`tf.nn.max_pool_with_argmax` and `tf.scatter_nd` of default ENet layers are not
+supported by tflite, so model is built with 'space_to_depth' pooling and
+'depth_to_space' unpooling, which give the same outputs. Weights are taken from
+keras model, from frozen graph of keras ENet or from converted torch model
+(see convert_weights.py or from_torch.py), e.g.
+
+    python export_tflite.py --frozen ENet_256x256.pb --height 256 --width 256 --output ENet_256x256
+
+writes ENet_256x256.pb and ENet_256x256.tflite and compares outputs of tflite
+model and of keras model with default layers.
+"""
+
+import argparse
+import os
+import sys
+
+import keras.backend as K
+import numpy as np
+import tensorflow as tf
+from keras.layers import Activation, Input
+from keras.models import Model
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import decoder
+import encoder
+from utils import freeze_session
+
+
+def build(height, width, n_classes=21, pooling='space_to_depth', unpooling='depth_to_space'):
+    """ENet same as in ENet.ipynb
+
+    :height (int): height of input, divisible by 8
+    :width (int): width of input, divisible by 8
+    :n_classes (int): number of classes
+    :pooling (str): method of MaxPoolingWithArgmax2D
+    :unpooling (str): method of MaxUnpooling2D
+
+    :return (keras.Model): model with 'image' input and 'output' softmax
+    """
+    inp = Input(shape=(height, width, 3), name='image')
+    enet = encoder.build(inp, pooling=pooling)
+    enet = decoder.build(enet, nc=n_classes, unpooling=unpooling)
+    enet = Activation('softmax', name='output')(enet)
+    return Model(inputs=inp, outputs=enet)
+
+
+def load_frozen(model, path):
+    """Set weights of model from constants of frozen graph of the same keras model
+
+    :model (keras.Model): ENet built in new session, so its layers have the same names
+    :path (str): path to .pb file
+    """
+    graph_def = tf.GraphDef()
+    with open(path, 'rb') as graph_file:
+        graph_def.ParseFromString(graph_file.read())
+    constants = {_n.name: _n for _n in graph_def.node if _n.op == 'Const'}
+    names = [_w.name.split(':')[0] for _w in model.weights]
+    missing = [_name for _name in names if _name not in constants]
+    if missing:
+        raise ValueError('Frozen graph has no weights {}'.format(', '.join(missing)))
+    K.batch_set_value([
+        (_w, tf.make_ndarray(constants[_name].attr['value'].tensor)) for _w, _name in zip(model.weights, names)
+    ])
+
+
+def load_weights(model, keras_weights=None, torch_weights=None, frozen=None):
+    if keras_weights is not None:
+        model.load_weights(keras_weights)
+    elif frozen is not None:
+        load_frozen(model, frozen)
+    elif torch_weights is not None and torch_weights.endswith('.npz'):
+        from convert_weights import load_npz, transfer
+
+        transfer(model, load_npz(torch_weights))
+    elif torch_weights is not None:
+        from from_torch import transfer_weights
+
+        transfer_weights(model, weights=torch_weights)
+    return model
+
+
+def export(model, output_prefix):
+    """Write frozen graph and tflite of model built in default session
+
+    :model (keras.Model): ENet with exportable layers
+    :output_prefix (str): path of output files without extension
+
+    :return (tuple(str, str)): paths of .pb and .tflite files
+    """
+    output_names = [_out.op.name for _out in model.outputs]
+    frozen_graph = freeze_session(K.get_session(), output_names=output_names, quantize=False)
+    pb_path = output_prefix + '.pb'
+    tf.train.write_graph(frozen_graph, os.path.dirname(pb_path) or '.', os.path.basename(pb_path), as_text=False)
+    converter = tf.compat.v1.lite.TFLiteConverter.from_frozen_graph(
+        pb_path, input_arrays=['image'], output_arrays=output_names,
+        input_shapes={'image': [1] + list(model.input_shape[1:])}
+    )
+    tflite_path = output_prefix + '.tflite'
+    with open(tflite_path, 'wb') as model_file:
+        model_file.write(converter.convert())
+    return pb_path, tflite_path
+
+
+def tflite_predict(path, images):
+    interpreter = tf.lite.Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]['index']
+    output_index = interpreter.get_output_details()[0]['index']
+    outputs = []
+    for image in images:
+        interpreter.set_tensor(input_index, image[np.newaxis])
+        interpreter.invoke()
+        outputs.append(interpreter.get_tensor(output_index)[0])
+    return np.array(outputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export ENet to tflite without custom operations')
+    parser.add_argument('--keras', default=None, help='path to weights of keras ENet')
+    parser.add_argument('--torch', default=None, help='path to weights converted by convert_weights.py or from_torch.py')
+    parser.add_argument('--frozen', default=None, help='path to frozen graph of keras ENet, e.g. ENet_256x256.pb')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--classes', type=int, default=21)
+    parser.add_argument('--output', default='ENet_256x256', help='path of output files without extension')
+    parser.add_argument('--samples', type=int, default=2, help='number of random inputs for equivalence check')
+    args = parser.parse_args()
+    if args.keras is None and args.torch is None and args.frozen is None:
+        parser.error('one of --keras, --torch or --frozen is required')
+
+    K.set_learning_phase(0)
+    # inputs are normalized images, as in training
+    images = np.random.normal(size=(args.samples, args.height, args.width, 3)).astype(np.float32)
+    reference = build(args.height, args.width, args.classes, 'max_pool_with_argmax', 'scatter_nd')
+    load_weights(reference, args.keras, args.torch, args.frozen)
+    expected = reference.predict(images)
+
+    K.clear_session()
+    K.set_learning_phase(0)
+    model = load_weights(build(args.height, args.width, args.classes), args.keras, args.torch, args.frozen)
+    actual = model.predict(images)
+    print('Max difference of keras models: {:.2e}'.format(np.max(np.abs(expected - actual))))
+
+    pb_path, tflite_path = export(model, args.output)
+    converted = tflite_predict(tflite_path, images)
+    print('Max difference of tflite model: {:.2e}'.format(np.max(np.abs(expected - converted))))
+    print('\n'.join((pb_path, tflite_path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,92 @@
 from keras import backend as K
 from keras.layers import Layer
 
+POOLING_METHODS = ('max_pool_with_argmax', 'space_to_depth')
+UNPOOLING_METHODS = ('scatter_nd', 'depth_to_space')
+# 'offset' keeps position of maximum inside its window (dy * 2 + dx) as uint8,
+# 'int32' and 'float' keep flat indices of max_pool_with_argmax, float ones are exact only below 2 ** 24
+INDEX_FORMATS = ('offset', 'int32', 'float')
+
+
+def _window_blocks(inputs):
+    # pixel (dy, dx) of every 2x2 window goes to channels of block dy * 2 + dx
+    channels = int(inputs.shape[3])
+    blocks = K.tf.space_to_depth(inputs, 2)
+    return [blocks[:, :, :, _k * channels:(_k + 1) * channels] for _k in range(4)]
+
 
 class MaxPoolingWithArgmax2D(Layer):
-    def __init__(self, pool_size=(2, 2), strides=(2, 2), padding='same', **kwargs):
+    def __init__(self, pool_size=(2, 2), strides=(2, 2), padding='same', method='max_pool_with_argmax',
+                 index_format='offset', **kwargs):
+        """
+        :method (str): 'max_pool_with_argmax' or 'space_to_depth', which gives the same
+        output and indices with tflite builtin operations, but only for 2x2 windows and even input size
+        :index_format (str): one of INDEX_FORMATS, 'offset' is 4 times smaller than 'float'
+        and works only for 2x2 windows with stride 2
+        """
         super(MaxPoolingWithArgmax2D, self).__init__(**kwargs)
+        if method not in POOLING_METHODS:
+            raise ValueError('Unknown pooling method: {}'.format(method))
+        if index_format not in INDEX_FORMATS:
+            raise ValueError('Unknown index format: {}'.format(index_format))
+        if index_format == 'offset' and (tuple(pool_size) != (2, 2) or tuple(strides) != (2, 2)):
+            raise ValueError('offset indices support only 2x2 windows with stride 2')
+        if method == 'space_to_depth' and (tuple(pool_size) != (2, 2) or tuple(strides) != (2, 2)):
+            raise ValueError('space_to_depth pooling supports only 2x2 windows with stride 2')
         self.padding = padding
         self.pool_size = pool_size
         self.strides = strides
+        self.method = method
+        self.index_format = index_format
 
     def call(self, inputs, **kwargs):
         padding = self.padding
         pool_size = self.pool_size
         strides = self.strides
-        if K.backend() == 'tensorflow':
+        if K.backend() != 'tensorflow':
+            errmsg = '{} backend is not supported for layer {}'.format(K.backend(), type(self).__name__)
+            raise NotImplementedError(errmsg)
+        if self.method == 'space_to_depth':
+            output, offset = self._space_to_depth_offset(inputs)
+            if self.index_format == 'offset':
+                return [output, K.cast(offset, 'uint8')]
+            argmax = self._flat_indices(offset)
+        else:
             ksize = [1, pool_size[0], pool_size[1], 1]
             padding = padding.upper()
             strides = [1, strides[0], strides[1], 1]
             output, argmax = K.tf.nn.max_pool_with_argmax(inputs, ksize=ksize, strides=strides, padding=padding)
-        else:
-            errmsg = '{} backend is not supported for layer {}'.format(K.backend(), type(self).__name__)
-            raise NotImplementedError(errmsg)
-        argmax = K.cast(argmax, K.floatx())
+            if self.index_format == 'offset':
+                channels = int(inputs.shape[3])
+                width = K.tf.shape(inputs, out_type='int64')[2]
+                offset = (argmax // (width * channels)) % 2 * 2 + (argmax // channels) % width % 2
+                return [output, K.cast(offset, 'uint8')]
+        argmax = K.cast(argmax, K.floatx() if self.index_format == 'float' else 'int32')
         return [output, argmax]
 
+    @staticmethod
+    def _space_to_depth_offset(inputs):
+        """Max pooling by comparison of window pixels,
+        offset of maximum in window is dy * 2 + dx
+        """
+        pixels = _window_blocks(inputs)
+        output = K.maximum(K.maximum(pixels[0], pixels[1]), K.maximum(pixels[2], pixels[3]))
+        # first maximal pixel in window wins, same as in max_pool_with_argmax:
+        # offset = 0 if p0 is max else 1 if p1 is max else 2 if p2 is max else 3,
+        # arithmetic with scalars instead of nested where, whose full-size constants tflite converter folds into file
+        below = [1 - K.cast(K.equal(_p, output), 'int32') for _p in pixels[:3]]
+        offset = below[0] * (1 + below[1] * (1 + below[2]))
+        return output, offset
+
+    @staticmethod
+    def _flat_indices(offset):
+        # (y * width + x) * channels + c as in tf.nn.max_pool_with_argmax
+        shape = K.tf.shape(offset)
+        rows = K.reshape(K.tf.range(shape[1]), [1, -1, 1, 1]) * 2 + offset // 2
+        cols = K.reshape(K.tf.range(shape[2]), [1, 1, -1, 1]) * 2 + offset % 2
+        features = K.reshape(K.tf.range(shape[3]), [1, 1, 1, -1])
+        return (rows * (shape[2] * 2) + cols) * shape[3] + features
+
     def compute_output_shape(self, input_shape):
         ratio = (1, 2, 2, 1)
         output_shape = [dim // ratio[idx] if dim is not None else None for idx, dim in enumerate(input_shape)]
@@ -33,20 +96,44 @@ class MaxPoolingWithArgmax2D(Layer):
     def compute_mask(self, inputs, mask=None):
         return 2 * [None]
 
+    def get_config(self):
+        config = {
+            'pool_size': self.pool_size, 'strides': self.strides, 'padding': self.padding, 'method': self.method,
+            'index_format': self.index_format
+        }
+        base_config = super(MaxPoolingWithArgmax2D, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
+
 
 class MaxUnpooling2D(Layer):
-    def __init__(self, size=(2, 2), **kwargs):
+    def __init__(self, size=(2, 2), method='scatter_nd', **kwargs):
+        """
+        :method (str): 'scatter_nd' or 'depth_to_space', which places values by comparison
+        masks of window offsets without full-size index tensors and works in tflite, only for 2x2 size
+
+        Format of indices is taken from their type: uint8 are window offsets, other are flat indices
+        """
         super(MaxUnpooling2D, self).__init__(**kwargs)
+        if method not in UNPOOLING_METHODS:
+            raise ValueError('Unknown unpooling method: {}'.format(method))
+        if method == 'depth_to_space' and tuple(size) != (2, 2):
+            raise ValueError('depth_to_space unpooling supports only size 2x2')
         self.size = size
+        self.method = method
 
     def call(self, inputs, output_shape=None):
+        if self.method == 'depth_to_space':
+            return self._depth_to_space_unpool(inputs[0], inputs[1])
+        return self._scatter_unpool(inputs[0], inputs[1], output_shape)
+
+    def _scatter_unpool(self, updates, mask, output_shape=None):
         """
         Seen on https://github.com/tensorflow/tensorflow/issues/2169
         Replace with unpool op when/if issue merged
         Add theano backend
         """
-        updates, mask = inputs[0], inputs[1]
         with K.tf.variable_scope(self.name):
+            offsets = K.dtype(mask) == 'uint8'
             mask = K.cast(mask, 'int32')
             input_shape = K.tf.shape(updates, out_type='int32')
             #  calculation new shape
@@ -59,8 +146,12 @@ class MaxUnpooling2D(Layer):
             batch_shape = K.concatenate([[input_shape[0]], [1], [1], [1]], axis=0)
             batch_range = K.reshape(K.tf.range(output_shape[0], dtype='int32'), shape=batch_shape)
             b = one_like_mask * batch_range
-            y = mask // (output_shape[2] * output_shape[3])
-            x = (mask // output_shape[3]) % output_shape[2]
+            if offsets:
+                y = one_like_mask * K.reshape(K.tf.range(input_shape[1]) * 2, [1, -1, 1, 1]) + mask // 2
+                x = one_like_mask * K.reshape(K.tf.range(input_shape[2]) * 2, [1, 1, -1, 1]) + mask % 2
+            else:
+                y = mask // (output_shape[2] * output_shape[3])
+                x = (mask // output_shape[3]) % output_shape[2]
             feature_range = K.tf.range(output_shape[3], dtype='int32')
             f = one_like_mask * feature_range
 
@@ -71,6 +162,24 @@ class MaxUnpooling2D(Layer):
             ret = K.tf.scatter_nd(indices, values, output_shape)
             return ret
 
+    def _depth_to_space_unpool(self, updates, mask):
+        with K.tf.variable_scope(self.name):
+            if K.dtype(mask) == 'uint8':
+                offset = K.cast(mask, 'int32')
+            else:
+                mask = K.cast(mask, 'int32')
+                channels = int(updates.shape[3])
+                width = K.tf.shape(updates)[2] * 2
+                # offset of maximum inside its 2x2 window, (dy * 2 + dx)
+                offset = (mask // (width * channels)) % 2 * 2 + (mask // channels) % width % 2
+            blocks = [updates * K.cast(K.equal(offset, _k), K.dtype(updates)) for _k in range(4)]
+            return K.tf.depth_to_space(K.concatenate(blocks, axis=3), 2)
+
     def compute_output_shape(self, input_shape):
         mask_shape = input_shape[1]
-        return mask_shape[0], mask_shape[1] * self.size[0], mask_shape[2] * self.size[1], mask_shape[3]
\ No newline at end of file
+        return mask_shape[0], mask_shape[1] * self.size[0], mask_shape[2] * self.size[1], mask_shape[3]
+
+    def get_config(self):
+        config = {'size': self.size, 'method': self.method}
+        base_config = super(MaxUnpooling2D, self).get_config()
+        return dict(list(base_config.items()) + list(config.items()))
@@ -0,0 +1,205 @@
+"""Early-exit inference of IC-Net with auxiliary classifiers
+
+IC-Net trained with `build_bn(..., train=True)` has classifiers of every
+cascade level: 'sub4_out' (1/16 of input), 'sub24_out' (1/8) and 'conv6_cls'
+(1/4). Model is cut into three stages sharing its layers, image leaves the
+cascade at first level where share of confident pixels (maximum probability
+above threshold) reaches required coverage. Otherwise only bounding box of
+uncertain pixels of 'sub24_out' is refined by full resolution branch. Sweep
+of thresholds reports average latency and mIoU:
+
+    python cascade.py 141_epochs_fine_tuning.h5 /data/VOC2012 --thresholds 0.5 0.7 0.9 1.0 --coverage 0.95
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from os.path import join
+
+import cv2
+import keras.backend as K
+import numpy as np
+from keras.layers import Input
+from keras.models import Model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from metrics import ConfusionMatrix
+from model import build_bn
+from pascal_voc_data import PascalVocGenerator
+
+EXITS = ('sub4', 'sub24', 'refined')
+# input of full resolution branch is aligned to its total stride
+ALIGNMENT = 32
+
+
+def _inbound_layers(layer):
+    # attribute is private since keras 2.1.3
+    nodes = getattr(layer, '_inbound_nodes', None) or layer.inbound_nodes
+    return nodes[0].inbound_layers
+
+
+def submodel(model, inputs, outputs, dynamic=False):
+    """Part of model between given layers, layers are shared with model
+
+    :model (keras.Model): source model
+    :inputs (list of str): names of layers whose outputs become inputs of submodel
+    :outputs (list of str): names of layers whose outputs become outputs of submodel
+    :dynamic (bool): inputs of any height and width
+
+    :return (keras.Model): submodel
+    """
+    tensors = {}
+    for name in inputs:
+        shape = K.int_shape(model.get_layer(name).output)[1:]
+        if dynamic:
+            shape = (None, None) + shape[2:]
+        tensors[name] = Input(shape=shape, name=name.replace('/', '_') + '_input')
+    new_inputs = [tensors[_name] for _name in inputs]
+    # only layers between inputs and outputs are applied
+    required, stack = set(), list(outputs)
+    while stack:
+        name = stack.pop()
+        if name not in required and name not in tensors:
+            required.add(name)
+            stack.extend(_l.name for _l in _inbound_layers(model.get_layer(name)))
+    for layer in model.layers:
+        if layer.name in required:
+            args = [tensors[_l.name] for _l in _inbound_layers(layer)]
+            tensors[layer.name] = layer(args[0] if len(args) == 1 else args)
+    return Model(inputs=new_inputs, outputs=[tensors[_name] for _name in outputs])
+
+
+class CascadePredictor:
+    """IC-Net inference which stops at first confident classifier"""
+
+    def __init__(self, model, threshold=0.9, coverage=0.95, margin=1):
+        """
+        :model (keras.Model): IC-Net built by `build_bn` with train=True
+        :threshold (float): pixel is confident if its maximum probability is not less than threshold
+        :coverage (float): share of confident pixels required to exit
+        :margin (int): number of aligned blocks added around uncertain region before refinement
+        """
+        self.threshold = threshold
+        self.coverage = coverage
+        self.margin = margin
+        self.sub4 = submodel(model, ['image'], ['sub4_out', 'conv5_4_interp', 'conv3_1/relu'])
+        self.sub24 = submodel(model, ['conv5_4_interp', 'conv3_1/relu'], ['sub24_out', 'conv_sub2_bn'])
+        self.full = submodel(model, ['image', 'conv_sub2_bn'], ['conv6_cls'], dynamic=True)
+        self.exits = dict.fromkeys(EXITS, 0)
+
+    def _confident(self, probs):
+        return np.mean(probs.max(axis=-1) >= self.threshold) >= self.coverage
+
+    def _uncertain_box(self, probs, height, width):
+        # bounding box of uncertain pixels in input coordinates aligned to ALIGNMENT
+        rows, cols = np.nonzero(probs.max(axis=-1) < self.threshold)
+        scale = height // probs.shape[0]
+        top, left = [max(0, _c.min() * scale // ALIGNMENT - self.margin) * ALIGNMENT for _c in (rows, cols)]
+        bottom, right = [
+            min(_size, (-(-(_c.max() + 1) * scale // ALIGNMENT) + self.margin) * ALIGNMENT)
+            for _c, _size in ((rows, height), (cols, width))
+        ]
+        return top, left, bottom, right
+
+    def predict(self, image):
+        """Labels of single image
+
+        :image (array [H, W, 3]): RGB image in [0, 255], H and W are divisible by 32
+
+        :return (tuple(array [H, W], str)): uint8 labels and name of exit, one of EXITS
+        """
+        height, width = image.shape[:2]
+        batch = image[np.newaxis].astype(np.float32)
+        sub4_probs, context, shared = self.sub4.predict(batch)
+        if self._confident(sub4_probs[0]):
+            self.exits['sub4'] += 1
+            return self._upsampled_labels(sub4_probs[0], height, width), 'sub4'
+        sub24_probs, features = self.sub24.predict([context, shared])
+        probs = cv2.resize(sub24_probs[0], (width, height), interpolation=cv2.INTER_LINEAR)
+        if self._confident(sub24_probs[0]):
+            self.exits['sub24'] += 1
+            return probs.argmax(axis=-1).astype(np.uint8), 'sub24'
+
+        top, left, bottom, right = self._uncertain_box(sub24_probs[0], height, width)
+        scale = height // features.shape[1]
+        crop = self.full.predict([
+            batch[:, top:bottom, left:right], features[:, top // scale:bottom // scale, left // scale:right // scale]
+        ])[0]
+        probs[top:bottom, left:right] = cv2.resize(crop, (right - left, bottom - top), interpolation=cv2.INTER_LINEAR)
+        self.exits['refined'] += 1
+        return probs.argmax(axis=-1).astype(np.uint8), 'refined'
+
+    @staticmethod
+    def _upsampled_labels(probs, height, width):
+        return cv2.resize(probs, (width, height), interpolation=cv2.INTER_LINEAR).argmax(axis=-1).astype(np.uint8)
+
+
+def sweep(model, generator, thresholds, coverage=0.95, n_classes=21):
+    """Average latency and mIoU of cascade for each threshold
+
+    :model (keras.Model): IC-Net built with train=True
+    :generator (PascalVocGenerator): sparse validation batches of size 1
+    :thresholds (list of float): confidence thresholds, threshold above 1 always refines
+    :coverage (float): share of confident pixels required to exit
+    :n_classes (int): number of classes
+
+    :return (list of dict): threshold, latency in ms, mIoU and share of each exit
+    """
+    predictor = CascadePredictor(model, 2., coverage)
+    # first call builds predict functions of all stages
+    predictor.predict(generator[0][0][0])
+    rows = []
+    for threshold in thresholds:
+        predictor.threshold, predictor.exits = threshold, dict.fromkeys(EXITS, 0)
+        confusion, elapsed = ConfusionMatrix(n_classes), 0.
+        for idx in range(len(generator)):
+            images, labels = generator[idx]
+            start = time.perf_counter()
+            pred, _ = predictor.predict(images[0])
+            elapsed += time.perf_counter() - start
+            confusion.update(labels[..., 0], pred[np.newaxis])
+        row = {'threshold': threshold, 'latency_ms': elapsed / len(generator) * 1000, 'mean_iou': confusion.mean_iou}
+        row.update({_exit: _count / len(generator) for _exit, _count in predictor.exits.items()})
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Early-exit cascade inference of IC-Net')
+    parser.add_argument('weights', help='path to weights of IC-Net trained with auxiliary outputs')
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.5, 0.7, 0.8, 0.9, 0.95, 2.])
+    parser.add_argument('--coverage', type=float, default=0.95)
+    parser.add_argument('--eval-samples', type=int, default=300, help='number of validation images, 0 for all')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random validation images')
+    parser.add_argument('--json', default=None, help='file to write sweep into')
+    args = parser.parse_args()
+
+    K.set_learning_phase(0)
+    model = build_bn(args.width, args.height, len(PascalVocGenerator.classes), weights_path=args.weights, train=True)
+    generator = PascalVocGenerator(
+        join(args.voc_path, 'ImageSets', 'Segmentation', 'val.txt'),
+        join(args.voc_path, 'JPEGImages'),
+        join(args.voc_path, 'SegmentationClass'),
+        1, (args.width, args.height), target='sparse'
+    )
+    generator.subsample(args.eval_samples, args.seed)
+    rows = sweep(model, generator, args.thresholds, args.coverage)
+
+    print('| Threshold | Latency (ms) | mIoU  | sub4 | sub24 | refined |')
+    print('|-----------|--------------|-------|------|-------|---------|')
+    for row in rows:
+        print('| {threshold:9.2f} | {latency_ms:12.2f} | {mean_iou:.3f} | {sub4:4.2f} | {sub24:5.2f} | '
+              '{refined:7.2f} |'.format(**row))
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
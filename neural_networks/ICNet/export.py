@@ -0,0 +1,101 @@
+"""Export IC-Net at several input resolutions from one weight file
+
+Weights of IC-Net do not depend on input size, so one trained model gives
+family of frozen graphs or tflite files, e.g.
+
+    python export.py 141_epochs_fine_tuning.h5 --sizes 256x256 384x384 512x512 --dynamic --tflite
+
+writes ICNet_256x256.pb, ICNet_384x384.pb, ICNet_512x512.pb, ICNet_dynamic.pb (any size
+divisible by 32) and tflite files of fixed sizes. Output of every model is
+'predictions/ResizeBilinear' of input size, same as in ICNet.ipynb.
+"""
+
+import argparse
+import os
+import sys
+
+import keras.backend as K
+import tensorflow as tf
+from keras.layers import Lambda
+from keras.models import Model
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from model import build_bn, interp
+from utils import freeze_session
+
+
+def build_predictor(weights_path, height=None, width=None, n_classes=21):
+    """IC-Net with output upsampled to input size
+
+    :weights_path (str): path to weights or to saved model
+    :height (int): height of input, None for dynamic
+    :width (int): width of input, None for dynamic
+    :n_classes (int): number of classes
+
+    :return (keras.Model): model
+    """
+    model = build_bn(width, height, n_classes, weights_path=weights_path)
+    upsample = Lambda(lambda x: interp(x, 4), name='predictions')(model.output)
+    return Model(inputs=model.input, outputs=[upsample])
+
+
+def export(weights_path, height, width, output_prefix, tflite=False, n_classes=21):
+    """Write frozen graph and optionally tflite of IC-Net of given size
+
+    :weights_path (str): path to weights or to saved model
+    :height (int): height of input, None for dynamic
+    :width (int): width of input, None for dynamic
+    :output_prefix (str): path of output files without extension
+    :tflite (bool): convert frozen graph to tflite, only for fixed size
+    :n_classes (int): number of classes
+
+    :return (list of str): paths of written files
+    """
+    K.clear_session()
+    K.set_learning_phase(0)
+    model = build_predictor(weights_path, height, width, n_classes)
+    output_names = [_out.op.name for _out in model.outputs]
+    frozen_graph = freeze_session(K.get_session(), output_names=output_names, quantize=False)
+    pb_path = output_prefix + '.pb'
+    tf.train.write_graph(frozen_graph, os.path.dirname(pb_path) or '.', os.path.basename(pb_path), as_text=False)
+    paths = [pb_path]
+    if tflite and height is not None and width is not None:
+        converter = tf.compat.v1.lite.TFLiteConverter.from_frozen_graph(
+            pb_path, input_arrays=['image'], output_arrays=output_names,
+            input_shapes={'image': (1, height, width, 3)}
+        )
+        paths.append(output_prefix + '.tflite')
+        with open(paths[-1], 'wb') as model_file:
+            model_file.write(converter.convert())
+    return paths
+
+
+def parse_size(size):
+    height, width = size.lower().split('x')
+    height, width = int(height), int(width)
+    if height % 32 or width % 32:
+        raise argparse.ArgumentTypeError('Size {} is not divisible by 32'.format(size))
+    return height, width
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export IC-Net at several resolutions')
+    parser.add_argument('weights', help='path to weights or saved model')
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(256, 256)], help='HEIGHTxWIDTH')
+    parser.add_argument('--dynamic', action='store_true', help='export also model with dynamic input size')
+    parser.add_argument('--tflite', action='store_true', help='convert models of fixed size to tflite')
+    parser.add_argument('--classes', type=int, default=21)
+    parser.add_argument('--output-dir', default='.')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    sizes = list(args.sizes) + ([(None, None)] if args.dynamic else [])
+    for height, width in sizes:
+        name = 'ICNet_dynamic' if height is None else 'ICNet_{}x{}'.format(height, width)
+        paths = export(args.weights, height, width, os.path.join(args.output_dir, name), args.tflite, args.classes)
+        print('\n'.join(paths))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,234 +14,300 @@ from keras.layers import Dense, UpSampling2D
 import keras.backend as K
 import tensorflow as tf
 
-def build_bn(width, height, n_classes, weights_path=None, train=False):
+
+def interp(x, factor):
+    """Bilinear resize of feature map, static size is used when it is known
+
+    :x (tensor [N, H, W, C]): feature map
+    :factor (float): scale of height and width, e.g. 2 or 0.5
+
+    :return (tensor [N, H * factor, W * factor, C]): resized feature map
+    """
+    if x.shape[1:3].is_fully_defined():
+        size = (int(int(x.shape[1]) * factor), int(int(x.shape[2]) * factor))
+    else:
+        size = tf.cast(tf.cast(tf.shape(x)[1:3], tf.float32) * factor, tf.int32)
+    return tf.image.resize_bilinear(x, size=size)
+
+
+def pyramid_pooling(y, bins, name):
+    """Average pooling of feature map into grid and bilinear upsampling back
+
+    :y (tensor [N, H, W, C]): feature map
+    :bins (int): pooling window is 1 / bins of feature map
+    :name (str): name of pooling layer, upsampling layer gets '_interp' suffix
+
+    :return (tensor [N, H, W, C]): pooled feature map
+    """
+    h, w = y.shape[1:3].as_list()
+    if h is not None and w is not None:
+        pool = AveragePooling2D(pool_size=(h/bins,w/bins), strides=(h//bins,w//bins), name=name)(y)
+        return Lambda(lambda x: tf.image.resize_bilinear(x, size=(h,w)), name=name + '_interp')(pool)
+
+    def grid(x):
+        # same grid as valid pooling with window and stride size // bins, area resize averages
+        # windows exactly when size is divisible by it and approximately otherwise
+        size = tf.shape(x)[1:3]
+        window = tf.maximum(size // bins, 1)
+        return tf.image.resize_area(x, size // window)
+
+    pool = Lambda(grid, name=name)(y)
+    return Lambda(lambda x: tf.image.resize_bilinear(x[0], size=tf.shape(x[1])[1:3]), name=name + '_interp')([pool, y])
+
+
+def stage(name):
+    """Stage of convolution for width multipliers
+
+    :name (str): name of layer
+
+    :return (str): 'conv1' - 'conv5' for layers of heavy branch and 'head' for cascade layers
+    """
+    return 'head' if 'sub' in name else name.split('_')[0]
+
+
+def build_bn(width, height, n_classes, weights_path=None, train=False, width_multiplier=1., filters=None):
+    """Build IC-Net with batch normalization
+
+    :width (int): width of input, None for any width
+    :height (int): height of input, None for any height
+    :n_classes (int): number of classes
+    :weights_path (str): path to weights, they do not depend on input size
+    :train (bool): add auxiliary outputs of lower resolutions
+    :width_multiplier (float or dict): multiplier of number of channels of all convolutions
+    or of each stage, e.g. {'conv5': 0.5}, see `stage`
+    :filters (dict): exact number of channels of convolutions by name, e.g. produced by pruning,
+    it overrides width_multiplier
+
+    :return (keras.Model): model, input size should be divisible by 32
+    """
+    def ch(channels, name):
+        if filters is not None and name in filters:
+            return filters[name]
+        multiplier = width_multiplier.get(stage(name), 1.) if isinstance(width_multiplier, dict) else width_multiplier
+        return max(1, int(round(channels * multiplier)))
+
     inp = Input(shape=(height, width, 3), name='image')
     x = Lambda(lambda x: (x - 127.5)/255.0)(inp)
 
     # (1/2)
-    y = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])//2, int(x.shape[2])//2)), name='data_sub2')(x)
-    y = Conv2D(32, 3, strides=2, padding='same', activation='relu', name='conv1_1_3x3_s2')(y)
+    y = Lambda(lambda x: interp(x, 0.5), name='data_sub2')(x)
+    y = Conv2D(ch(32, 'conv1_1_3x3_s2'), 3, strides=2, padding='same', activation='relu', name='conv1_1_3x3_s2')(y)
     y = BatchNormalization(name='conv1_1_3x3_s2_bn')(y)
-    y = Conv2D(32, 3, padding='same', activation='relu', name='conv1_2_3x3')(y)
+    y = Conv2D(ch(32, 'conv1_2_3x3'), 3, padding='same', activation='relu', name='conv1_2_3x3')(y)
     y = BatchNormalization(name='conv1_2_3x3_s2_bn')(y)
-    y = Conv2D(64, 3, padding='same', activation='relu', name='conv1_3_3x3')(y)
+    y = Conv2D(ch(64, 'conv1_3_3x3'), 3, padding='same', activation='relu', name='conv1_3_3x3')(y)
     y = BatchNormalization(name='conv1_3_3x3_bn')(y)
     y_ = MaxPooling2D(pool_size=3, strides=2, name='pool1_3x3_s2')(y)
     
-    y = Conv2D(128, 1, name='conv2_1_1x1_proj')(y_)
+    y = Conv2D(ch(128, 'conv2_1_1x1_proj'), 1, name='conv2_1_1x1_proj')(y_)
     y = BatchNormalization(name='conv2_1_1x1_proj_bn')(y)
-    y_ = Conv2D(32, 1, activation='relu', name='conv2_1_1x1_reduce')(y_)
+    y_ = Conv2D(ch(32, 'conv2_1_1x1_reduce'), 1, activation='relu', name='conv2_1_1x1_reduce')(y_)
     y_ = BatchNormalization(name='conv2_1_1x1_reduce_bn')(y_)
     y_ = ZeroPadding2D(name='padding1')(y_)
-    y_ = Conv2D(32, 3, activation='relu', name='conv2_1_3x3')(y_)
+    y_ = Conv2D(ch(32, 'conv2_1_3x3'), 3, activation='relu', name='conv2_1_3x3')(y_)
     y_ = BatchNormalization(name='conv2_1_3x3_bn')(y_)
-    y_ = Conv2D(128, 1, name='conv2_1_1x1_increase')(y_)
+    y_ = Conv2D(ch(128, 'conv2_1_1x1_increase'), 1, name='conv2_1_1x1_increase')(y_)
     y_ = BatchNormalization(name='conv2_1_1x1_increase_bn')(y_)
     y = Add(name='conv2_1')([y,y_])
     y_ = Activation('relu', name='conv2_1/relu')(y)
 
-    y = Conv2D(32, 1, activation='relu', name='conv2_2_1x1_reduce')(y_)
+    y = Conv2D(ch(32, 'conv2_2_1x1_reduce'), 1, activation='relu', name='conv2_2_1x1_reduce')(y_)
     y = BatchNormalization(name='conv2_2_1x1_reduce_bn')(y)
     y = ZeroPadding2D(name='padding2')(y)
-    y = Conv2D(32, 3, activation='relu', name='conv2_2_3x3')(y)
+    y = Conv2D(ch(32, 'conv2_2_3x3'), 3, activation='relu', name='conv2_2_3x3')(y)
     y = BatchNormalization(name='conv2_2_3x3_bn')(y)
-    y = Conv2D(128, 1, name='conv2_2_1x1_increase')(y)
+    y = Conv2D(ch(128, 'conv2_2_1x1_increase'), 1, name='conv2_2_1x1_increase')(y)
     y = BatchNormalization(name='conv2_2_1x1_increase_bn')(y)
     y = Add(name='conv2_2')([y,y_])
     y_ = Activation('relu', name='conv2_2/relu')(y)
 
-    y = Conv2D(32, 1, activation='relu', name='conv2_3_1x1_reduce')(y_)
+    y = Conv2D(ch(32, 'conv2_3_1x1_reduce'), 1, activation='relu', name='conv2_3_1x1_reduce')(y_)
     y = BatchNormalization(name='conv2_3_1x1_reduce_bn')(y)
     y = ZeroPadding2D(name='padding3')(y)
-    y = Conv2D(32, 3, activation='relu', name='conv2_3_3x3')(y)
+    y = Conv2D(ch(32, 'conv2_3_3x3'), 3, activation='relu', name='conv2_3_3x3')(y)
     y = BatchNormalization(name='conv2_3_3x3_bn')(y)
-    y = Conv2D(128, 1, name='conv2_3_1x1_increase')(y)
+    y = Conv2D(ch(128, 'conv2_3_1x1_increase'), 1, name='conv2_3_1x1_increase')(y)
     y = BatchNormalization(name='conv2_3_1x1_increase_bn')(y)
     y = Add(name='conv2_3')([y,y_])
     y_ = Activation('relu', name='conv2_3/relu')(y)
 
-    y = Conv2D(256, 1, strides=2, name='conv3_1_1x1_proj')(y_)
+    y = Conv2D(ch(256, 'conv3_1_1x1_proj'), 1, strides=2, name='conv3_1_1x1_proj')(y_)
     y = BatchNormalization(name='conv3_1_1x1_proj_bn')(y)
-    y_ = Conv2D(64, 1, strides=2, activation='relu', name='conv3_1_1x1_reduce')(y_)
+    y_ = Conv2D(ch(64, 'conv3_1_1x1_reduce'), 1, strides=2, activation='relu', name='conv3_1_1x1_reduce')(y_)
     y_ = BatchNormalization(name='conv3_1_1x1_reduce_bn')(y_) 
     y_ = ZeroPadding2D(name='padding4')(y_)
-    y_ = Conv2D(64, 3, activation='relu', name='conv3_1_3x3')(y_)
+    y_ = Conv2D(ch(64, 'conv3_1_3x3'), 3, activation='relu', name='conv3_1_3x3')(y_)
     y_ = BatchNormalization(name='conv3_1_3x3_bn')(y_)
-    y_ = Conv2D(256, 1, name='conv3_1_1x1_increase')(y_)
+    y_ = Conv2D(ch(256, 'conv3_1_1x1_increase'), 1, name='conv3_1_1x1_increase')(y_)
     y_ = BatchNormalization(name='conv3_1_1x1_increase_bn')(y_)
     y = Add(name='conv3_1')([y,y_])
     z = Activation('relu', name='conv3_1/relu')(y)
 
     # (1/4)
-    y_ = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])//2, int(x.shape[2])//2)), name='conv3_1_sub4')(z)
-    y = Conv2D(64, 1, activation='relu', name='conv3_2_1x1_reduce')(y_)
+    y_ = Lambda(lambda x: interp(x, 0.5), name='conv3_1_sub4')(z)
+    y = Conv2D(ch(64, 'conv3_2_1x1_reduce'), 1, activation='relu', name='conv3_2_1x1_reduce')(y_)
     y = BatchNormalization(name='conv3_2_1x1_reduce_bn')(y)
     y = ZeroPadding2D(name='padding5')(y)
-    y = Conv2D(64, 3, activation='relu', name='conv3_2_3x3')(y)
+    y = Conv2D(ch(64, 'conv3_2_3x3'), 3, activation='relu', name='conv3_2_3x3')(y)
     y = BatchNormalization(name='conv3_2_3x3_bn')(y)
-    y = Conv2D(256, 1, name='conv3_2_1x1_increase')(y)
+    y = Conv2D(ch(256, 'conv3_2_1x1_increase'), 1, name='conv3_2_1x1_increase')(y)
     y = BatchNormalization(name='conv3_2_1x1_increase_bn')(y)
     y = Add(name='conv3_2')([y,y_])
     y_ = Activation('relu', name='conv3_2/relu')(y)
 
-    y = Conv2D(64, 1, activation='relu', name='conv3_3_1x1_reduce')(y_)
+    y = Conv2D(ch(64, 'conv3_3_1x1_reduce'), 1, activation='relu', name='conv3_3_1x1_reduce')(y_)
     y = BatchNormalization(name='conv3_3_1x1_reduce_bn')(y)
     y = ZeroPadding2D(name='padding6')(y)
-    y = Conv2D(64, 3, activation='relu', name='conv3_3_3x3')(y)
+    y = Conv2D(ch(64, 'conv3_3_3x3'), 3, activation='relu', name='conv3_3_3x3')(y)
     y = BatchNormalization(name='conv3_3_3x3_bn')(y)
-    y = Conv2D(256, 1, name='conv3_3_1x1_increase')(y)
+    y = Conv2D(ch(256, 'conv3_3_1x1_increase'), 1, name='conv3_3_1x1_increase')(y)
     y = BatchNormalization(name='conv3_3_1x1_increase_bn')(y)
     y = Add(name='conv3_3')([y,y_])
     y_ = Activation('relu', name='conv3_3/relu')(y)
 
-    y = Conv2D(64, 1, activation='relu', name='conv3_4_1x1_reduce')(y_)
+    y = Conv2D(ch(64, 'conv3_4_1x1_reduce'), 1, activation='relu', name='conv3_4_1x1_reduce')(y_)
     y = BatchNormalization(name='conv3_4_1x1_reduce_bn')(y)
     y = ZeroPadding2D(name='padding7')(y)
-    y = Conv2D(64, 3, activation='relu', name='conv3_4_3x3')(y)
+    y = Conv2D(ch(64, 'conv3_4_3x3'), 3, activation='relu', name='conv3_4_3x3')(y)
     y = BatchNormalization(name='conv3_4_3x3_bn')(y)
-    y = Conv2D(256, 1, name='conv3_4_1x1_increase')(y)
+    y = Conv2D(ch(256, 'conv3_4_1x1_increase'), 1, name='conv3_4_1x1_increase')(y)
     y = BatchNormalization(name='conv3_4_1x1_increase_bn')(y)
     y = Add(name='conv3_4')([y,y_])
     y_ = Activation('relu', name='conv3_4/relu')(y)
 
-    y = Conv2D(512, 1, name='conv4_1_1x1_proj')(y_)
+    y = Conv2D(ch(512, 'conv4_1_1x1_proj'), 1, name='conv4_1_1x1_proj')(y_)
     y = BatchNormalization(name='conv4_1_1x1_proj_bn')(y)
-    y_ = Conv2D(128, 1, activation='relu', name='conv4_1_1x1_reduce')(y_)
+    y_ = Conv2D(ch(128, 'conv4_1_1x1_reduce'), 1, activation='relu', name='conv4_1_1x1_reduce')(y_)
     y_ = BatchNormalization(name='conv4_1_1x1_reduce_bn')(y_)
     y_ = ZeroPadding2D(padding=2, name='padding8')(y_)
-    y_ = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_1_3x3')(y_)
+    y_ = Conv2D(ch(128, 'conv4_1_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_1_3x3')(y_)
     y_ = BatchNormalization(name='conv4_1_3x3_bn')(y_)
-    y_ = Conv2D(512, 1, name='conv4_1_1x1_increase')(y_)
+    y_ = Conv2D(ch(512, 'conv4_1_1x1_increase'), 1, name='conv4_1_1x1_increase')(y_)
     y_ = BatchNormalization(name='conv4_1_1x1_increase_bn')(y_)
     y = Add(name='conv4_1')([y,y_])
     y_ = Activation('relu', name='conv4_1/relu')(y)
 
-    y = Conv2D(128, 1, activation='relu', name='conv4_2_1x1_reduce')(y_)
+    y = Conv2D(ch(128, 'conv4_2_1x1_reduce'), 1, activation='relu', name='conv4_2_1x1_reduce')(y_)
     y = BatchNormalization(name='conv4_2_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=2, name='padding9')(y)
-    y = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_2_3x3')(y)
+    y = Conv2D(ch(128, 'conv4_2_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_2_3x3')(y)
     y = BatchNormalization(name='conv4_2_3x3_bn')(y)
-    y = Conv2D(512, 1, name='conv4_2_1x1_increase')(y)
+    y = Conv2D(ch(512, 'conv4_2_1x1_increase'), 1, name='conv4_2_1x1_increase')(y)
     y = BatchNormalization(name='conv4_2_1x1_increase_bn')(y)
     y = Add(name='conv4_2')([y,y_])
     y_ = Activation('relu', name='conv4_2/relu')(y)
 
-    y = Conv2D(128, 1, activation='relu', name='conv4_3_1x1_reduce')(y_)
+    y = Conv2D(ch(128, 'conv4_3_1x1_reduce'), 1, activation='relu', name='conv4_3_1x1_reduce')(y_)
     y = BatchNormalization(name='conv4_3_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=2, name='padding10')(y)
-    y = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_3_3x3')(y)
+    y = Conv2D(ch(128, 'conv4_3_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_3_3x3')(y)
     y = BatchNormalization(name='conv4_3_3x3_bn')(y)
-    y = Conv2D(512, 1, name='conv4_3_1x1_increase')(y)
+    y = Conv2D(ch(512, 'conv4_3_1x1_increase'), 1, name='conv4_3_1x1_increase')(y)
     y = BatchNormalization(name='conv4_3_1x1_increase_bn')(y)
     y = Add(name='conv4_3')([y,y_])
     y_ = Activation('relu', name='conv4_3/relu')(y)
 
-    y = Conv2D(128, 1, activation='relu', name='conv4_4_1x1_reduce')(y_)
+    y = Conv2D(ch(128, 'conv4_4_1x1_reduce'), 1, activation='relu', name='conv4_4_1x1_reduce')(y_)
     y = BatchNormalization(name='conv4_4_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=2, name='padding11')(y)
-    y = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_4_3x3')(y)
+    y = Conv2D(ch(128, 'conv4_4_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_4_3x3')(y)
     y = BatchNormalization(name='conv4_4_3x3_bn')(y)
-    y = Conv2D(512, 1, name='conv4_4_1x1_increase')(y)
+    y = Conv2D(ch(512, 'conv4_4_1x1_increase'), 1, name='conv4_4_1x1_increase')(y)
     y = BatchNormalization(name='conv4_4_1x1_increase_bn')(y)
     y = Add(name='conv4_4')([y,y_])
     y_ = Activation('relu', name='conv4_4/relu')(y)
 
-    y = Conv2D(128, 1, activation='relu', name='conv4_5_1x1_reduce')(y_)
+    y = Conv2D(ch(128, 'conv4_5_1x1_reduce'), 1, activation='relu', name='conv4_5_1x1_reduce')(y_)
     y = BatchNormalization(name='conv4_5_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=2, name='padding12')(y)
-    y = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_5_3x3')(y)
+    y = Conv2D(ch(128, 'conv4_5_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_5_3x3')(y)
     y = BatchNormalization(name='conv4_5_3x3_bn')(y)
-    y = Conv2D(512, 1, name='conv4_5_1x1_increase')(y)
+    y = Conv2D(ch(512, 'conv4_5_1x1_increase'), 1, name='conv4_5_1x1_increase')(y)
     y = BatchNormalization(name='conv4_5_1x1_increase_bn')(y)
     y = Add(name='conv4_5')([y,y_])
     y_ = Activation('relu', name='conv4_5/relu')(y)
 
-    y = Conv2D(128, 1, activation='relu', name='conv4_6_1x1_reduce')(y_)
+    y = Conv2D(ch(128, 'conv4_6_1x1_reduce'), 1, activation='relu', name='conv4_6_1x1_reduce')(y_)
     y = BatchNormalization(name='conv4_6_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=2, name='padding13')(y)
-    y = Conv2D(128, 3, dilation_rate=2, activation='relu', name='conv4_6_3x3')(y)
+    y = Conv2D(ch(128, 'conv4_6_3x3'), 3, dilation_rate=2, activation='relu', name='conv4_6_3x3')(y)
     y = BatchNormalization(name='conv4_6_3x3_bn')(y)
-    y = Conv2D(512, 1, name='conv4_6_1x1_increase')(y)
+    y = Conv2D(ch(512, 'conv4_6_1x1_increase'), 1, name='conv4_6_1x1_increase')(y)
     y = BatchNormalization(name='conv4_6_1x1_increase_bn')(y)
     y = Add(name='conv4_6')([y,y_])
     y = Activation('relu', name='conv4_6/relu')(y)
 
-    y_ = Conv2D(1024, 1, name='conv5_1_1x1_proj')(y)
+    y_ = Conv2D(ch(1024, 'conv5_1_1x1_proj'), 1, name='conv5_1_1x1_proj')(y)
     y_ = BatchNormalization(name='conv5_1_1x1_proj_bn')(y_)
-    y = Conv2D(256, 1, activation='relu', name='conv5_1_1x1_reduce')(y)
+    y = Conv2D(ch(256, 'conv5_1_1x1_reduce'), 1, activation='relu', name='conv5_1_1x1_reduce')(y)
     y = BatchNormalization(name='conv5_1_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=4, name='padding14')(y)
-    y = Conv2D(256, 3, dilation_rate=4, activation='relu', name='conv5_1_3x3')(y)
+    y = Conv2D(ch(256, 'conv5_1_3x3'), 3, dilation_rate=4, activation='relu', name='conv5_1_3x3')(y)
     y = BatchNormalization(name='conv5_1_3x3_bn')(y)
-    y = Conv2D(1024, 1, name='conv5_1_1x1_increase')(y)
+    y = Conv2D(ch(1024, 'conv5_1_1x1_increase'), 1, name='conv5_1_1x1_increase')(y)
     y = BatchNormalization(name='conv5_1_1x1_increase_bn')(y)
     y = Add(name='conv5_1')([y,y_])
     y_ = Activation('relu', name='conv5_1/relu')(y)
 
-    y = Conv2D(256, 1, activation='relu', name='conv5_2_1x1_reduce')(y_)
+    y = Conv2D(ch(256, 'conv5_2_1x1_reduce'), 1, activation='relu', name='conv5_2_1x1_reduce')(y_)
     y = BatchNormalization(name='conv5_2_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=4, name='padding15')(y)
-    y = Conv2D(256, 3, dilation_rate=4, activation='relu', name='conv5_2_3x3')(y)
+    y = Conv2D(ch(256, 'conv5_2_3x3'), 3, dilation_rate=4, activation='relu', name='conv5_2_3x3')(y)
     y = BatchNormalization(name='conv5_2_3x3_bn')(y)
-    y = Conv2D(1024, 1, name='conv5_2_1x1_increase')(y)
+    y = Conv2D(ch(1024, 'conv5_2_1x1_increase'), 1, name='conv5_2_1x1_increase')(y)
     y = BatchNormalization(name='conv5_2_1x1_increase_bn')(y)
     y = Add(name='conv5_2')([y,y_])
     y_ = Activation('relu', name='conv5_2/relu')(y)
 
-    y = Conv2D(256, 1, activation='relu', name='conv5_3_1x1_reduce')(y_)
+    y = Conv2D(ch(256, 'conv5_3_1x1_reduce'), 1, activation='relu', name='conv5_3_1x1_reduce')(y_)
     y = BatchNormalization(name='conv5_3_1x1_reduce_bn')(y)
     y = ZeroPadding2D(padding=4, name='padding16')(y)
-    y = Conv2D(256, 3, dilation_rate=4, activation='relu', name='conv5_3_3x3')(y)
+    y = Conv2D(ch(256, 'conv5_3_3x3'), 3, dilation_rate=4, activation='relu', name='conv5_3_3x3')(y)
     y = BatchNormalization(name='conv5_3_3x3_bn')(y)
-    y = Conv2D(1024, 1, name='conv5_3_1x1_increase')(y)
+    y = Conv2D(ch(1024, 'conv5_3_1x1_increase'), 1, name='conv5_3_1x1_increase')(y)
     y = BatchNormalization(name='conv5_3_1x1_increase_bn')(y)
     y = Add(name='conv5_3')([y,y_])
     y = Activation('relu', name='conv5_3/relu')(y)
 
-    h, w = y.shape[1:3].as_list()
-    pool1 = AveragePooling2D(pool_size=(h,w), strides=(h,w), name='conv5_3_pool1')(y)
-    pool1 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(h,w)), name='conv5_3_pool1_interp')(pool1)
-    pool2 = AveragePooling2D(pool_size=(h/2,w/2), strides=(h//2,w//2), name='conv5_3_pool2')(y)
-    pool2 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(h,w)), name='conv5_3_pool2_interp')(pool2)
-    pool3 = AveragePooling2D(pool_size=(h/3,w/3), strides=(h//3,w//3), name='conv5_3_pool3')(y)
-    pool3 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(h,w)), name='conv5_3_pool3_interp')(pool3)
-    pool6 = AveragePooling2D(pool_size=(h/4,w/4), strides=(h//4,w//4), name='conv5_3_pool6')(y)
-    pool6 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(h,w)), name='conv5_3_pool6_interp')(pool6)
+    pool1 = pyramid_pooling(y, 1, 'conv5_3_pool1')
+    pool2 = pyramid_pooling(y, 2, 'conv5_3_pool2')
+    pool3 = pyramid_pooling(y, 3, 'conv5_3_pool3')
+    pool6 = pyramid_pooling(y, 4, 'conv5_3_pool6')
 
     y = Add(name='conv5_3_sum')([y, pool1, pool2, pool3, pool6])
-    y = Conv2D(256, 1, activation='relu', name='conv5_4_k1')(y)
+    y = Conv2D(ch(256, 'conv5_4_k1'), 1, activation='relu', name='conv5_4_k1')(y)
     y = BatchNormalization(name='conv5_4_k1_bn')(y)
-    aux_1 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])*2, int(x.shape[2])*2)), name='conv5_4_interp')(y)
+    aux_1 = Lambda(lambda x: interp(x, 2), name='conv5_4_interp')(y)
 
     y = ZeroPadding2D(padding=2, name='padding17')(aux_1)
-    y = Conv2D(128, 3, dilation_rate=2, name='conv_sub4')(y)
+    y = Conv2D(ch(128, 'conv_sub4'), 3, dilation_rate=2, name='conv_sub4')(y)
     y = BatchNormalization(name='conv_sub4_bn')(y)
-    y_ = Conv2D(128, 1, name='conv3_1_sub2_proj')(z)
+    y_ = Conv2D(ch(128, 'conv3_1_sub2_proj'), 1, name='conv3_1_sub2_proj')(z)
     y_ = BatchNormalization(name='conv3_1_sub2_proj_bn')(y_)
 
     y = Add(name='sub24_sum')([y,y_])
     y = Activation('relu', name='sub24_sum/relu')(y)
 
-    aux_2 = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])*2, int(x.shape[2])*2)), name='sub24_sum_interp')(y)
+    aux_2 = Lambda(lambda x: interp(x, 2), name='sub24_sum_interp')(y)
     y = ZeroPadding2D(padding=2, name='padding18')(aux_2)
-    y_ = Conv2D(128, 3, dilation_rate=2, name='conv_sub2')(y)
+    y_ = Conv2D(ch(128, 'conv_sub2'), 3, dilation_rate=2, name='conv_sub2')(y)
     y_ = BatchNormalization(name='conv_sub2_bn')(y_)
 
     # (1)
-    y = Conv2D(32, 3, strides=2, padding='same', activation='relu', name='conv1_sub1')(x)
+    y = Conv2D(ch(32, 'conv1_sub1'), 3, strides=2, padding='same', activation='relu', name='conv1_sub1')(x)
     y = BatchNormalization(name='conv1_sub1_bn')(y)
-    y = Conv2D(32, 3, strides=2, padding='same', activation='relu', name='conv2_sub1')(y)
+    y = Conv2D(ch(32, 'conv2_sub1'), 3, strides=2, padding='same', activation='relu', name='conv2_sub1')(y)
     y = BatchNormalization(name='conv2_sub1_bn')(y)
-    y = Conv2D(64, 3, strides=2, padding='same', activation='relu', name='conv3_sub1')(y)
+    y = Conv2D(ch(64, 'conv3_sub1'), 3, strides=2, padding='same', activation='relu', name='conv3_sub1')(y)
     y = BatchNormalization(name='conv3_sub1_bn')(y)
-    y = Conv2D(128, 1, name='conv3_sub1_proj')(y)
+    y = Conv2D(ch(128, 'conv3_sub1_proj'), 1, name='conv3_sub1_proj')(y)
     y = BatchNormalization(name='conv3_sub1_proj_bn')(y)
 
     y = Add(name='sub12_sum')([y,y_])
     y = Activation('relu', name='sub12_sum/relu')(y)
-    y = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])*2, int(x.shape[2])*2)), name='sub12_sum_interp')(y) #DBG
-    #y = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])*4, int(x.shape[2])*4)), name='sub12_sum_interp')(y) # upsample output 320x160
-    #y = Lambda(lambda x: tf.image.resize_bilinear(x, size=(int(x.shape[1])*8, int(x.shape[2])*8)), name='sub12_sum_interp')(y) #
+    y = Lambda(lambda x: interp(x, 2), name='sub12_sum_interp')(y) #DBG
+    #y = Lambda(lambda x: interp(x, 4), name='sub12_sum_interp')(y) # upsample output 320x160
+    #y = Lambda(lambda x: interp(x, 8), name='sub12_sum_interp')(y) #
 
     out = Conv2D(n_classes, 1, activation='softmax', name='conv6_cls')(y)
 
@@ -254,4 +320,33 @@ def build_bn(width, height, n_classes, weights_path=None, train=False):
 
     if weights_path is not None:
         model.load_weights(weights_path)
-    return model
\ No newline at end of file
+    return model
+
+# layers of full resolution branch, `sub12_sum` adds cached context to their output
+SUB1_LAYERS = ('conv1_sub1', 'conv1_sub1_bn', 'conv2_sub1', 'conv2_sub1_bn', 'conv3_sub1', 'conv3_sub1_bn',
+               'conv3_sub1_proj', 'conv3_sub1_proj_bn')
+HEAD_LAYERS = ('sub12_sum/relu', 'sub12_sum_interp', 'conv6_cls')
+
+
+def split_branches(model):
+    """Split IC-Net into heavy context branch (1/2 and 1/4 of input) and light full resolution branch,
+    context of one frame can be reused by light branch for next frames of video
+
+    :model (keras.Model): IC-Net built by `build_bn`, layers are shared with result
+
+    :return (tuple(keras.Model, keras.Model)): context model of image returning 'conv_sub2_bn' features,
+    light model of image and features returning same output as 'conv6_cls'
+    """
+    features = model.get_layer('conv_sub2_bn').output
+    context = Model(inputs=model.input, outputs=features)
+
+    image = Input(shape=K.int_shape(model.input)[1:], name='image')
+    cached = Input(shape=K.int_shape(features)[1:], name='context')
+    # normalization Lambda is input of first convolution
+    y = model.get_layer('conv1_sub1').input._keras_history[0](image)
+    for name in SUB1_LAYERS:
+        y = model.get_layer(name)(y)
+    y = model.get_layer('sub12_sum')([y, cached])
+    for name in HEAD_LAYERS:
+        y = model.get_layer(name)(y)
+    return context, Model(inputs=[image, cached], outputs=y)
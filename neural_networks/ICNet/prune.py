@@ -0,0 +1,246 @@
+"""Structured L1 channel pruning of trained IC-Net
+
+Output channels of convolutions are ranked by L1 norm of their filters and
+the weakest ones are removed together with matching input channels of next
+layers. Convolutions whose outputs are summed by `Add` (residual blocks, branch
+fusions) share channels, so they are pruned as one group with summed norms.
+Every pruned model is described by `filters` of `build_bn` (saved to json
+next to its weights) and can be briefly fine-tuned. Sweep over keep ratios
+reports latency and mIoU:
+
+    python prune.py 141_epochs_fine_tuning.h5 /data/VOC2012 --ratios 1.0 0.75 0.5 \\
+        --fine-tune-steps 500 --budget-ms 60
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from os.path import join
+
+import cv2
+import keras.backend as K
+import numpy as np
+from keras.layers import Add, Conv2D, InputLayer
+from keras.optimizers import Adam
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from losses import sparse_crossentropy
+from metrics import ConfusionMatrix
+from model import build_bn
+from pascal_voc_data import MultiScaleGenerator, PascalVocGenerator
+from postprocessing import to_labels
+
+# classifiers keep number of classes
+OUTPUT_LAYERS = ('conv6_cls', 'sub4_out', 'sub24_out')
+
+
+def _inbound_layers(layer):
+    # attribute is private since keras 2.1.3
+    nodes = getattr(layer, '_inbound_nodes', None) or layer.inbound_nodes
+    return nodes[0].inbound_layers
+
+
+def channel_groups(model):
+    """Find groups of layers sharing output channels
+
+    :model (keras.Model): IC-Net
+
+    :return (dict): group of each layer by name, group is name of its first convolution,
+    'input' for channels of image
+    """
+    parent = {}
+
+    def find(group):
+        while parent.setdefault(group, group) != group:
+            parent[group] = parent[parent[group]]
+            group = parent[group]
+        return group
+
+    groups = {}
+    for layer in model.layers:
+        if isinstance(layer, InputLayer):
+            groups[layer.name] = 'input'
+        elif isinstance(layer, Conv2D):
+            groups[layer.name] = layer.name
+        elif isinstance(layer, Add):
+            inputs = [groups[_l.name] for _l in _inbound_layers(layer)]
+            for group in inputs[1:]:
+                parent[find(group)] = find(inputs[0])
+            groups[layer.name] = inputs[0]
+        else:
+            # BatchNormalization, activations, padding, pooling and resizing keep channels
+            groups[layer.name] = groups[_inbound_layers(layer)[0].name]
+    return {_name: find(_group) for _name, _group in groups.items()}
+
+
+def select_channels(model, keep_ratio, groups=None):
+    """Choose channels kept by pruning
+
+    :model (keras.Model): trained IC-Net
+    :keep_ratio (float): fraction of channels kept in every group
+    :groups (dict): result of `channel_groups`
+
+    :return (dict): sorted indices of kept channels by group
+    """
+    groups = groups or channel_groups(model)
+    fixed = {groups[_name] for _name in OUTPUT_LAYERS if _name in groups} | {'input'}
+    importance = {}
+    for layer in model.layers:
+        if isinstance(layer, Conv2D) and groups[layer.name] not in fixed:
+            norms = np.abs(layer.get_weights()[0]).sum(axis=(0, 1, 2))
+            # layers of group have different scale, so norms are normalized before summation
+            group = groups[layer.name]
+            importance[group] = importance.get(group, 0) + norms / (norms.mean() + K.epsilon())
+    return {
+        _group: np.sort(np.argsort(-_norms)[:max(1, int(round(len(_norms) * keep_ratio)))])
+        for _group, _norms in importance.items()
+    }
+
+
+def prune(model, keep_ratio, width, height, n_classes=21):
+    """Build thinner IC-Net and copy kept weights into it
+
+    :model (keras.Model): trained IC-Net built by `build_bn`
+    :keep_ratio (float): fraction of channels kept in every group
+    :width (int): width of input of pruned model
+    :height (int): height of input of pruned model
+    :n_classes (int): number of classes
+
+    :return (tuple(keras.Model, dict)): pruned model and its `filters` for `build_bn`
+    """
+    groups = channel_groups(model)
+    kept = select_channels(model, keep_ratio, groups)
+    filters = {
+        _layer.name: len(kept[groups[_layer.name]])
+        for _layer in model.layers if isinstance(_layer, Conv2D) and groups[_layer.name] in kept
+    }
+    train = 'sub4_out' in groups
+    pruned = build_bn(width, height, n_classes, train=train, filters=filters)
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        out_index = kept.get(groups[layer.name])
+        if isinstance(layer, Conv2D):
+            in_index = kept.get(groups[_inbound_layers(layer)[0].name])
+            kernel = weights[0]
+            if in_index is not None:
+                kernel = kernel[:, :, in_index]
+            if out_index is not None:
+                kernel = kernel[..., out_index]
+                weights = [kernel] + [_w[out_index] for _w in weights[1:]]
+            else:
+                weights = [kernel] + weights[1:]
+        elif out_index is not None:
+            # BatchNormalization: gamma, beta, moving mean and variance
+            weights = [_w[out_index] for _w in weights]
+        pruned.get_layer(layer.name).set_weights(weights)
+    return pruned, filters
+
+
+def voc_generator(voc_path, split, batch_size, width, height):
+    return PascalVocGenerator(
+        join(voc_path, 'ImageSets', 'Segmentation', split + '.txt'),
+        join(voc_path, 'JPEGImages'),
+        join(voc_path, 'SegmentationClass'),
+        batch_size, (width, height), target='sparse'
+    )
+
+
+def fine_tune(model, generator, steps, learning_rate=1e-4):
+    """Briefly train pruned model
+
+    :model (keras.Model): pruned IC-Net with single output at 1/4 of input size
+    :generator (PascalVocGenerator): sparse training batches
+    :steps (int): number of batches
+    :learning_rate (float): learning rate of Adam
+    """
+    model.compile(Adam(learning_rate), loss=sparse_crossentropy())
+    model.fit_generator(MultiScaleGenerator(generator, (4,)), steps_per_epoch=steps, epochs=1, verbose=1)
+
+
+def mean_iou(model, generator, n_classes=21):
+    """mIoU of model with output at lower resolution than labels
+
+    :model (keras.Model): IC-Net
+    :generator (PascalVocGenerator): sparse validation batches
+    :n_classes (int): number of classes
+
+    :return (float): mIoU
+    """
+    confusion = ConfusionMatrix(n_classes)
+    for idx in range(len(generator)):
+        images, labels = generator[idx]
+        height, width = labels.shape[1:3]
+        pred = to_labels(model.predict(images))
+        pred = np.array([cv2.resize(_p, (width, height), interpolation=cv2.INTER_NEAREST) for _p in pred])
+        confusion.update(labels[..., 0], pred)
+    return confusion.mean_iou
+
+
+def latency(model, height, width, warmup=5, iterations=30):
+    images = np.random.uniform(0, 255, (1, height, width, 3)).astype(np.float32)
+    for _ in range(warmup):
+        model.predict(images)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        model.predict(images)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Structured channel pruning of IC-Net')
+    parser.add_argument('weights', help='path to weights or saved model of IC-Net')
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--ratios', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.25])
+    parser.add_argument('--fine-tune-steps', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--eval-samples', type=int, default=300, help='number of validation images, 0 for all')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random validation images')
+    parser.add_argument('--budget-ms', type=float, default=None, help='pick best variant within latency budget')
+    parser.add_argument('--output-dir', default='pruned')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    val_gen = voc_generator(args.voc_path, 'val', 1, args.width, args.height)
+    val_gen.subsample(args.eval_samples, args.seed)
+    rows = []
+    for ratio in args.ratios:
+        K.clear_session()
+        model = build_bn(args.width, args.height, 21, weights_path=args.weights)
+        pruned, filters = prune(model, ratio, args.width, args.height)
+        if args.fine_tune_steps and ratio < 1:
+            train_gen = voc_generator(args.voc_path, 'train', args.batch_size, args.width, args.height)
+            fine_tune(pruned, train_gen, args.fine_tune_steps)
+        name = join(args.output_dir, 'ICNet_keep_{:.2f}'.format(ratio))
+        pruned.save_weights(name + '.h5')
+        with open(name + '.json', 'w') as filters_file:
+            json.dump(filters, filters_file)
+        rows.append({
+            'keep_ratio': ratio, 'weights': name + '.h5', 'params': pruned.count_params(),
+            'latency_ms': latency(pruned, args.height, args.width) * 1000, 'mean_iou': mean_iou(pruned, val_gen)
+        })
+        print('keep ratio {keep_ratio:.2f}: {latency_ms:.2f} ms, mIoU {mean_iou:.3f}'.format(**rows[-1]))
+
+    print('| Keep | Params    | Latency (ms) | mIoU  |')
+    print('|------|-----------|--------------|-------|')
+    for row in rows:
+        print('| {keep_ratio:.2f} | {params:9d} | {latency_ms:12.2f} | {mean_iou:.3f} |'.format(**row))
+    if args.budget_ms is not None:
+        within = [_r for _r in rows if _r['latency_ms'] <= args.budget_ms]
+        if within:
+            best = max(within, key=lambda _r: _r['mean_iou'])
+            print('Best within {} ms: keep ratio {keep_ratio:.2f}, {weights}'.format(args.budget_ms, **best))
+        else:
+            print('No variant fits into {} ms'.format(args.budget_ms))
+    with open(join(args.output_dir, 'sweep.json'), 'w') as sweep_file:
+        json.dump(rows, sweep_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
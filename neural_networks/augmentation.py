@@ -0,0 +1,119 @@
+"""Batched geometric and photometric augmentation of images and masks
+
+Accepts the same arguments as keras `ImageDataGenerator` used by
+`DataWorker.batch_generator`, but builds affine matrices for the whole
+batch at once, warps masks with nearest interpolation (labels stay
+labels) and keeps uint8 images in uint8.
+"""
+
+import cv2
+import numpy as np
+
+BORDER_MODES = {
+    'constant': cv2.BORDER_CONSTANT,
+    'nearest': cv2.BORDER_REPLICATE,
+    'reflect': cv2.BORDER_REFLECT,
+    'wrap': cv2.BORDER_WRAP
+}
+
+
+class BatchAugmenter:
+    """Random affine transformation, horizontal flip and brightness change"""
+
+    def __init__(self, rotation_range=0, width_shift_range=0., height_shift_range=0., zoom_range=0.,
+                 horizontal_flip=False, brightness_range=None, fill_mode='constant', cval=0, seed=None):
+        """
+        :rotation_range (float): maximum rotation in degrees
+        :width_shift_range (float): maximum horizontal shift as fraction of width
+        :height_shift_range (float): maximum vertical shift as fraction of height
+        :zoom_range (float or tuple): zoom is sampled from [1 - zoom_range, 1 + zoom_range] or given range
+        :horizontal_flip (bool): flip half of samples
+        :brightness_range (tuple): range of brightness multiplier
+        :fill_mode (str): one of 'constant', 'nearest', 'reflect', 'wrap'
+        :cval (int): value of image pixels outside of borders for 'constant' mode
+        :seed (int): random seed, if None global numpy random state is used,
+        which is reseeded for every batch by `data_pipeline.PrefetchLoader`
+        """
+        self.rotation_range = rotation_range
+        self.width_shift_range = width_shift_range
+        self.height_shift_range = height_shift_range
+        if np.isscalar(zoom_range):
+            zoom_range = (1 - zoom_range, 1 + zoom_range)
+        self.zoom_range = zoom_range
+        self.horizontal_flip = horizontal_flip
+        self.brightness_range = brightness_range
+        if fill_mode not in BORDER_MODES:
+            raise ValueError('Unknown fill mode: {}'.format(fill_mode))
+        self.border_mode = BORDER_MODES[fill_mode]
+        self.cval = cval
+        self.rng = np.random.RandomState(seed) if seed is not None else np.random
+
+    def random_matrices(self, batch_size, height, width):
+        """Sample inverse affine maps (output to input coordinates) around image center
+
+        :batch_size (int): number of matrices
+        :height (int): height of images
+        :width (int): width of images
+
+        :return (array [batch_size, 2, 3]): affine matrices for cv2.warpAffine
+        """
+        theta = np.deg2rad(self.rng.uniform(-self.rotation_range, self.rotation_range, batch_size))
+        shift_x = self.rng.uniform(-self.width_shift_range, self.width_shift_range, batch_size) * width
+        shift_y = self.rng.uniform(-self.height_shift_range, self.height_shift_range, batch_size) * height
+        zoom_x = self.rng.uniform(self.zoom_range[0], self.zoom_range[1], batch_size)
+        zoom_y = self.rng.uniform(self.zoom_range[0], self.zoom_range[1], batch_size)
+        flip = np.ones(batch_size)
+        if self.horizontal_flip:
+            flip[self.rng.uniform(size=batch_size) < 0.5] = -1
+
+        cos, sin = np.cos(theta), np.sin(theta)
+        linear = np.empty((batch_size, 2, 2))
+        linear[:, 0, 0] = cos * zoom_x * flip
+        linear[:, 0, 1] = -sin * zoom_y
+        linear[:, 1, 0] = sin * zoom_x * flip
+        linear[:, 1, 1] = cos * zoom_y
+        center = np.array([(width - 1) / 2., (height - 1) / 2.])
+        offset = center + np.stack([shift_x, shift_y], axis=1) - linear @ center
+        return np.concatenate([linear, offset[:, :, np.newaxis]], axis=2).astype(np.float32)
+
+    def random_brightness(self, batch_size):
+        """Sample brightness multipliers
+
+        :batch_size (int): number of multipliers
+
+        :return (array [batch_size]): multipliers, ones if brightness_range is None
+        """
+        if self.brightness_range is None:
+            return np.ones(batch_size)
+        return self.rng.uniform(self.brightness_range[0], self.brightness_range[1], batch_size)
+
+    def __call__(self, images, masks, out=None):
+        """Augment batch
+
+        :images (array [N, H, W, 3]): images, uint8 or float
+        :masks (array [N, H, W]): masks or label maps
+        :out (tuple, optional): buffers for augmented images and masks
+
+        :return (tuple([N, H, W, 3], [N, H, W])): augmented images and masks of source types
+        """
+        batch_size, height, width = images.shape[:3]
+        if out is None:
+            out = (np.empty_like(images), np.empty_like(masks))
+        aug_images, aug_masks = out
+        matrices = self.random_matrices(batch_size, height, width)
+        brightness = self.random_brightness(batch_size)
+        for i in range(batch_size):
+            cv2.warpAffine(images[i], matrices[i], (width, height), dst=aug_images[i],
+                           flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                           borderMode=self.border_mode, borderValue=self.cval)
+            # masks are always padded with background
+            cv2.warpAffine(masks[i], matrices[i], (width, height), dst=aug_masks[i],
+                           flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+                           borderMode=self.border_mode, borderValue=0)
+            if brightness[i] != 1:
+                if aug_images.dtype == np.uint8:
+                    lut = np.clip(np.arange(256) * brightness[i], 0, 255).astype(np.uint8)
+                    cv2.LUT(aug_images[i], lut, dst=aug_images[i])
+                else:
+                    aug_images[i] *= brightness[i]
+        return aug_images, aug_masks
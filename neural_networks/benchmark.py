@@ -0,0 +1,154 @@
+"""Latency benchmark of frozen graphs and tflite models
+
+Example:
+    python benchmark.py ICNet/ICNet_256x256.pb DeepLabV3/deeplabv3_257_mv_gpu.tflite \\
+        --threads 1 4 --batch-sizes 1 4 --json results.json
+Results of several machines can be compared by merging their json files.
+Every model, threads and batch size runs in fresh process, so its peak RSS
+is not hidden by peaks of configurations measured before it.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+
+import numpy as np
+
+from inference import load_runner
+
+
+def machine_info():
+    """Description of current machine
+
+    :return (dict): cpu model, number of cores, platform and tensorflow version
+    """
+    import tensorflow as tf
+
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    return {
+        'cpu': cpu, 'cores': os.cpu_count(), 'platform': platform.platform(),
+        'python': platform.python_version(), 'tensorflow': tf.__version__
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if platform.system() == 'Darwin' else rss / 2 ** 10
+
+
+def random_batch(shape, dtype, batch_size, height=None, width=None):
+    """Random input for model
+
+    :shape (tuple): input shape of model, None for dynamic dimensions
+    :dtype (numpy dtype): input type
+    :batch_size (int): size of batch
+    :height (int): height for dynamic input
+    :width (int): width for dynamic input
+
+    :return (array [batch_size, H, W, C]): images in [0, 255]
+    """
+    shape = [batch_size, height or shape[1], width or shape[2], shape[3]]
+    if None in shape:
+        raise ValueError('Input has dynamic shape {}, set --height and --width'.format(shape))
+    if np.issubdtype(dtype, np.integer):
+        return np.random.randint(0, 256, shape).astype(dtype)
+    return np.random.uniform(0, 255, shape).astype(dtype)
+
+
+def measure_latency(predict, batch, warmup, iterations):
+    """Measure latencies of single calls
+
+    :predict (callable): function of batch
+    :batch (array): input batch
+    :warmup (int): number of not measured calls
+    :iterations (int): number of measured calls
+
+    :return (dict): percentiles of latency in ms and throughput in images per second
+    """
+    for _ in range(warmup):
+        predict(batch)
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        predict(batch)
+        latencies[i] = time.perf_counter() - start
+    return {
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p90_ms': float(np.percentile(latencies, 90) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'images_per_second': float(len(batch) * iterations / latencies.sum())
+    }
+
+
+def measure_config(args, model_path, threads, batch_size):
+    """Latency and peak memory of one configuration, meant to run in its own process
+
+    :args (argparse.Namespace): arguments of benchmark
+    :model_path (str): path to .pb or .tflite file
+    :threads (int): number of threads, 0 for tensorflow default
+    :batch_size (int): size of batch
+
+    :return (dict): configuration, latency statistics and peak RSS of process
+    """
+    runner = load_runner(model_path, args.input, args.output, threads=threads or None)
+    batch = random_batch(runner.input_shape, runner.input_dtype, batch_size, args.height, args.width)
+    result = {
+        'model': model_path, 'threads': threads, 'batch_size': batch_size,
+        'input_shape': list(batch.shape), 'warmup': args.warmup, 'iterations': args.iterations
+    }
+    result.update(measure_latency(runner.predict, batch, args.warmup, args.iterations))
+    runner.close()
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run(args):
+    # ru_maxrss never decreases, so every configuration gets new process with its own peak
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for model_path in args.models:
+        for threads in args.threads:
+            for batch_size in args.batch_sizes:
+                with context.Pool(1) as pool:
+                    result = pool.apply(measure_config, (args, model_path, threads, batch_size))
+                results.append(result)
+                print('{model} threads={threads} batch={batch_size}: p50 {p50_ms:.2f} ms, p90 {p90_ms:.2f} ms, '
+                      'p99 {p99_ms:.2f} ms, {images_per_second:.2f} img/s, peak rss {peak_rss_mb:.0f} Mb'.format(
+                          **result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency benchmark of .pb and .tflite models')
+    parser.add_argument('models', nargs='+', help='paths to .pb or .tflite files')
+    parser.add_argument('--input', default=None, help='input tensor of frozen graph, first placeholder by default')
+    parser.add_argument('--output', default=None, help='output tensor of frozen graph, last operation by default')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--threads', type=int, nargs='+', default=[0], help='0 for tensorflow default')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1])
+    parser.add_argument('--height', type=int, default=None, help='input height for dynamic shapes')
+    parser.add_argument('--width', type=int, default=None, help='input width for dynamic shapes')
+    parser.add_argument('--json', default=None, help='file to write results into')
+    args = parser.parse_args()
+
+    report = {'machine': machine_info(), 'results': run(args)}
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compare BatchAugmenter with keras ImageDataGenerator used by DataWorker before"""
+
+import argparse
+import time
+
+import numpy as np
+
+from common import print_table  # adds neural_networks folder to path
+from augmentation import BatchAugmenter
+
+AUGMENT_ARGS = {
+    'rotation_range': 15, 'width_shift_range': 0.1, 'height_shift_range': 0.1,
+    'zoom_range': 0.25, 'horizontal_flip': True, 'brightness_range': [0.75, 1.25],
+    'fill_mode': 'constant'
+}
+
+
+def keras_augmentation(images, masks, seed=7):
+    # previous implementation of DataWorker.batch_augmentation for single batch
+    from keras.preprocessing.image import ImageDataGenerator
+
+    augment = ImageDataGenerator(**AUGMENT_ARGS)
+    stacked = np.concatenate([images, masks[:, :, :, np.newaxis]], axis=-1)
+    aug_stacked = next(augment.flow(stacked, seed=seed, batch_size=stacked.shape[0], shuffle=False))
+    return aug_stacked[:, :, :, :3].astype(np.uint8), aug_stacked[:, :, :, 3]
+
+
+def images_per_second(func, images_num, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return images_num * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512])
+    args = parser.parse_args()
+
+    augmenter = BatchAugmenter(seed=7, **AUGMENT_ARGS)
+    rows = []
+    for size in args.sizes:
+        images = np.random.randint(0, 256, (args.batch_size, size, size, 3), dtype=np.uint8)
+        masks = np.random.randint(0, 2, (args.batch_size, size, size)).astype(np.float32)
+        try:
+            keras_speed = images_per_second(lambda: keras_augmentation(images, masks), args.batch_size)
+        except ImportError:
+            keras_speed = float('nan')
+        batched_speed = images_per_second(lambda: augmenter(images, masks), args.batch_size)
+        uint8_speed = images_per_second(lambda: augmenter(images, masks.astype(np.uint8)), args.batch_size)
+        rows.append(['{0}x{0}'.format(size), keras_speed, batched_speed, uint8_speed])
+    print('Augmented images per second')
+    print_table(['size', 'ImageDataGenerator', 'BatchAugmenter', 'BatchAugmenter, uint8 masks'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Compare DataWorker.batch_loader with preallocated buffers and np.append assembly
+
+COCO is not required, images and masks are synthetic
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from common import print_table
+from ms_coco_data_worker import DataWorker
+from utils import resize_pad
+
+
+class SyntheticDataWorker(DataWorker):
+
+    def __init__(self, images_num, image_height=480, image_width=640):
+        self.image = np.random.randint(0, 256, (image_height, image_width, 3), dtype=np.uint8)
+        self.mask = np.random.randint(0, 2, (image_height, image_width), dtype=np.uint8)
+        self.train_images = [{'id': _i} for _i in range(images_num)]
+
+    def load_image_mask(self, image_desc):
+        return self.image, self.mask
+
+
+def append_batch_loader(worker, images_descriptions, batch_size, height, width):
+    # previous implementation of DataWorker.batch_loader
+    for start_ind in range(0, len(images_descriptions), batch_size):
+        images = np.empty([0, height, width, 3], dtype=np.uint8)
+        masks = np.empty([0, height, width], dtype=np.float32)
+        for image_desc in images_descriptions[start_ind:start_ind + batch_size]:
+            image, mask = worker.load_image_mask(image_desc)
+            shaped_image = resize_pad(image, height, width)
+            shaped_mask = resize_pad(mask, height, width, cv2.INTER_NEAREST)
+
+            images = np.append(images, [shaped_image], axis=0)
+            masks = np.append(masks, [shaped_mask], axis=0)
+        yield (images, masks)
+
+
+def throughput(batches, images_num):
+    start = time.perf_counter()
+    for _ in batches:
+        pass
+    return images_num / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--images', type=int, default=300)
+    parser.add_argument('--size', type=int, default=512)
+    args = parser.parse_args()
+
+    worker = SyntheticDataWorker(args.images)
+    images = worker.train_images
+    rows = []
+    for batch_size in args.batch_sizes:
+        append = throughput(append_batch_loader(worker, images, batch_size, args.size, args.size), len(images))
+        buffered = throughput(worker.batch_loader(images, batch_size, args.size, args.size), len(images))
+        buffered_uint8 = throughput(
+            worker.batch_loader(images, batch_size, args.size, args.size, mask_dtype=np.uint8), len(images)
+        )
+        rows.append([batch_size, append, buffered, buffered_uint8])
+    print('Images per second, {0}x{0}'.format(args.size))
+    print_table(['batch size', 'np.append', 'buffers', 'buffers, uint8 masks'], rows)
+
+
+if __name__ == '__main__':
+    main()
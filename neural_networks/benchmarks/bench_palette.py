@@ -0,0 +1,68 @@
+"""Compare lookup-table palette codec with per-class colour comparison"""
+
+import argparse
+
+import numpy as np
+
+from common import measure, print_table
+from palette import PaletteCodec
+
+# same order as PascalVocGenerator.classes
+VOC_COLORS = np.array([
+    [0, 0, 0], [128, 0, 0], [0, 128, 0], [128, 128, 0], [0, 0, 128], [128, 0, 128], [0, 128, 128],
+    [128, 128, 128], [64, 0, 0], [192, 0, 0], [64, 128, 0], [192, 128, 0], [64, 0, 128],
+    [192, 0, 128], [64, 128, 128], [192, 128, 128], [0, 64, 0], [128, 64, 0], [0, 192, 0],
+    [128, 192, 0], [0, 64, 128]
+], dtype=np.uint8)
+
+
+def loop_mask_to_categorical(mask):
+    # previous implementation of PascalVocGenerator.mask_to_categorical
+    cat = np.zeros((mask.shape[0], mask.shape[1], len(VOC_COLORS)), np.float64)
+    for i, color in enumerate(VOC_COLORS):
+        cat[:, :, i] = (mask == color).all(axis=2).astype(np.float64)
+    return cat
+
+
+def loop_categorical_to_mask(categorical):
+    # previous implementation of PascalVocGenerator.categorical_to_mask
+    mask = np.zeros((categorical.shape[0], categorical.shape[1], 3), np.int64)
+    for i, color in enumerate(VOC_COLORS):
+        mask[categorical[:, :, i] == 1.] = color
+    return mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 513])
+    parser.add_argument('--batch-size', type=int, default=20)
+    args = parser.parse_args()
+
+    codec = PaletteCodec(VOC_COLORS)
+    codec.encode(VOC_COLORS[np.newaxis])  # build lookup table
+    rows = []
+    for size in args.sizes:
+        labels = np.random.randint(0, len(VOC_COLORS), (args.batch_size, size, size))
+        masks = VOC_COLORS[labels]
+
+        loop_encode = measure(lambda: [loop_mask_to_categorical(_m) for _m in masks], repeat=3)
+        lut_encode = measure(lambda: codec.encode(masks))
+        categorical = np.array([loop_mask_to_categorical(_m) for _m in masks])
+        loop_decode = measure(lambda: [loop_categorical_to_mask(_c) for _c in categorical], repeat=3)
+        lut_decode = measure(lambda: codec.decode(labels))
+
+        assert (codec.encode(masks) == labels).all()
+        assert (codec.decode(labels) == masks).all()
+        rows.append([
+            '{0}x{0}'.format(size), loop_encode * 1000, lut_encode * 1000, loop_decode * 1000,
+            lut_decode * 1000, categorical.nbytes / 2 ** 20, codec.encode(masks).nbytes / 2 ** 20
+        ])
+    print('Time per batch of {} masks'.format(args.batch_size))
+    print_table([
+        'size', 'loop encode (ms)', 'lut encode (ms)', 'loop decode (ms)', 'lut decode (ms)',
+        'one-hot (Mb)', 'labels (Mb)'
+    ], rows)
+
+
+if __name__ == '__main__':
+    main()
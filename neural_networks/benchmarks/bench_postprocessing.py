@@ -0,0 +1,55 @@
+"""Compare vectorized post-processing with per-pixel python loop"""
+
+import argparse
+
+import numpy as np
+
+from common import measure, print_table
+from postprocessing import softmax_to_labels, labels_to_onehot
+
+
+def loop_softmax2classes(pred, height=256, width=256, num_classes=21):
+    # previous implementation of utils.softmax2classes
+    pred_mask = np.zeros_like(pred)
+    for _i in range(height):
+        for _j in range(width):
+            cur_top = -1
+            cur_max = -1
+            for _cl in range(num_classes):
+                if pred[_i, _j, _cl] > cur_max:
+                    cur_max = pred[_i, _j, _cl]
+                    cur_top = _cl
+            pred_mask[_i, _j, cur_top] = 1.
+    return pred_mask
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[224, 256, 257, 513])
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--num-classes', type=int, default=21)
+    args = parser.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        pred = np.random.rand(args.batch_size, size, size, args.num_classes).astype(np.float32)
+        out = np.empty(pred.shape[:-1], dtype=np.uint8)
+
+        loop_time = measure(lambda: loop_softmax2classes(pred[0], size, size, args.num_classes),
+                            repeat=1, warmup=0)
+        labels_time = measure(lambda: softmax_to_labels(pred, out=out)) / args.batch_size
+        onehot_time = measure(
+            lambda: labels_to_onehot(softmax_to_labels(pred, out=out), args.num_classes)
+        ) / args.batch_size
+
+        expected = loop_softmax2classes(pred[0], size, size, args.num_classes)
+        assert (labels_to_onehot(out[:1], args.num_classes)[0] == expected).all()
+        rows.append([
+            '{0}x{0}'.format(size), loop_time * 1000, labels_time * 1000, onehot_time * 1000,
+            loop_time / labels_time
+        ])
+    print_table(['size', 'loop (ms)', 'labels (ms)', 'labels + one-hot (ms)', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Throughput of RunnerPool depending on number of pooled sessions or interpreters
+
+Every configuration is loaded by ModelRegistry and served to as many client
+threads as there are runners in pool, e.g.
+`python benchmarks/bench_runner_pool.py ENet/ENet_256x256.tflite --sizes 1 2 4`
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from common import print_table
+from inference import ModelRegistry
+
+
+def pool_throughput(pool, batch, clients, requests_per_client):
+    def client():
+        for _ in range(requests_per_client):
+            pool.predict(batch)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * requests_per_client * len(batch) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('model', help='path to .pb or .tflite file')
+    parser.add_argument('--input', default=None, help='input tensor of frozen graph')
+    parser.add_argument('--output', default=None, help='output tensor of frozen graph')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=1, help='threads of each session or interpreter')
+    parser.add_argument('--requests', type=int, default=20, help='requests of each client thread')
+    parser.add_argument('--height', type=int, default=None, help='input height for dynamic shapes')
+    parser.add_argument('--width', type=int, default=None, help='input width for dynamic shapes')
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    rows = []
+    for size in args.sizes:
+        name = 'pool_{}'.format(size)
+        start = time.perf_counter()
+        pool = registry.register(name, args.model, size=size, input_name=args.input, output_name=args.output,
+                                 threads=args.threads)
+        load_time = time.perf_counter() - start
+        _, height, width, channels = pool.input_shape
+        batch = np.random.uniform(0, 255, (1, args.height or height, args.width or width, channels))
+        batch = batch.astype(pool.input_dtype)
+        throughput = pool_throughput(pool, batch, size, args.requests)
+        rows.append([size, load_time, throughput])
+        registry.unregister(name)
+    print('Clients equal to number of runners, {} threads per runner'.format(args.threads))
+    print_table(['runners', 'load time, s', 'images per second'], rows)
+
+
+if __name__ == '__main__':
+    main()
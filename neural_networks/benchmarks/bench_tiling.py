@@ -0,0 +1,88 @@
+"""Tiled inference against resize-then-infer on full-resolution VOC images
+
+Images and labels are read at original size (optionally upscaled to imitate
+high-resolution photos), baseline resizes image to model input and its
+scores back, tiled inference runs `TiledPredictor` with given overlaps, e.g.
+`python benchmarks/bench_tiling.py ICNet/ICNet_256x256.pb /data/VOC2012 --input image:0 \\
+--output predictions/ResizeBilinear:0 --upscale 2 --overlaps 0 0.25 0.5`
+"""
+
+import argparse
+import time
+from os.path import join
+
+import cv2
+import numpy as np
+
+from common import print_table
+from inference import NORMALIZATIONS, load_runner, normalize_batch
+from metrics import ConfusionMatrix
+from pascal_voc_data import PascalVocGenerator
+from tiling import TiledPredictor
+
+
+def voc_samples(voc_path, split, count, upscale):
+    with open(join(voc_path, 'ImageSets', 'Segmentation', split + '.txt')) as names_file:
+        names = [_line.strip() for _line in names_file][:count]
+    for name in names:
+        image = cv2.imread(join(voc_path, 'JPEGImages', name + '.jpg'))[:, :, ::-1]
+        mask = cv2.imread(join(voc_path, 'SegmentationClass', name + '.png'))
+        labels = PascalVocGenerator.codec.encode(mask[:, :, ::-1])
+        if upscale != 1:
+            image = cv2.resize(image, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_CUBIC)
+            labels = cv2.resize(labels, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_NEAREST)
+        yield np.ascontiguousarray(image), labels
+
+
+def resize_predict(runner, image, normalization):
+    _, height, width, _ = runner.input_shape
+    batch = normalize_batch(cv2.resize(image, (width, height))[np.newaxis], normalization, runner.input_dtype)
+    scores = runner.predict(batch)[0]
+    scores = cv2.resize(scores, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+    return scores.reshape(image.shape[:2] + (-1,)).argmax(axis=-1)
+
+
+def run(predict, samples, num_classes=21):
+    confusion = ConfusionMatrix(num_classes)
+    pixels, elapsed = 0, 0.
+    for image, labels in samples:
+        start = time.perf_counter()
+        pred = predict(image)
+        elapsed += time.perf_counter() - start
+        pixels += image.shape[0] * image.shape[1]
+        confusion.update(labels[np.newaxis], pred[np.newaxis])
+    return pixels / elapsed / 1e6, confusion.mean_iou
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('model', help='path to .pb or .tflite file with per-class scores output')
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--input', default=None, help='input tensor of frozen graph')
+    parser.add_argument('--output', default=None, help='output tensor of frozen graph')
+    parser.add_argument('--normalization', default='none', choices=NORMALIZATIONS)
+    parser.add_argument('--split', default='val')
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--upscale', type=float, default=1.)
+    parser.add_argument('--overlaps', type=float, nargs='+', default=[0, 0.25, 0.5])
+    parser.add_argument('--batch-size', type=int, default=4, help='tiles per model call')
+    args = parser.parse_args()
+
+    runner = load_runner(args.model, args.input, args.output)
+    _, height, width, _ = runner.input_shape
+
+    def samples():
+        return voc_samples(args.voc_path, args.split, args.samples, args.upscale)
+
+    rows = [['resize'] + list(run(lambda _im: resize_predict(runner, _im, args.normalization), samples()))]
+    for overlap in args.overlaps:
+        predictor = TiledPredictor(runner.predict, (height, width), overlap, args.batch_size, args.normalization,
+                                   runner.input_dtype)
+        throughput, mean_iou = run(predictor.predict, samples())
+        rows.append(['tiles, overlap {}'.format(overlap), throughput, mean_iou])
+    runner.close()
+    print_table(['Method', 'Megapixels per second', 'mIoU'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Latency and memory of max pooling with indices and unpooling methods of ENet
+
+Every combination of pooling method, index format and unpooling method runs on
+feature maps of ENet decoder; memory is total size of tensors allocated by
+operations in one run, outputs are compared with default combination. Round
+trip on large input with ties, where flat indices exceed 2 ** 24, is checked
+against numpy, script exits with error if 'offset' or 'int32' indices give
+wrong values ('float' ones are exact only below 2 ** 24), e.g.
+`python benchmarks/bench_unpooling.py --size 128 --channels 64 --batch 4 --check-size 2048`
+`python benchmarks/bench_unpooling.py --check-only`
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from common import measure, print_table
+import keras.backend as K
+import tensorflow as tf
+
+from ENet.pooling_layers import (INDEX_FORMATS, POOLING_METHODS, UNPOOLING_METHODS, MaxPoolingWithArgmax2D,
+                                 MaxUnpooling2D)
+
+# index formats which must round trip exactly at any size
+EXACT_FORMATS = ('offset', 'int32')
+
+
+def allocated_mb(session, fetches, feed_dict):
+    """Total size of output tensors allocated by operations in one run
+
+    :session (tf.Session): session
+    :fetches (tensor): tensors to compute
+    :feed_dict (dict): inputs
+
+    :return (float): size in Mb
+    """
+    options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    metadata = tf.RunMetadata()
+    session.run(fetches, feed_dict, options=options, run_metadata=metadata)
+    total = 0
+    for device in metadata.step_stats.dev_stats:
+        for node in device.node_stats:
+            total += sum(_o.tensor_description.allocation_description.requested_bytes for _o in node.output)
+    return total / 2 ** 20
+
+
+def expected_round_trip(features):
+    """Unpooled max pooling, first maximum of every window stays in place and other values are zeros
+
+    :features (array [B, H, W, C]): values, H and W are even
+
+    :return (array [B, H, W, C]): result
+    """
+    batch, height, width, channels = features.shape
+    # [B, H / 2, W / 2, C, 4] with window pixels in order dy * 2 + dx
+    windows = features.reshape(batch, height // 2, 2, width // 2, 2, channels).transpose(0, 1, 3, 5, 2, 4)
+    windows = windows.reshape(batch, height // 2, width // 2, channels, 4)
+    first = np.arange(4) == windows.argmax(axis=-1)[..., np.newaxis]
+    result = np.where(first, windows, 0).reshape(batch, height // 2, width // 2, channels, 2, 2)
+    return result.transpose(0, 1, 4, 2, 5, 3).reshape(features.shape)
+
+
+def round_trip_errors(size, channels, session):
+    """Number of wrong values after pooling and unpooling of large input
+
+    :size (int): height and width of input
+    :channels (int): number of channels
+    :session (tf.Session): session
+
+    :return (list of lists): rows with methods, index format and number of wrong values,
+    'error' if rounded float indices fall outside of output
+    """
+    # coarse values make ties inside windows frequent, first maximum must win as in max_pool_with_argmax
+    features = np.round(np.random.normal(size=(1, size, size, channels)) * 4).astype(np.float32) / 4
+    expected = expected_round_trip(features)
+    inputs = K.placeholder(shape=(None, size, size, channels))
+    rows = []
+    for pooling in POOLING_METHODS:
+        for index_format in INDEX_FORMATS:
+            pooled, indices = MaxPoolingWithArgmax2D(method=pooling, index_format=index_format)(inputs)
+            for unpooling in UNPOOLING_METHODS:
+                outputs = MaxUnpooling2D(method=unpooling)([pooled, indices])
+                try:
+                    result = session.run(outputs, {inputs: features})
+                except tf.errors.InvalidArgumentError:
+                    rows.append([pooling, index_format, unpooling, 'error'])
+                    continue
+                rows.append([pooling, index_format, unpooling, int(np.sum(result != expected))])
+    return rows
+
+
+def check(size, channels, session):
+    """Print round trip errors, exit with error if indices of EXACT_FORMATS give wrong values"""
+    print('Round trip of {0}x{0}x{1} input'.format(size, channels))
+    rows = round_trip_errors(size, channels, session)
+    print_table(['Pooling', 'Indices', 'Unpooling', 'Wrong values'], rows)
+    failed = [_r for _r in rows if _r[1] in EXACT_FORMATS and _r[3]]
+    if failed:
+        sys.exit('Round trip is wrong for {}'.format(', '.join('/'.join(_r[:3]) for _r in failed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=128, help='height and width of feature map')
+    parser.add_argument('--channels', type=int, default=64)
+    parser.add_argument('--batch', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--check-size', type=int, default=2048, help='size of round trip check, 0 to skip')
+    parser.add_argument('--check-channels', type=int, default=8)
+    parser.add_argument('--check-only', action='store_true', help='run only round trip check')
+    args = parser.parse_args()
+    if args.check_only:
+        check(args.check_size or 2048, args.check_channels, K.get_session())
+        return
+
+    features = np.random.normal(size=(args.batch, args.size, args.size, args.channels)).astype(np.float32)
+    inputs = K.placeholder(shape=(None, args.size, args.size, args.channels))
+    session = K.get_session()
+    rows, reference = [], None
+    feed_dict = {inputs: features}
+    for pooling in POOLING_METHODS:
+        for index_format in INDEX_FORMATS:
+            pooled, indices = MaxPoolingWithArgmax2D(method=pooling, index_format=index_format)(inputs)
+            for unpooling in UNPOOLING_METHODS:
+                outputs = MaxUnpooling2D(method=unpooling)([pooled, indices])
+                result = session.run(outputs, feed_dict)
+                if reference is None:
+                    reference = result
+                rows.append([
+                    pooling, index_format, unpooling,
+                    measure(lambda: session.run(outputs, feed_dict), args.repeat) * 1000,
+                    allocated_mb(session, outputs, feed_dict),
+                    session.run(indices, feed_dict).nbytes / 2 ** 20,
+                    float(np.max(np.abs(result - reference)))
+                ])
+    print_table(['Pooling', 'Indices', 'Unpooling', 'Time (ms)', 'Allocated (mb)', 'Indices (mb)', 'Max difference'],
+                rows)
+    if args.check_size:
+        print()
+        check(args.check_size, args.check_channels, session)
+
+
+if __name__ == '__main__':
+    main()
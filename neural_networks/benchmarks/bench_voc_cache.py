@@ -0,0 +1,61 @@
+"""Epochs of PascalVocGenerator without cache, with RAM cache and with memory-mapped cache
+
+First epoch fills cache, next epochs read resized images and label maps from it,
+augmentation (if enabled) still runs on every batch, e.g.
+`python benchmarks/bench_voc_cache.py /data/VOC2012 --samples 500 --epochs 3 --memmap-prefix /tmp/voc_cache`
+"""
+
+import argparse
+import time
+from os.path import join
+
+from common import print_table
+from caching import LRUCache
+from pascal_voc_data import PascalVocGenerator
+
+
+def epoch_times(generator, epochs):
+    times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        for idx in range(len(generator)):
+            generator[idx]
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--split', default='train')
+    parser.add_argument('--samples', type=int, default=500, help='number of images, 0 for all')
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--cache-mb', type=int, default=2048, help='memory of RAM cache')
+    parser.add_argument('--memmap-prefix', default='/tmp/voc_cache', help='path prefix of memory-mapped cache')
+    args = parser.parse_args()
+
+    def generator(cache):
+        voc = PascalVocGenerator(
+            join(args.voc_path, 'ImageSets', 'Segmentation', args.split + '.txt'),
+            join(args.voc_path, 'JPEGImages'),
+            join(args.voc_path, 'SegmentationClass'),
+            args.batch_size, (args.size, args.size), target='sparse', cache=cache
+        )
+        if args.samples:
+            voc.images = voc.images[:args.samples]
+        return voc
+
+    memmap_prefix = '{}_{}x{}'.format(args.memmap_prefix, args.size, args.size)
+    rows = []
+    for name, cache in (('none', None), ('memory', LRUCache(args.cache_mb * 2 ** 20)), ('memmap', memmap_prefix)):
+        voc = generator(cache)
+        times = epoch_times(voc, args.epochs)
+        stats = voc.cache_stats or {'hit_rate': 0.}
+        rows.append([name, times[0], sum(times[1:]) / max(1, len(times) - 1), stats['hit_rate']])
+    print_table(['Cache', 'First epoch (s)', 'Next epochs (s)', 'Hit rate'], rows)
+
+
+if __name__ == '__main__':
+    main()
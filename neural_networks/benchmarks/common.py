@@ -0,0 +1,47 @@
+"""Helpers shared by micro-benchmarks
+
+Scripts in this folder are run from `neural_networks` folder, e.g.
+`python benchmarks/bench_postprocessing.py`
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def measure(func, repeat=5, warmup=1):
+    """Measure working time of function
+
+    :func (callable): function without arguments
+    :repeat (int): number of measured runs
+    :warmup (int): number of runs before measuring
+
+    :return (float): median working time in seconds
+    """
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def print_table(headers, rows):
+    """Print rows as markdown table, same as tables in README
+
+    :headers (list of str): names of columns
+    :rows (list of lists): values of cells
+    """
+    cells = [[str(_c) for _c in headers]] + [
+        ['{:.4f}'.format(_c) if isinstance(_c, float) else str(_c) for _c in _r] for _r in rows
+    ]
+    widths = [max(len(_r[_i]) for _r in cells) for _i in range(len(headers))]
+    lines = ['| ' + ' | '.join(_c.ljust(_w) for _c, _w in zip(_r, widths)) + ' |' for _r in cells]
+    lines.insert(1, '|' + '|'.join('-' * (_w + 2) for _w in widths) + '|')
+    print('\n'.join(lines))
@@ -0,0 +1,186 @@
+"""Bounded caches of decoded and preprocessed data, in RAM or in memory-mapped files"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes(value):
+    """Memory of array or of (nested) tuple, list or dict of arrays
+
+    :value (object): cached value
+
+    :return (int): size in bytes, 0 for other objects
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(_v) for _v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(_v) for _v in value.values())
+    return 0
+
+
+class LRUCache:
+    """Thread-safe least recently used cache bounded by total size of values,
+    values are shared by all readers, so they must not be modified
+
+        cache = LRUCache(512 * 2 ** 20)
+        batch = cache.get_or_compute(('2007_000032', (256, 256), 'none'), lambda: preprocess(image))
+    """
+
+    def __init__(self, max_bytes, size_of=nbytes):
+        """
+        :max_bytes (int): maximum total size of values, values larger than it are not cached
+        :size_of (callable): function returning size of value in bytes
+        """
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = self.size_of(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self.nbytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Cached value or result of compute, which is stored,
+        compute is called without lock, so concurrent misses of one key may compute it twice
+
+        :key (hashable): key
+        :compute (callable): function without arguments returning value
+
+        :return (object): value
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    @property
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'items': len(self._items), 'mb': self.nbytes / 2 ** 20, 'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'hit_rate': self.hits / requests if requests else 0.
+        }
+
+
+class MemmapCache:
+    """Cache of fixed-shape uint8 arrays in memory-mapped files, one slot per known key,
+    e.g. resized image and label map of every image of dataset
+
+        cache = MemmapCache('cache/voc_train_256x256', names, [(256, 256, 3), (256, 256)])
+
+    Files are shared by processes (loader workers) and kept between runs,
+    slot is marked as filled after its arrays are written.
+    """
+
+    def __init__(self, path_prefix, keys, shapes):
+        """
+        :path_prefix (str): path of cache files without suffix, it should include shapes
+        :keys (list of hashable): all keys, e.g. image names
+        :shapes (list of tuple): shape of each array of value
+        """
+        keys = sorted(set(str(_k) for _k in keys))
+        self.slots = {_k: _i for _i, _k in enumerate(keys)}
+        self.shapes = [tuple(_s) for _s in shapes]
+        directory = os.path.dirname(path_prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        index_path = path_prefix + '_index.json'
+        meta = {'keys': keys, 'shapes': self.shapes}
+        fresh = True
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                stored = json.load(index_file)
+            fresh = stored['keys'] != keys or [tuple(_s) for _s in stored['shapes']] != self.shapes
+        if fresh:
+            with open(index_path, 'w') as index_file:
+                json.dump(meta, index_file)
+        mode = 'w+' if fresh else 'r+'
+        self.filled = np.memmap(path_prefix + '_filled.u8', np.uint8, mode, shape=(len(keys),))
+        self.arrays = [
+            np.memmap('{}_{}.u8'.format(path_prefix, _i), np.uint8, mode, shape=(len(keys),) + _s)
+            for _i, _s in enumerate(self.shapes)
+        ]
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return int(self.filled.sum())
+
+    def __contains__(self, key):
+        slot = self.slots.get(str(key))
+        return slot is not None and bool(self.filled[slot])
+
+    def get(self, key, default=None):
+        slot = self.slots.get(str(key))
+        if slot is None or not self.filled[slot]:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return tuple(_a[slot] for _a in self.arrays)
+
+    def put(self, key, value):
+        slot = self.slots.get(str(key))
+        if slot is None:
+            raise KeyError('Key {} has no slot in cache'.format(key))
+        for array, item in zip(self.arrays, value):
+            array[slot] = item
+        self.filled[slot] = 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def flush(self):
+        for array in self.arrays + [self.filled]:
+            array.flush()
+
+    @property
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'items': len(self), 'mb': sum(_a.nbytes for _a in self.arrays) / 2 ** 20, 'hits': self.hits,
+            'misses': self.misses, 'hit_rate': self.hits / requests if requests else 0.
+        }
@@ -0,0 +1,156 @@
+"""Precompiled store of resized MS COCO images and merged person masks
+
+Compile once (parses annotations and rasterizes masks only this time):
+
+    python coco_cache.py data coco_512 --height 512 --width 512
+
+and then create `DataWorker('data', store_path='coco_512')`, which reads
+images and masks from memory-mapped arrays without COCO annotations.
+Store folder contains:
+    images.npy - uint8 [N, height, width, 3]
+    masks.npy - uint8 [N, height, width]
+    index.npy - image id, split, original size and file name of each row
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ('id', np.int64), ('split', np.uint8), ('height', np.int32), ('width', np.int32), ('file_name', 'U64')
+])
+SPLITS = ('train', 'test')
+
+
+class CocoStore:
+    """Read-only memory-mapped store of images and masks keyed by COCO image id"""
+
+    def __init__(self, path):
+        """
+        :path (str): folder with compiled store
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.images = np.load(os.path.join(path, 'images.npy'), mmap_mode='r')
+        self.masks = np.load(os.path.join(path, 'masks.npy'), mmap_mode='r')
+        self.index = np.load(os.path.join(path, 'index.npy'))
+        self._order = np.argsort(self.index['id'])
+        self._sorted_ids = self.index['id'][self._order]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, image_id):
+        pos = np.searchsorted(self._sorted_ids, image_id)
+        return pos < len(self._sorted_ids) and self._sorted_ids[pos] == image_id
+
+    @property
+    def shape(self):
+        return self.meta['height'], self.meta['width']
+
+    def row(self, image_id):
+        """Find row of image in arrays
+
+        :image_id (int): COCO image id
+
+        :return (int): row index
+        """
+        pos = np.searchsorted(self._sorted_ids, image_id)
+        if pos == len(self._sorted_ids) or self._sorted_ids[pos] != image_id:
+            raise KeyError('Image {} is not in store {}'.format(image_id, self.path))
+        return int(self._order[pos])
+
+    def load(self, image_id):
+        """Load resized image and mask
+
+        :image_id (int): COCO image id
+
+        :return (tuple([height, width, 3], [height, width])): image and mask views
+        """
+        row = self.row(image_id)
+        return self.images[row], self.masks[row]
+
+    def descriptions(self, split):
+        """Descriptions of stored images in COCO format
+
+        :split (str): 'train' or 'test'
+
+        :return (list of dict): descriptions with id, file_name, height and width
+        """
+        rows = self.index[self.index['split'] == SPLITS.index(split)]
+        return [
+            {'id': int(_r['id']), 'file_name': str(_r['file_name']),
+             'height': int(_r['height']), 'width': int(_r['width'])}
+            for _r in rows
+        ]
+
+
+def compile_store(worker, path, height, width, batch_size=32, num_workers=4):
+    """Resize images, merge masks and write them into store
+
+    :worker (DataWorker): data worker with parsed annotations
+    :path (str): output folder
+    :height (int): height of stored images
+    :width (int): width of stored images
+    :batch_size (int): number of images loaded by worker at once
+    :num_workers (int): number of loading processes
+
+    :return (CocoStore): compiled store
+    """
+    from data_pipeline import PrefetchLoader
+
+    os.makedirs(path, exist_ok=True)
+    descriptions = [
+        (_d, 0) for _d in list(worker.train_images) + list(worker.val_images)
+    ] + [(_d, 1) for _d in worker.test_images]
+
+    index = np.empty(len(descriptions), dtype=INDEX_DTYPE)
+    for row, (desc, split) in enumerate(descriptions):
+        index[row] = (desc['id'], split, desc['height'], desc['width'], desc['file_name'])
+    images = np.lib.format.open_memmap(
+        os.path.join(path, 'images.npy'), mode='w+', dtype=np.uint8, shape=(len(descriptions), height, width, 3)
+    )
+    masks = np.lib.format.open_memmap(
+        os.path.join(path, 'masks.npy'), mode='w+', dtype=np.uint8, shape=(len(descriptions), height, width)
+    )
+    loader = PrefetchLoader(
+        worker.batch_sequence([_d for _d, _ in descriptions], batch_size, height, width, mask_dtype=np.uint8),
+        num_workers=num_workers
+    )
+    start = 0
+    for batch_images, batch_masks in loader:
+        images[start:start + len(batch_images)] = batch_images
+        masks[start:start + len(batch_masks)] = batch_masks
+        start += len(batch_images)
+    images.flush()
+    masks.flush()
+    del images, masks
+
+    np.save(os.path.join(path, 'index.npy'), index)
+    with open(os.path.join(path, 'meta.json'), 'w') as meta_file:
+        json.dump({'height': height, 'width': width, 'category_id': worker.category_id}, meta_file)
+    return CocoStore(path)
+
+
+def main():
+    from ms_coco_data_worker import DataWorker
+
+    parser = argparse.ArgumentParser(description='Compile MS COCO person masks into memory-mapped store')
+    parser.add_argument('data_path', help='path to MS COCO dataset')
+    parser.add_argument('store_path', help='output folder')
+    parser.add_argument('--height', type=int, default=512)
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    store = compile_store(DataWorker(args.data_path), args.store_path, args.height, args.width,
+                          args.batch_size, args.workers)
+    print('Compiled {} images into {}'.format(len(store), args.store_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Compact binary index of COCO instances annotations
+
+Instances JSON is parsed only once, index is stored next to it:
+    <annotation file>.index.npz - images (id, file name, size), offsets of their
+    annotations, category, crowd flag and segmentation offset of each annotation
+    <annotation file>.segm.bin - JSON encoded segmentations, memory-mapped
+Index is rebuilt automatically when size or modification time of JSON changes.
+"""
+
+import json
+import os
+
+import numpy as np
+
+INDEX_VERSION = 1
+
+
+def annotation_to_mask(annotation, height, width):
+    """Rasterize annotation, same as `COCO.annToMask`
+
+    :annotation (dict): annotation with segmentation in polygon or RLE format
+    :height (int): height of image
+    :width (int): width of image
+
+    :return (array [height, width]): uint8 binary mask
+    """
+    from pycocotools import mask as mask_utils
+
+    segmentation = annotation['segmentation']
+    if isinstance(segmentation, list):
+        rle = mask_utils.merge(mask_utils.frPyObjects(segmentation, height, width))
+    elif isinstance(segmentation['counts'], list):
+        rle = mask_utils.frPyObjects(segmentation, height, width)
+    else:
+        rle = segmentation
+    return mask_utils.decode(rle)
+
+
+class CocoIndex:
+    """Lazily loaded index of one COCO instances file"""
+
+    def __init__(self, annotation_file, index_prefix=None):
+        """
+        :annotation_file (str): path to instances JSON
+        :index_prefix (str): prefix of index files, by default path to JSON
+        """
+        self.annotation_file = annotation_file
+        prefix = annotation_file if index_prefix is None else index_prefix
+        self.index_file = prefix + '.index.npz'
+        self.segmentation_file = prefix + '.segm.bin'
+        self._index = None
+        self._segmentations = None
+
+    def _source_signature(self):
+        stat = os.stat(self.annotation_file)
+        return np.array([INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _is_valid(self):
+        if not os.path.exists(self.index_file) or not os.path.exists(self.segmentation_file):
+            return False
+        with np.load(self.index_file) as index:
+            return np.array_equal(index['signature'], self._source_signature())
+
+    def build(self):
+        """Parse instances JSON and write index files"""
+        with open(self.annotation_file) as annotation_file:
+            data = json.load(annotation_file)
+        images = sorted(data['images'], key=lambda _i: _i['id'])
+        image_ids = np.array([_i['id'] for _i in images], dtype=np.int64)
+        annotations = sorted(data['annotations'], key=lambda _a: (_a['image_id'], _a['id']))
+        del data
+
+        ann_image_ids = np.array([_a['image_id'] for _a in annotations], dtype=np.int64)
+        segmentation_offsets = np.zeros(len(annotations) + 1, dtype=np.int64)
+        with open(self.segmentation_file, 'wb') as segmentation_file:
+            for i, annotation in enumerate(annotations):
+                encoded = json.dumps(annotation['segmentation'], separators=(',', ':')).encode()
+                segmentation_file.write(encoded)
+                segmentation_offsets[i + 1] = segmentation_offsets[i] + len(encoded)
+
+        np.savez(
+            self.index_file,
+            signature=self._source_signature(),
+            image_ids=image_ids,
+            file_names=np.array([_i['file_name'] for _i in images]),
+            heights=np.array([_i['height'] for _i in images], dtype=np.int32),
+            widths=np.array([_i['width'] for _i in images], dtype=np.int32),
+            # annotations of image i are rows image_offsets[i]:image_offsets[i + 1]
+            image_offsets=np.searchsorted(ann_image_ids, np.append(image_ids, np.iinfo(np.int64).max)),
+            ann_ids=np.array([_a['id'] for _a in annotations], dtype=np.int64),
+            category_ids=np.array([_a['category_id'] for _a in annotations], dtype=np.int32),
+            iscrowd=np.array([_a['iscrowd'] for _a in annotations], dtype=np.uint8),
+            segmentation_offsets=segmentation_offsets
+        )
+        self._index = None
+        self._segmentations = None
+
+    @property
+    def index(self):
+        """Arrays of index, built or loaded on first access
+
+        :return (dict): arrays of index
+        """
+        if self._index is None:
+            if not self._is_valid():
+                self.build()
+            with np.load(self.index_file) as index:
+                self._index = {_k: index[_k] for _k in index.files}
+            self._segmentations = np.memmap(self.segmentation_file, dtype=np.uint8, mode='r') \
+                if self._index['segmentation_offsets'][-1] > 0 else np.empty(0, dtype=np.uint8)
+        return self._index
+
+    def _position(self, image_id):
+        image_ids = self.index['image_ids']
+        pos = np.searchsorted(image_ids, image_id)
+        if pos == len(image_ids) or image_ids[pos] != image_id:
+            return None
+        return int(pos)
+
+    def __contains__(self, image_id):
+        return self._position(image_id) is not None
+
+    def __len__(self):
+        return len(self.index['image_ids'])
+
+    def image_ids(self, category_id=None):
+        """Ids of images with at least one annotation of category
+
+        :category_id (int): COCO category id, all images if None
+
+        :return (array): sorted image ids
+        """
+        index = self.index
+        if category_id is None:
+            return index['image_ids']
+        rows = np.nonzero(index['category_ids'] == category_id)[0]
+        positions = np.unique(np.searchsorted(index['image_offsets'], rows, side='right') - 1)
+        return index['image_ids'][positions]
+
+    def descriptions(self, category_id=None):
+        """Descriptions of images in format of `COCO.loadImgs`
+
+        :category_id (int): COCO category id, all images if None
+
+        :return (list of dict): descriptions with id, file_name, height and width
+        """
+        index = self.index
+        positions = np.searchsorted(index['image_ids'], self.image_ids(category_id))
+        return [
+            {'id': int(index['image_ids'][_p]), 'file_name': str(index['file_names'][_p]),
+             'height': int(index['heights'][_p]), 'width': int(index['widths'][_p])}
+            for _p in positions
+        ]
+
+    def annotations(self, image_id, category_id=None, iscrowd=None):
+        """Annotations of image in format of `COCO.loadAnns`
+
+        :image_id (int): COCO image id
+        :category_id (int): keep only annotations of category, all if None
+        :iscrowd (bool): keep only crowd or only non-crowd annotations, all if None
+
+        :return (list of dict): annotations with id, category_id, iscrowd and segmentation
+        """
+        index = self.index
+        pos = self._position(image_id)
+        if pos is None:
+            raise KeyError('Image {} is not in {}'.format(image_id, self.annotation_file))
+        result = []
+        for row in range(index['image_offsets'][pos], index['image_offsets'][pos + 1]):
+            if category_id is not None and index['category_ids'][row] != category_id:
+                continue
+            if iscrowd is not None and bool(index['iscrowd'][row]) != bool(iscrowd):
+                continue
+            start, end = index['segmentation_offsets'][row:row + 2]
+            result.append({
+                'id': int(index['ann_ids'][row]),
+                'image_id': int(image_id),
+                'category_id': int(index['category_ids'][row]),
+                'iscrowd': int(index['iscrowd'][row]),
+                'segmentation': json.loads(self._segmentations[start:end].tobytes().decode())
+            })
+        return result
@@ -0,0 +1,208 @@
+"""Multiprocess prefetching of batches
+
+Batches are produced by pool of forked worker processes and written into
+ring of shared memory buffers, so decoded arrays are never pickled.
+Any object with `__len__` and `__getitem__(idx)` returning tuple of arrays
+can be loaded, e.g. `PascalVocGenerator` or `DataWorker.batch_sequence`:
+
+    loader = PrefetchLoader(train_generator, num_workers=4, prefetch=8)
+    for images, masks in loader:
+        ...
+    print(loader.stats)
+"""
+
+import multiprocessing as mp
+import queue
+import random
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+
+class IndexedBatches:
+    """Indexable collection of batches defined by loading function"""
+
+    def __init__(self, load_batch, length):
+        """
+        :load_batch (callable): function of batch index returning tuple of arrays
+        :length (int): number of batches
+        """
+        self.load_batch = load_batch
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        if idx < 0 or idx >= self.length:
+            raise IndexError('Batch index {} is out of range'.format(idx))
+        return self.load_batch(idx)
+
+
+def _seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+
+def _buffer_views(raw_buffers, specs):
+    return [np.frombuffer(_raw, dtype=_dtype).reshape(_shape) for _raw, (_shape, _dtype) in zip(raw_buffers, specs)]
+
+
+def _worker_loop(dataset, slots, specs, tasks, results, seed, worker_id):
+    _seed_everything(seed + worker_id)
+    views = [_buffer_views(_slot, specs) for _slot in slots]
+    while True:
+        start = time.perf_counter()
+        task = tasks.get()
+        idle = time.perf_counter() - start
+        if task is None:
+            break
+        idx, slot, epoch = task
+        try:
+            # batch seed does not depend on which worker got the batch
+            _seed_everything(seed + epoch * len(dataset) + idx)
+            start = time.perf_counter()
+            batch = dataset[idx]
+            size = len(batch[0])
+            for _view, _array in zip(views[slot], batch):
+                _view[:size] = _array
+            results.put((idx, slot, size, time.perf_counter() - start, idle, None))
+        except Exception:
+            results.put((idx, slot, 0, 0., idle, traceback.format_exc()))
+    # do not block exit on results which nobody will read
+    results.cancel_join_thread()
+
+
+class PrefetchLoader:
+    """Load batches of dataset in background processes"""
+
+    def __init__(self, dataset, num_workers=4, prefetch=8, seed=7, timeout=600):
+        """
+        :dataset (Sequence): object with __len__ and __getitem__ returning tuple of arrays
+        :num_workers (int): number of worker processes
+        :prefetch (int): number of shared buffers, i.e. maximum number of ready batches
+        :seed (int): base random seed, each batch is loaded with its own derived seed
+        :timeout (int): seconds to wait for single batch before failing
+        """
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.prefetch = max(prefetch, num_workers)
+        self.seed = seed
+        self.timeout = timeout
+        self.epoch = 0
+        self._context = mp.get_context('fork')
+        self._specs = None
+        self._slots = None
+        self._stats = None
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _allocate(self):
+        # probe batch defines shapes of buffers, only batch axis may be shorter later
+        sample = self.dataset[0]
+        self._specs = [(np.shape(_a), np.asarray(_a).dtype) for _a in sample]
+        self._slots = [
+            [self._context.RawArray('b', max(1, int(np.prod(_shape)) * _dtype.itemsize))
+             for _shape, _dtype in self._specs]
+            for _ in range(self.prefetch)
+        ]
+
+    def __iter__(self):
+        """Iterate over one epoch,
+        yielded arrays are views of shared buffers valid until next batch is requested
+
+        :return (generator): generator of tuples of arrays
+        """
+        if self._slots is None:
+            self._allocate()
+        tasks = self._context.Queue()
+        results = self._context.Queue()
+        workers = [
+            self._context.Process(
+                target=_worker_loop,
+                args=(self.dataset, self._slots, self._specs, tasks, results, self.seed, _w),
+                daemon=True
+            ) for _w in range(self.num_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        views = [_buffer_views(_slot, self._specs) for _slot in self._slots]
+        free_slots = deque(range(self.prefetch))
+        ready = {}
+        next_task, next_batch = 0, 0
+        stats = {'images': 0, 'batches': 0, 'load_time': 0., 'worker_idle': 0., 'queue_depth': []}
+        start = time.perf_counter()
+        try:
+            while next_batch < len(self.dataset):
+                while free_slots and next_task < len(self.dataset):
+                    tasks.put((next_task, free_slots.popleft(), self.epoch))
+                    next_task += 1
+                while next_batch not in ready:
+                    try:
+                        idx, slot, size, load_time, idle, error = results.get(timeout=self.timeout)
+                    except queue.Empty:
+                        raise RuntimeError('No batch from workers in {} seconds'.format(self.timeout))
+                    if error is not None:
+                        raise RuntimeError('Worker failed on batch {}:\n{}'.format(idx, error))
+                    ready[idx] = (slot, size)
+                    stats['load_time'] += load_time
+                    stats['worker_idle'] += idle
+                stats['queue_depth'].append(len(ready) - 1)
+                slot, size = ready.pop(next_batch)
+                stats['images'] += size
+                stats['batches'] += 1
+                yield tuple(_view[:size] for _view in views[slot])
+                free_slots.append(slot)
+                next_batch += 1
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
+            stats['elapsed'] = time.perf_counter() - start
+            self._stats = stats
+            self.epoch += 1
+
+    def repeat(self, copy=True):
+        """Endless generator over epochs for keras `fit_generator`,
+        calls `on_epoch_end` of dataset between epochs
+
+        :copy (bool): copy batches out of shared buffers, required when
+        consumer keeps several batches at once (e.g. keras with workers)
+
+        :return (generator): generator of tuples of arrays
+        """
+        while True:
+            for batch in self:
+                yield tuple(_a.copy() for _a in batch) if copy else batch
+            if hasattr(self.dataset, 'on_epoch_end'):
+                self.dataset.on_epoch_end()
+
+    @property
+    def stats(self):
+        """Throughput statistics of last finished epoch
+
+        :return (dict): images per second, queue depth and worker idle time
+        """
+        if self._stats is None:
+            return {}
+        stats = self._stats
+        elapsed = max(stats['elapsed'], 1e-12)
+        depth = stats['queue_depth'] or [0]
+        return {
+            'images': stats['images'],
+            'batches': stats['batches'],
+            'elapsed': stats['elapsed'],
+            'images_per_second': stats['images'] / elapsed,
+            'mean_queue_depth': float(np.mean(depth)),
+            'max_queue_depth': int(np.max(depth)),
+            'worker_idle': stats['worker_idle'],
+            'worker_idle_fraction': stats['worker_idle'] / (elapsed * self.num_workers),
+            'mean_batch_load_time': stats['load_time'] / max(stats['batches'], 1)
+        }
@@ -0,0 +1,266 @@
+"""Evaluation of several models in one pass over Pascal VOC
+
+Every image is decoded once and fanned out to all models, each model runs in
+its own thread (sessions and interpreters release GIL). Resized and
+normalized inputs are kept in `LRUCache` by (image, resolution,
+normalization, type), so models of the same input size share preprocessing.
+Predicted label maps are stored as PNG at output resolution of every model,
+so metrics can be recomputed later without inference:
+
+    python ensemble.py run /data/VOC2012 --output-dir predictions \\
+        --model icnet ICNet/ICNet_256x256.pb 256x256 none image:0 predictions/ResizeBilinear:0 \\
+        --model enet ENet/ENet_256x256.tflite 256x256 imagenet
+    python ensemble.py score /data/VOC2012 --output-dir predictions
+
+Predictions are compared with ground truth of original resolution, they are
+resized by nearest neighbour, so models of different input sizes are comparable.
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import cv2
+import numpy as np
+
+from caching import LRUCache
+from inference import NORMALIZATIONS, load_runner, normalize_batch
+from metrics import ConfusionMatrix
+from pascal_voc_data import PascalVocGenerator
+from postprocessing import to_labels
+
+
+def voc_names(voc_path, split):
+    with open(join(voc_path, 'ImageSets', 'Segmentation', split + '.txt')) as names_file:
+        return [_line.strip() for _line in names_file if _line.strip()]
+
+
+def decode(voc_path, name):
+    """Image and labels of original size
+
+    :voc_path (str): path to VOC2012 folder
+    :name (str): name of image
+
+    :return (tuple(array [H, W, 3], array [H, W])): uint8 RGB image and labels
+    """
+    image = cv2.imread(join(voc_path, 'JPEGImages', name + '.jpg'))[:, :, ::-1]
+    mask = cv2.imread(join(voc_path, 'SegmentationClass', name + '.png'))[:, :, ::-1]
+    return np.ascontiguousarray(image), PascalVocGenerator.codec.encode(mask)
+
+
+class PredictionStore:
+    """Label maps of one model, one lossless PNG per image"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        return join(self.directory, name + '.png')
+
+    def save(self, name, labels):
+        cv2.imwrite(self.path(name), labels)
+
+    def load(self, name):
+        labels = cv2.imread(self.path(name), cv2.IMREAD_GRAYSCALE)
+        if labels is None:
+            raise IOError('Cannot read prediction {}'.format(self.path(name)))
+        return labels
+
+    def names(self):
+        return sorted(os.path.splitext(_f)[0] for _f in os.listdir(self.directory) if _f.endswith('.png'))
+
+
+def _confusion(gt, pred, num_classes):
+    if pred.shape != gt.shape:
+        pred = cv2.resize(pred, (gt.shape[1], gt.shape[0]), interpolation=cv2.INTER_NEAREST)
+    return ConfusionMatrix(num_classes).update(gt[np.newaxis], pred[np.newaxis])
+
+
+class _ModelWorker:
+    # runner is used by single thread, so latencies and confusion need no locks
+
+    def __init__(self, config, store, num_classes):
+        self.config = config
+        self.runner = load_runner(config['path'], config.get('input'), config.get('output'), config.get('threads'))
+        self.executor = ThreadPoolExecutor(1)
+        self.store = store
+        self.confusion = ConfusionMatrix(num_classes)
+        self.latencies = []
+
+    def _process(self, name, inputs, gt):
+        start = time.perf_counter()
+        pred = self.runner.predict(inputs)
+        self.latencies.append(time.perf_counter() - start)
+        labels = to_labels(pred)[0]
+        self.store.save(name, labels)
+        self.confusion.merge(_confusion(gt, labels, self.confusion.num_classes))
+
+    def submit(self, name, inputs, gt):
+        return self.executor.submit(self._process, name, inputs, gt)
+
+    def close(self):
+        self.executor.shutdown()
+        self.runner.close()
+
+
+def run(models, voc_path, names, output_dir, cache_bytes=512 * 2 ** 20, decode_workers=2, max_pending=8,
+        num_classes=21):
+    """Run all models over images and store their predictions
+
+    :models (list of dict): 'name', 'path', 'height', 'width', 'normalization' and optional
+    'input', 'output' (tensors of frozen graph) and 'threads' of every model
+    :voc_path (str): path to VOC2012 folder
+    :names (list of str): names of images
+    :output_dir (str): folder of predictions, one subfolder per model
+    :cache_bytes (int): memory of cache of preprocessed inputs
+    :decode_workers (int): number of decoding threads
+    :max_pending (int): maximum number of images being processed by models
+    :num_classes (int): number of classes
+
+    :return (dict): metrics and latency of every model, cache and pipeline statistics
+    """
+    cache = LRUCache(cache_bytes)
+    workers = {}
+    try:
+        for config in models:
+            workers[config['name']] = _ModelWorker(config, PredictionStore(join(output_dir, config['name'])),
+                                                   num_classes)
+        with open(join(output_dir, 'models.json'), 'w') as models_file:
+            json.dump(models, models_file, indent=2)
+
+        decoder = ThreadPoolExecutor(decode_workers)
+        decoded = deque(decoder.submit(decode, voc_path, _name) for _name in names[:max_pending])
+        pending = deque()
+        start, decode_wait = time.perf_counter(), 0.
+        for idx, name in enumerate(names):
+            wait_start = time.perf_counter()
+            image, gt = decoded.popleft().result()
+            decode_wait += time.perf_counter() - wait_start
+            if idx + max_pending < len(names):
+                decoded.append(decoder.submit(decode, voc_path, names[idx + max_pending]))
+            for config in models:
+                worker = workers[config['name']]
+                height, width, normalization = config['height'], config['width'], config['normalization']
+                dtype = worker.runner.input_dtype
+                inputs = cache.get_or_compute(
+                    (name, (height, width), normalization, np.dtype(dtype).str),
+                    lambda: normalize_batch(cv2.resize(image, (width, height))[np.newaxis], normalization, dtype)
+                )
+                pending.append(worker.submit(name, inputs, gt))
+            while len(pending) > max_pending * len(models):
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+        elapsed = time.perf_counter() - start
+        decoder.shutdown()
+    finally:
+        for worker in workers.values():
+            worker.close()
+
+    report = {'models': {}, 'cache': cache.stats, 'pipeline': {
+        'images': len(names), 'seconds': elapsed, 'images_per_second': len(names) / elapsed,
+        'decode_wait_seconds': decode_wait
+    }}
+    for name, worker in workers.items():
+        latencies = np.array(worker.latencies)
+        report['models'][name] = {
+            'metrics': worker.confusion.summary(list(PascalVocGenerator.classes)),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p90_ms': float(np.percentile(latencies, 90) * 1000),
+            'images_per_second': float(len(latencies) / latencies.sum())
+        }
+    return report
+
+
+def score(voc_path, output_dir, num_classes=21):
+    """Recompute metrics from stored predictions without inference
+
+    Only images predicted by all models are scored, so metrics stay comparable
+    after interrupted run; number of skipped images of every model is printed.
+
+    :voc_path (str): path to VOC2012 folder
+    :output_dir (str): folder of predictions written by `run`
+    :num_classes (int): number of classes
+
+    :return (dict): metrics of every model
+    """
+    with open(join(output_dir, 'models.json')) as models_file:
+        models = [_m['name'] for _m in json.load(models_file)]
+    stores = {_name: PredictionStore(join(output_dir, _name)) for _name in models}
+    confusions = {_name: ConfusionMatrix(num_classes) for _name in models}
+    stored = {_name: set(_store.names()) for _name, _store in stores.items()}
+    names = sorted(set.intersection(*stored.values()))
+    for model in models:
+        if len(stored[model]) > len(names):
+            print('Skipped {} of {} predictions of {}, other models miss them'.format(
+                len(stored[model]) - len(names), len(stored[model]), model))
+    for name in names:
+        _, gt = decode(voc_path, name)
+        for model in models:
+            confusions[model].merge(_confusion(gt, stores[model].load(name), num_classes))
+    return {_name: _c.summary(list(PascalVocGenerator.classes)) for _name, _c in confusions.items()}
+
+
+def parse_model(values):
+    if len(values) not in (4, 6):
+        raise argparse.ArgumentTypeError('Model is NAME PATH HEIGHTxWIDTH NORMALIZATION [INPUT OUTPUT]')
+    height, width = map(int, values[2].lower().split('x'))
+    if values[3] not in NORMALIZATIONS:
+        raise argparse.ArgumentTypeError('Unknown normalization: {}'.format(values[3]))
+    config = {'name': values[0], 'path': values[1], 'height': height, 'width': width, 'normalization': values[3]}
+    if len(values) == 6:
+        config.update({'input': values[4], 'output': values[5]})
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate several models in one pass over Pascal VOC')
+    parser.add_argument('command', choices=('run', 'score'))
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--output-dir', default='predictions')
+    parser.add_argument('--model', nargs='+', action='append', default=[],
+                        help='NAME PATH HEIGHTxWIDTH NORMALIZATION [INPUT OUTPUT], may be repeated')
+    parser.add_argument('--split', default='val', help='name of file in ImageSets/Segmentation')
+    parser.add_argument('--samples', type=int, default=0, help='number of images, 0 for all')
+    parser.add_argument('--threads', type=int, default=None, help='inference threads of every model')
+    parser.add_argument('--cache-mb', type=int, default=512)
+    parser.add_argument('--decode-workers', type=int, default=2)
+    parser.add_argument('--json', default=None, help='file to write report into')
+    args = parser.parse_args()
+
+    if args.command == 'score':
+        report = {'models': {_n: {'metrics': _m} for _n, _m in score(args.voc_path, args.output_dir).items()}}
+    else:
+        try:
+            models = [parse_model(_values) for _values in args.model]
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+        if not models:
+            parser.error('at least one --model is required')
+        for config in models:
+            config['threads'] = args.threads
+        names = voc_names(args.voc_path, args.split)
+        names = names[:args.samples] if args.samples else names
+        report = run(models, args.voc_path, names, args.output_dir, args.cache_mb * 2 ** 20, args.decode_workers)
+        print('{images} images in {seconds:.1f} s, {images_per_second:.2f} img/s'.format(**report['pipeline']))
+        print('cache: {items} items, {mb:.1f} mb, hit rate {hit_rate:.2f}'.format(**report['cache']))
+
+    print('| Model        | mIoU  | Pixel accuracy | p50 (ms) |')
+    print('|--------------|-------|----------------|----------|')
+    for name, result in report['models'].items():
+        print('| {:12} | {:.3f} | {:14.3f} | {:>8} |'.format(
+            name, result['metrics']['mean_iou'], result['metrics']['pixel_accuracy'],
+            '{:.2f}'.format(result['p50_ms']) if 'p50_ms' in result else '-'
+        ))
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Evaluation of model on Pascal VOC with separate latency and accuracy
+
+Images are decoded by `PrefetchLoader` workers, model runs in main process
+and its predictions are sent as uint8 label maps to pool of processes
+which accumulate `ConfusionMatrix`, so only inference call is timed as
+model latency and post-processing never blocks it.
+
+Example:
+    python evaluate.py DeepLabV3/DeepLab_V3_513_CPU.pb /data/VOC2012 --height 513 --width 513 \\
+        --input ImageTensor:0 --output SemanticPredictions:0 --json deeplab.json
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+from collections import deque
+from os.path import join
+
+import cv2
+import numpy as np
+
+from data_pipeline import PrefetchLoader
+from inference import NORMALIZATIONS, load_runner, normalize_batch
+from metrics import ConfusionMatrix
+from pascal_voc_data import PascalVocGenerator
+from postprocessing import to_labels
+
+
+def _batch_confusion(batch_gt, batch_pred, num_classes, ignore_index):
+    if batch_pred.shape != batch_gt.shape:
+        # models with smaller output are compared on resolution of ground truth
+        batch_pred = np.array([
+            cv2.resize(_p, (batch_gt.shape[2], batch_gt.shape[1]), interpolation=cv2.INTER_NEAREST)
+            for _p in batch_pred
+        ])
+    return ConfusionMatrix(num_classes, ignore_index).update(batch_gt, batch_pred).matrix
+
+
+def evaluate(load_model, dataset, normalization='none', num_classes=21, ignore_index=255, loader_workers=4,
+             metric_workers=2, max_pending=16, warmup=1):
+    """Run model over dataset once and compute metrics in parallel
+
+    :load_model (callable): function without arguments returning runner, e.g. `inference.load_runner`,
+    it is called after all processes are forked, so they do not inherit tensorflow threads
+    :dataset (Sequence): batches of uint8 images and label maps, e.g. sparse `PascalVocGenerator`
+    :normalization (str): one of `inference.NORMALIZATIONS`
+    :num_classes (int): number of classes
+    :ignore_index (int): label excluded from metrics
+    :loader_workers (int): number of decoding processes
+    :metric_workers (int): number of processes computing confusion matrices
+    :max_pending (int): maximum number of batches waiting for metric workers
+    :warmup (int): number of first batches excluded from latency statistics
+
+    :return (dict): metrics, model latency and pipeline throughput
+    """
+    pool = mp.get_context('fork').Pool(metric_workers)
+    loader = PrefetchLoader(dataset, num_workers=loader_workers)
+    batches = iter(loader)
+    confusion = ConfusionMatrix(num_classes, ignore_index)
+    pending = deque()
+    latencies, batch_sizes = [], []
+    data_wait, metric_wait = 0., 0.
+    runner = None
+    try:
+        # first batch starts loader processes
+        first_batch = next(batches)
+        runner = load_model()
+        start = time.perf_counter()
+        while True:
+            wait_start = time.perf_counter()
+            if first_batch is not None:
+                (images, labels), first_batch = first_batch, None
+            else:
+                try:
+                    images, labels = next(batches)
+                except StopIteration:
+                    break
+            data_wait += time.perf_counter() - wait_start
+
+            inputs = normalize_batch(images, normalization, runner.input_dtype)
+            model_start = time.perf_counter()
+            pred = runner.predict(inputs)
+            latencies.append(time.perf_counter() - model_start)
+            batch_sizes.append(len(images))
+
+            # labels are copied out of shared buffer before it is reused by loader
+            pending.append(pool.apply_async(
+                _batch_confusion, (labels[..., 0].copy(), to_labels(pred), num_classes, ignore_index)
+            ))
+            wait_start = time.perf_counter()
+            while len(pending) > max_pending or (pending and pending[0].ready()):
+                confusion.merge(pending.popleft().get())
+            metric_wait += time.perf_counter() - wait_start
+        while pending:
+            confusion.merge(pending.popleft().get())
+    finally:
+        pool.terminate()
+        if runner is not None:
+            runner.close()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies[warmup:] if len(latencies) > warmup else latencies)
+    images_num = int(np.sum(batch_sizes))
+    timed_images = int(np.sum(batch_sizes[-len(latencies):]))
+    return {
+        'metrics': confusion.summary(list(PascalVocGenerator.classes)),
+        'model': {
+            'batches': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p90_ms': float(np.percentile(latencies, 90) * 1000),
+            'p99_ms': float(np.percentile(latencies, 99) * 1000),
+            'images_per_second': float(timed_images / latencies.sum())
+        },
+        'pipeline': {
+            'images': images_num,
+            'seconds': elapsed,
+            'images_per_second': images_num / elapsed,
+            'data_wait_seconds': data_wait,
+            'metric_wait_seconds': metric_wait,
+            'loader': loader.stats
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pascal VOC evaluation of .pb and .tflite models')
+    parser.add_argument('model', help='path to .pb or .tflite file')
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--split', default='trainval', help='name of file in ImageSets/Segmentation')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--input', default=None, help='input tensor of frozen graph')
+    parser.add_argument('--output', default=None, help='output tensor of frozen graph')
+    parser.add_argument('--normalization', default='none', choices=NORMALIZATIONS)
+    parser.add_argument('--threads', type=int, default=None, help='inference threads, tensorflow default if None')
+    parser.add_argument('--loader-workers', type=int, default=4)
+    parser.add_argument('--metric-workers', type=int, default=2)
+    parser.add_argument('--json', default=None, help='file to write results into')
+    args = parser.parse_args()
+
+    dataset = PascalVocGenerator(
+        join(args.voc_path, 'ImageSets', 'Segmentation', args.split + '.txt'),
+        join(args.voc_path, 'JPEGImages'),
+        join(args.voc_path, 'SegmentationClass'),
+        args.batch_size, (args.width, args.height), target='sparse'
+    )
+    report = evaluate(
+        lambda: load_runner(args.model, args.input, args.output, threads=args.threads), dataset,
+        args.normalization, loader_workers=args.loader_workers, metric_workers=args.metric_workers
+    )
+
+    model, pipeline = report['model'], report['pipeline']
+    print('mIoU {:.4f}, pixel accuracy {:.4f}'.format(
+        report['metrics']['mean_iou'], report['metrics']['pixel_accuracy']
+    ))
+    print('model: p50 {p50_ms:.2f} ms, p90 {p90_ms:.2f} ms, p99 {p99_ms:.2f} ms, '
+          '{images_per_second:.2f} img/s'.format(**model))
+    print('pipeline: {images} images in {seconds:.1f} s, {images_per_second:.2f} img/s, '
+          'waited {data_wait_seconds:.1f} s for data and {metric_wait_seconds:.1f} s for metrics'.format(**pipeline))
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Fold inference-mode BatchNormalization into neighbouring convolutions
+
+At inference BatchNormalization is per-channel affine transformation:
+    y = scale * x + shift, scale = gamma / sqrt(variance + eps), shift = beta - mean * scale
+so it is removed from graph by rewriting weights of convolution:
+    - before it (backward), if convolution has no activation (ENet bottlenecks,
+      projections of IC-Net), then following ReLU becomes activation of convolution;
+    - after it (forward), if convolution does not pad its input (IC-Net applies
+      BatchNormalization after ReLU, so it is folded into next 1x1 convolution),
+      since zero padding of normalized input is not zero before normalization.
+Other layers are reused, so folded model shares their weights with source one.
+
+    python fold_batchnorm.py icnet ICNet/weights.h5 --height 256 --width 256 --pb ICNet_folded.pb
+"""
+
+import argparse
+import time
+
+import keras.backend as K
+import numpy as np
+import tensorflow as tf
+from keras.layers import Activation, BatchNormalization, Conv2D, Conv2DTranspose, Input, ReLU
+from keras.models import Model
+
+
+def _inbound_nodes(layer):
+    # attribute is private since keras 2.1.3
+    return getattr(layer, '_inbound_nodes', None) or layer.inbound_nodes
+
+
+def _node_inputs(layer):
+    node = _inbound_nodes(layer)[0]
+    return list(zip(node.inbound_layers, node.node_indices, node.tensor_indices))
+
+
+def _consumers(model):
+    consumers = {}
+    for layer in model.layers:
+        for inbound_layer, _, _ in _node_inputs(layer):
+            consumers.setdefault(inbound_layer.name, []).append(layer)
+    for output in model.outputs:
+        # model output is consumed by user, so it can not be removed
+        consumers.setdefault(output._keras_history[0].name, []).append(None)
+    return consumers
+
+
+def batchnorm_affine(layer):
+    """Per-channel scale and shift of BatchNormalization in inference mode
+
+    :layer (BatchNormalization): normalization over last axis
+
+    :return (tuple(array [C], array [C])): scale and shift
+    """
+    mean = K.get_value(layer.moving_mean)
+    variance = K.get_value(layer.moving_variance)
+    gamma = K.get_value(layer.gamma) if layer.gamma is not None else np.ones_like(mean)
+    beta = K.get_value(layer.beta) if layer.beta is not None else np.zeros_like(mean)
+    scale = gamma / np.sqrt(variance + layer.epsilon)
+    return scale, beta - mean * scale
+
+
+def _is_linear(layer):
+    return layer.get_config().get('activation') == 'linear'
+
+
+def _is_relu(layer):
+    if isinstance(layer, ReLU):
+        config = layer.get_config()
+        return not config.get('max_value') and not config.get('negative_slope') and not config.get('threshold')
+    return isinstance(layer, Activation) and layer.get_config()['activation'] == 'relu'
+
+
+def _pads_input(layer):
+    return layer.padding == 'same' and any(_k > 1 for _k in layer.kernel_size)
+
+
+def plan_folding(model):
+    """Find BatchNormalization layers which can be folded
+
+    :model (keras.Model): model built of layers applied once
+
+    :return (dict): folds by name of convolution, each of them is
+    dict with 'batchnorm', 'direction' ('backward' or 'forward') and 'relu' (merged activation or None)
+    """
+    consumers = _consumers(model)
+    folds = {}
+    for layer in model.layers:
+        if not isinstance(layer, BatchNormalization) or np.ndim(layer.axis) or layer.axis not in (-1, 3):
+            continue
+        (source, _, _), = _node_inputs(layer)
+        targets = consumers.get(layer.name, [])
+        # exact types, DepthwiseConv2D is subclass of Conv2D with other kernel layout
+        if type(source) in (Conv2D, Conv2DTranspose) and _is_linear(source) and source.name not in folds \
+                and consumers[source.name] == [layer]:
+            relu = targets[0] if len(targets) == 1 and targets[0] is not None and _is_relu(targets[0]) else None
+            folds[source.name] = {'batchnorm': layer, 'direction': 'backward', 'relu': relu}
+        elif len(targets) == 1 and type(targets[0]) is Conv2D and targets[0].name not in folds \
+                and not _pads_input(targets[0]):
+            folds[targets[0].name] = {'batchnorm': layer, 'direction': 'forward', 'relu': None}
+    return folds
+
+
+def folded_weights(conv, batchnorm, direction):
+    """Kernel and bias of convolution with folded normalization
+
+    :conv (Conv2D or Conv2DTranspose): convolution
+    :batchnorm (BatchNormalization): normalization before or after convolution
+    :direction (str): 'backward' if normalization is after convolution, 'forward' if before
+
+    :return (tuple(array, array)): kernel and bias
+    """
+    weights = conv.get_weights()
+    kernel = weights[0]
+    bias = weights[1] if conv.use_bias else np.zeros(conv.filters, dtype=kernel.dtype)
+    scale, shift = batchnorm_affine(batchnorm)
+    # kernel of Conv2D is [h, w, in, out], of Conv2DTranspose is [h, w, out, in]
+    out_axis = 2 if isinstance(conv, Conv2DTranspose) else 3
+    if direction == 'backward':
+        shape = [1, 1, 1, 1]
+        shape[out_axis] = -1
+        return kernel * scale.reshape(shape), bias * scale + shift
+    return kernel * scale.reshape(1, 1, -1, 1), bias + np.einsum('hwio,i->o', kernel, shift)
+
+
+def fold_batchnorm(model):
+    """Build model without foldable BatchNormalization layers
+
+    :model (keras.Model): source model, every layer is applied once
+
+    :return (tuple(keras.Model, dict)): folded model and applied folds
+    """
+    folds = plan_folding(model)
+    removed = set()
+    for fold in folds.values():
+        removed.add(fold['batchnorm'].name)
+        if fold['relu'] is not None:
+            removed.add(fold['relu'].name)
+
+    tensors = {}
+    for layer in model.layers:
+        if not _node_inputs(layer):
+            tensors[layer.name] = [Input(batch_shape=layer.batch_input_shape, dtype=layer.dtype, name=layer.name)]
+            continue
+        inputs = [tensors[_l.name][_t] for _l, _, _t in _node_inputs(layer)]
+        inputs = inputs[0] if len(inputs) == 1 else inputs
+        if layer.name in removed:
+            outputs = inputs
+        elif layer.name in folds:
+            fold = folds[layer.name]
+            config = layer.get_config()
+            config['use_bias'] = True
+            if fold['relu'] is not None:
+                config['activation'] = 'relu'
+            new_layer = layer.__class__.from_config(config)
+            outputs = new_layer(inputs)
+            new_layer.set_weights(folded_weights(layer, fold['batchnorm'], fold['direction']))
+        else:
+            outputs = layer(inputs)
+        tensors[layer.name] = outputs if isinstance(outputs, list) else [outputs]
+
+    outputs = [tensors[_o._keras_history[0].name][_o._keras_history[2]] for _o in model.outputs]
+    inputs = [tensors[_i._keras_history[0].name][0] for _i in model.inputs]
+    return Model(inputs=inputs, outputs=outputs), folds
+
+
+def max_difference(model, folded, inputs):
+    """Maximum absolute difference of outputs of models
+
+    :model (keras.Model): source model
+    :folded (keras.Model): folded model
+    :inputs (array): sample inputs
+
+    :return (float): maximum absolute difference
+    """
+    expected, actual = model.predict(inputs), folded.predict(inputs)
+    if not isinstance(expected, list):
+        expected, actual = [expected], [actual]
+    return max(float(np.max(np.abs(_e - _a))) for _e, _a in zip(expected, actual))
+
+
+def op_count(model):
+    """Number of graph operations required to compute outputs of model
+
+    :model (keras.Model): model in default session
+
+    :return (int): number of operations
+    """
+    graph_def = K.get_session().graph.as_graph_def()
+    return len(tf.graph_util.extract_sub_graph(graph_def, [_o.op.name for _o in model.outputs]).node)
+
+
+def custom_objects():
+    """Layers and functions of this repo referenced by saved models
+
+    :return (dict): objects for `keras.models.load_model`
+    """
+    from ENet.pooling_layers import MaxPoolingWithArgmax2D, MaxUnpooling2D
+    from ICNet.model import interp
+
+    return {'tf': tf, 'interp': interp, 'MaxPoolingWithArgmax2D': MaxPoolingWithArgmax2D,
+            'MaxUnpooling2D': MaxUnpooling2D}
+
+
+def latency(model, inputs, warmup=5, iterations=30):
+    for _ in range(warmup):
+        model.predict(inputs)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        model.predict(inputs)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold BatchNormalization of IC-Net into convolutions')
+    parser.add_argument('source', choices=('icnet', 'keras'), help='IC-Net weights or full keras model file')
+    parser.add_argument('model', help='path to weights of IC-Net or to keras model')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--samples', type=int, default=4, help='number of random inputs for equivalence check')
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--keras', default=None, help='path to save folded keras model')
+    parser.add_argument('--pb', default=None, help='path to save folded frozen graph')
+    parser.add_argument('--tflite', default=None, help='path to save folded tflite model')
+    args = parser.parse_args()
+
+    K.set_learning_phase(0)
+    if args.source == 'icnet':
+        from ICNet.model import build_bn
+
+        model = build_bn(args.width, args.height, 21, weights_path=args.model)
+    else:
+        from keras.models import load_model
+
+        model = load_model(args.model, custom_objects=custom_objects())
+    folded, folds = fold_batchnorm(model)
+
+    inputs = np.random.uniform(0, 255, (args.samples,) + tuple(model.input_shape[1:])).astype(np.float32)
+    difference = max_difference(model, folded, inputs)
+    print('Folded {} BatchNormalization layers ({} backward, {} with ReLU), max difference {:.2e}'.format(
+        len(folds), sum(_f['direction'] == 'backward' for _f in folds.values()),
+        sum(_f['relu'] is not None for _f in folds.values()), difference
+    ))
+    if difference > args.tolerance:
+        raise ValueError('Folded model differs from source by {} > {}'.format(difference, args.tolerance))
+
+    print('|        | Layers | Ops  | Latency (ms) |')
+    print('|--------|--------|------|--------------|')
+    for name, _model in (('source', model), ('folded', folded)):
+        print('| {:6} | {:6} | {:4} | {:12.2f} |'.format(
+            name, len(_model.layers), op_count(_model), latency(_model, inputs[:1]) * 1000
+        ))
+
+    if args.keras is not None:
+        folded.save(args.keras)
+    if args.pb is not None:
+        from utils import freeze_session
+
+        graph_def = freeze_session(K.get_session(), output_names=[_o.op.name for _o in folded.outputs],
+                                   quantize=False)
+        tf.train.write_graph(graph_def, '.', args.pb, as_text=False)
+    if args.tflite is not None:
+        from quantize import convert, keras_converter
+
+        with open(args.tflite, 'wb') as model_file:
+            model_file.write(convert(keras_converter(folded), 'float32'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Uniform inference over frozen graphs and tflite files
+
+    runner = load_runner('ICNet_256x256.pb', input_name='image:0',
+                         output_name='predictions/ResizeBilinear:0')
+    pred = runner.predict(images)
+
+Services should use `ModelRegistry`, which parses each model once and
+keeps pool of warmed sessions or interpreters.
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+import tensorflow as tf
+
+from utils import load_graph
+
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255
+NORMALIZATIONS = ('none', 'imagenet', 'symmetric')
+
+
+def _tensor_name(name):
+    # load_graph imports graph with default 'import' prefix
+    if not name.startswith('import/'):
+        name = 'import/' + name
+    if ':' not in name:
+        name += ':0'
+    return name
+
+
+class FrozenGraphRunner:
+    """Session over frozen graph with fixed input and output tensors"""
+
+    def __init__(self, path, input_name=None, output_name=None, intra_op_threads=0, inter_op_threads=0,
+                 graph=None):
+        """
+        :path (str): path to .pb file
+        :input_name (str): name of input tensor, first placeholder if None
+        :output_name (str): name of output tensor, last operation if None
+        :intra_op_threads (int): threads inside single operation, 0 for tensorflow default
+        :inter_op_threads (int): threads running independent operations, 0 for tensorflow default
+        :graph (tf.Graph): already loaded graph, e.g. shared by several runners
+        """
+        self.path = path
+        self.graph = graph if graph is not None else load_graph(path)
+        operations = self.graph.get_operations()
+        if input_name is None:
+            input_name = next(_op.name for _op in operations if _op.type == 'Placeholder')
+        if output_name is None:
+            output_name = next(
+                _op.name for _op in reversed(operations) if _op.outputs and _op.type not in ('Const', 'Identity')
+            )
+        self.input = self.graph.get_tensor_by_name(_tensor_name(input_name))
+        self.output = self.graph.get_tensor_by_name(_tensor_name(output_name))
+        config = tf.ConfigProto(
+            intra_op_parallelism_threads=intra_op_threads, inter_op_parallelism_threads=inter_op_threads
+        )
+        self.session = tf.Session(graph=self.graph, config=config)
+
+    @property
+    def input_shape(self):
+        return tuple(self.input.shape.as_list())
+
+    @property
+    def fixed_batch_size(self):
+        """Batch size fixed in graph (e.g. 1 for `ImageTensor` of DeepLab), None if any batch size is accepted"""
+        return self.input.shape.as_list()[0]
+
+    @property
+    def input_dtype(self):
+        return np.dtype(self.input.dtype.as_numpy_dtype)
+
+    def predict(self, batch):
+        """Run model on batch
+
+        :batch (array [N, H, W, 3]): input images
+
+        :return (array): output of model
+        """
+        return self.session.run(self.output, feed_dict={self.input: batch})
+
+    def close(self):
+        self.session.close()
+
+
+class TFLiteRunner:
+    """Interpreter of tflite model, resizes input for new batch shapes"""
+
+    def __init__(self, path, num_threads=None, model_content=None):
+        """
+        :path (str): path to .tflite file
+        :num_threads (int): number of interpreter threads, tensorflow default if None
+        :model_content (bytes): already read model, path is used only as name then
+        """
+        self.path = path
+        if model_content is None:
+            with open(path, 'rb') as model_file:
+                model_content = model_file.read()
+        try:
+            self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=num_threads)
+        except TypeError:
+            # older tensorflow has no num_threads argument
+            self.interpreter = tf.lite.Interpreter(model_content=model_content)
+            if num_threads is not None and hasattr(self.interpreter, 'set_num_threads'):
+                self.interpreter.set_num_threads(num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+
+    @property
+    def input_shape(self):
+        return tuple(int(_d) for _d in self.input_details['shape'])
+
+    @property
+    def fixed_batch_size(self):
+        # input is resized for every new batch shape
+        return None
+
+    @property
+    def input_dtype(self):
+        return np.dtype(self.input_details['dtype'])
+
+    def predict(self, batch):
+        """Run model on batch
+
+        :batch (array [N, H, W, 3]): input images
+
+        :return (array): output of model
+        """
+        if tuple(batch.shape) != self.input_shape:
+            self.interpreter.resize_tensor_input(self.input_details['index'], list(batch.shape))
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()[0]
+            self.output_details = self.interpreter.get_output_details()[0]
+        self.interpreter.set_tensor(self.input_details['index'], batch.astype(self.input_dtype, copy=False))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details['index'])
+
+    def close(self):
+        pass
+
+
+def normalize_batch(images, mode='none', dtype=np.float32):
+    """Prepare uint8 RGB images for model
+
+    :images (array [N, H, W, 3]): uint8 images
+    :mode (str): 'none' keeps [0, 255] (ICNet, DeepLabV3), 'imagenet' subtracts
+    mean and divides by std (albumentations `Normalize`), 'symmetric' scales to [-1, 1]
+    :dtype (numpy dtype): type of result, usually `runner.input_dtype`
+
+    :return (array [N, H, W, 3]): normalized images
+    """
+    if mode == 'none':
+        return images.astype(dtype, copy=False)
+    if mode == 'imagenet':
+        return ((images - IMAGENET_MEAN) / IMAGENET_STD).astype(dtype, copy=False)
+    if mode == 'symmetric':
+        return (images.astype(dtype) / 127.5 - 1).astype(dtype, copy=False)
+    raise ValueError('Unknown normalization: {}'.format(mode))
+
+
+def _runner_factory(path, input_name=None, output_name=None, threads=None):
+    # model file is read once, every call of factory creates new session or interpreter over it
+    extension = os.path.splitext(path)[1]
+    if extension == '.pb':
+        graph = load_graph(path)
+        return lambda: FrozenGraphRunner(path, input_name, output_name, intra_op_threads=threads or 0,
+                                         inter_op_threads=threads or 0, graph=graph)
+    if extension == '.tflite':
+        with open(path, 'rb') as model_file:
+            model_content = model_file.read()
+        return lambda: TFLiteRunner(path, num_threads=threads, model_content=model_content)
+    raise ValueError('Unknown model format: {}'.format(path))
+
+
+def load_runner(path, input_name=None, output_name=None, threads=None):
+    """Create runner by file extension
+
+    :path (str): path to .pb or .tflite file
+    :input_name (str): input tensor of frozen graph
+    :output_name (str): output tensor of frozen graph
+    :threads (int): number of threads, tensorflow default if None
+
+    :return (FrozenGraphRunner or TFLiteRunner): runner
+    """
+    return _runner_factory(path, input_name, output_name, threads)()
+
+
+class RunnerPool:
+    """Warmed runners of one model shared by threads,
+    each runner is used by one thread at a time (`tf.lite.Interpreter` is not thread-safe)
+    """
+
+    def __init__(self, path, size=1, input_name=None, output_name=None, threads=None, warmup_shape=None):
+        """
+        :path (str): path to .pb or .tflite file, it is parsed only once
+        :size (int): number of sessions or interpreters
+        :input_name (str): input tensor of frozen graph
+        :output_name (str): output tensor of frozen graph
+        :threads (int): number of threads of each runner, tensorflow default if None
+        :warmup_shape (tuple): shape of batch for warm-up, single image of input shape if None,
+        warm-up is skipped for dynamic image size
+        """
+        self.path = path
+        self.size = size
+        factory = _runner_factory(path, input_name, output_name, threads)
+        self.runners = [factory() for _ in range(size)]
+        self._idle = queue.Queue()
+        for runner in self.runners:
+            shape = warmup_shape or (1,) + tuple(runner.input_shape[1:])
+            if None not in shape:
+                runner.predict(np.zeros(shape, dtype=runner.input_dtype))
+            self._idle.put(runner)
+
+    @property
+    def input_shape(self):
+        return self.runners[0].input_shape
+
+    @property
+    def fixed_batch_size(self):
+        return self.runners[0].fixed_batch_size
+
+    @property
+    def input_dtype(self):
+        return self.runners[0].input_dtype
+
+    def predict(self, batch):
+        """Run model on batch with first idle runner, blocks while all runners are busy
+
+        :batch (array [N, H, W, 3]): input images
+
+        :return (array): output of model
+        """
+        runner = self._idle.get()
+        try:
+            return runner.predict(batch)
+        finally:
+            self._idle.put(runner)
+
+    def close(self):
+        for runner in self.runners:
+            runner.close()
+
+
+class ModelRegistry:
+    """Named runner pools, each model is loaded once per process
+
+        registry = ModelRegistry()
+        registry.register('icnet', 'ICNet/ICNet_256x256.pb', size=4, input_name='image:0',
+                          output_name='predictions/ResizeBilinear:0')
+        pred = registry.predict('icnet', images)
+    """
+
+    def __init__(self):
+        self.pools = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path, **pool_args):
+        """Load model unless it is already registered
+
+        :name (str): name of model
+        :path (str): path to .pb or .tflite file
+        :pool_args: arguments of `RunnerPool`
+
+        :return (RunnerPool): pool of model
+        """
+        with self._lock:
+            if name not in self.pools:
+                self.pools[name] = RunnerPool(path, **pool_args)
+            return self.pools[name]
+
+    def unregister(self, name):
+        """Close runners of model and forget it
+
+        :name (str): name of model
+        """
+        with self._lock:
+            self.pools.pop(name).close()
+
+    def __contains__(self, name):
+        return name in self.pools
+
+    def __getitem__(self, name):
+        return self.pools[name]
+
+    def predict(self, name, batch):
+        """Run registered model on batch
+
+        :name (str): name of model
+        :batch (array [N, H, W, 3]): input images
+
+        :return (array): output of model
+        """
+        return self.pools[name].predict(batch)
+
+    def close(self):
+        with self._lock:
+            for pool in self.pools.values():
+                pool.close()
+            self.pools.clear()
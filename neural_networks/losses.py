@@ -0,0 +1,48 @@
+"""Losses and metrics for integer label targets
+
+Targets are uint8 label maps [B, H, W, 1] as produced by
+`PascalVocGenerator(..., target='sparse')`, pixels with ignore label
+(VOC border) do not contribute to loss and metrics. E.g. for ICNet:
+
+    model = build_bn(width, height, n_classes, train=True)
+    model.compile(optim, loss=[sparse_crossentropy()] * 3, loss_weights=[1.0, 0.4, 0.16],
+                  metrics=[sparse_accuracy()])
+    model.fit_generator(MultiScaleGenerator(train_gen, (4, 8, 16)), ...)
+"""
+
+import keras.backend as K
+
+
+def _labels_and_weights(y_true, y_pred, ignore_index):
+    labels = K.reshape(K.cast(y_true, 'int32'), K.shape(y_pred)[:-1])
+    valid = K.not_equal(labels, ignore_index)
+    labels = labels * K.cast(valid, 'int32')
+    return labels, K.cast(valid, K.floatx())
+
+
+def sparse_crossentropy(ignore_index=255):
+    """Categorical crossentropy of softmax output and integer labels
+
+    :ignore_index (int): label of pixels excluded from loss
+
+    :return (function): keras loss, mean over valid pixels of each sample
+    """
+    def sparse_crossentropy(y_true, y_pred):
+        labels, weights = _labels_and_weights(y_true, y_pred, ignore_index)
+        loss = K.sparse_categorical_crossentropy(labels, y_pred) * weights
+        return K.sum(loss, axis=[1, 2]) / (K.sum(weights, axis=[1, 2]) + K.epsilon())
+    return sparse_crossentropy
+
+
+def sparse_accuracy(ignore_index=255):
+    """Pixel accuracy of softmax output and integer labels
+
+    :ignore_index (int): label of pixels excluded from metric
+
+    :return (function): keras metric, accuracy over valid pixels of each sample
+    """
+    def sparse_accuracy(y_true, y_pred):
+        labels, weights = _labels_and_weights(y_true, y_pred, ignore_index)
+        correct = K.cast(K.equal(labels, K.cast(K.argmax(y_pred, axis=-1), 'int32')), K.floatx())
+        return K.sum(correct * weights, axis=[1, 2]) / (K.sum(weights, axis=[1, 2]) + K.epsilon())
+    return sparse_accuracy
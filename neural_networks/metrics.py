@@ -0,0 +1,129 @@
+"""Dataset-level segmentation metrics
+
+Unlike `utils.get_iou`, which averages per-image IoU, `ConfusionMatrix`
+accumulates pixel counts over the whole dataset, so memory does not
+depend on number of images and result is the standard mIoU.
+"""
+
+import numpy as np
+
+EPS = 1e-12
+
+
+class ConfusionMatrix:
+    """Streaming confusion matrix of integer label maps,
+    rows correspond to ground truth and columns to prediction
+    """
+
+    def __init__(self, num_classes=21, ignore_index=255):
+        """Create empty matrix
+
+        :num_classes (int): number of classes
+        :ignore_index (int): label of pixels excluded from evaluation (VOC border)
+        """
+        self.num_classes = num_classes
+        self.ignore_index = ignore_index
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    def update(self, batch_gt, batch_pred):
+        """Add batch of label maps to matrix
+
+        :batch_gt (array [N, H, W]): ground truth labels
+        :batch_pred (array [N, H, W]): predicted labels
+
+        :return (ConfusionMatrix): self
+        """
+        gt = np.asarray(batch_gt).ravel()
+        pred = np.asarray(batch_pred).ravel()
+        if gt.shape != pred.shape:
+            raise ValueError('Shapes of ground truth {} and prediction {} are different'.format(
+                np.shape(batch_gt), np.shape(batch_pred)
+            ))
+        valid = gt < self.num_classes
+        if self.ignore_index is not None:
+            valid &= gt != self.ignore_index
+        if not valid.all():
+            gt = gt[valid]
+            pred = pred[valid]
+        if pred.size and pred.max() >= self.num_classes:
+            raise ValueError('Predicted label {} is out of {} classes'.format(pred.max(), self.num_classes))
+        index = gt.astype(np.int64) * self.num_classes + pred
+        self.matrix += np.bincount(
+            index, minlength=self.num_classes ** 2
+        ).reshape(self.num_classes, self.num_classes)
+        return self
+
+    def merge(self, other):
+        """Add counts from another matrix, e.g. computed by other worker
+
+        :other (ConfusionMatrix or array [num_classes, num_classes]): partial matrix
+
+        :return (ConfusionMatrix): self
+        """
+        matrix = other.matrix if isinstance(other, ConfusionMatrix) else np.asarray(other)
+        if matrix.shape != self.matrix.shape:
+            raise ValueError('Can not merge matrix of shape {} into {}'.format(
+                matrix.shape, self.matrix.shape
+            ))
+        self.matrix += matrix
+        return self
+
+    def reset(self):
+        self.matrix[...] = 0
+
+    @property
+    def class_iou(self):
+        """Intersection over union for each class,
+        classes absent in both ground truth and prediction get nan
+
+        :return (array [num_classes]): IoU of classes
+        """
+        intersection = np.diag(self.matrix).astype(np.float64)
+        union = self.matrix.sum(axis=0) + self.matrix.sum(axis=1) - intersection
+        iou = np.full(self.num_classes, np.nan)
+        present = union > 0
+        iou[present] = intersection[present] / union[present]
+        return iou
+
+    @property
+    def mean_iou(self):
+        """Mean IoU over classes present in data
+
+        :return (float): mIoU
+        """
+        return float(np.nanmean(self.class_iou))
+
+    @property
+    def pixel_accuracy(self):
+        """Fraction of correctly classified pixels
+
+        :return (float): pixel accuracy
+        """
+        return float(np.diag(self.matrix).sum() / (self.matrix.sum() + EPS))
+
+    @property
+    def frequency_weighted_iou(self):
+        """IoU of classes weighted by their frequency in ground truth
+
+        :return (float): frequency weighted IoU
+        """
+        frequency = self.matrix.sum(axis=1) / (self.matrix.sum() + EPS)
+        iou = self.class_iou
+        present = ~np.isnan(iou)
+        return float((frequency[present] * iou[present]).sum())
+
+    def summary(self, class_names=None):
+        """Collect all metrics into dictionary
+
+        :class_names (list of str, optional): names of classes for per-class IoU
+
+        :return (dict): metrics
+        """
+        if class_names is None:
+            class_names = [str(_i) for _i in range(self.num_classes)]
+        return {
+            'mean_iou': self.mean_iou,
+            'pixel_accuracy': self.pixel_accuracy,
+            'frequency_weighted_iou': self.frequency_weighted_iou,
+            'class_iou': dict(zip(class_names, self.class_iou.tolist()))
+        }
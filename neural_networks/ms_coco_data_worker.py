@@ -19,10 +19,13 @@ import os
 import cv2
 import numpy as np
 from pycocotools.coco import COCO
-from keras.preprocessing.image import ImageDataGenerator
 from sklearn.model_selection import train_test_split
 
-from utils.utils import resize_pad
+from augmentation import BatchAugmenter
+from coco_cache import CocoStore
+from coco_index import CocoIndex, annotation_to_mask
+from data_pipeline import IndexedBatches
+from utils import resize_pad
 
 class DataWorker:
     """Using for loading ms coco dataset (only train and val parts),
@@ -37,13 +40,23 @@ class DataWorker:
     # person
     category_id = 1
     
-    def __init__(self, data_path, seed=7):
+    def __init__(self, data_path, seed=7, store_path=None, category_id=None):
         """Read images description and annotations about it
 
         :data_path (str): path to dataset's folder
         :seed (int): random seed
+        :store_path (str): folder compiled by `coco_cache.py`, if given
+        images and masks are read from it and annotations are not parsed
+        :category_id (int): COCO category of masks, person by default,
+        category of store if store_path is given, other category is an error then
         """
         self.seed = seed
+        if category_id is not None:
+            self.category_id = category_id
+        self.train_index = None
+        self.test_index = None
+        self._coco_train = None
+        self._coco_test = None
         if os.path.islink(data_path):
             data_path = os.readlink(data_path)
         self.data_path = data_path
@@ -51,38 +64,51 @@ class DataWorker:
         self.test_folder = os.path.join(data_path, self.test_folder)
         self.annotation_folder = os.path.join(data_path, self.annotation_folder)
 
-        self.coco_train = COCO(os.path.join(self.annotation_folder, 'instances_train2017.json'))
-        self.coco_test = COCO(os.path.join(self.annotation_folder, 'instances_val2017.json'))
+        self.store = None
+        if store_path is not None:
+            self.store = CocoStore(store_path)
+            stored_category = self.store.meta['category_id']
+            if category_id is not None and category_id != stored_category:
+                raise ValueError('Store {} has masks of category {}, not {}'.format(
+                    store_path, stored_category, category_id
+                ))
+            self.category_id = stored_category
+            self.train_images = self.store.descriptions('train')
+            self.test_images = self.store.descriptions('test')
+        else:
+            self._load_annotations()
+
+        self.train_images, self.val_images = train_test_split(self.train_images, test_size=0.2)
+
+    def _load_annotations(self):
+        # binary indices are built from JSON on first run and reused later
+        self.train_index = CocoIndex(os.path.join(self.annotation_folder, 'instances_train2017.json'))
+        self.test_index = CocoIndex(os.path.join(self.annotation_folder, 'instances_val2017.json'))
 
         # load information about images with class label
-        self.train_images = self.coco_train.loadImgs(
-            ids=self.coco_train.getImgIds(
-                catIds=self.category_id
-            )
-        )
-        self.test_images = self.coco_test.loadImgs(
-            ids=self.coco_test.getImgIds(
-                catIds=self.category_id
-            )
-        )
+        self.train_images = self.train_index.descriptions(self.category_id)
+        self.test_images = self.test_index.descriptions(self.category_id)
 
-        # load annotations for loaded images
-        self.train_annotations = {
-            img_desc['id']: self.coco_train.loadAnns(
-                self.coco_train.getAnnIds(
-                    imgIds=img_desc['id'], iscrowd=False, catIds=self.category_id
-                )
-            ) for img_desc in self.train_images
-        }
-        self.test_annotations = {
-            img_desc['id']: self.coco_test.loadAnns(
-                self.coco_test.getAnnIds(
-                    imgIds=img_desc['id'], iscrowd=False, catIds=self.category_id
-                )
-            ) for img_desc in self.test_images
-        }
-        
-        self.train_images, self.val_images = train_test_split(self.train_images, test_size=0.2)
+    def _check_annotations(self):
+        if self.store is not None:
+            raise RuntimeError('Annotations are not loaded when images are read from store, '
+                               'create DataWorker without store_path to use COCO api')
+
+    @property
+    def coco_train(self):
+        """Full COCO api for train annotations, parsed on first access"""
+        self._check_annotations()
+        if self._coco_train is None:
+            self._coco_train = COCO(self.train_index.annotation_file)
+        return self._coco_train
+
+    @property
+    def coco_test(self):
+        """Full COCO api for test annotations, parsed on first access"""
+        self._check_annotations()
+        if self._coco_test is None:
+            self._coco_test = COCO(self.test_index.annotation_file)
+        return self._coco_test
 
     @property
     def train_shape(self):
@@ -115,65 +141,111 @@ class DataWorker:
 
         :return (tuple([N, M, 3], [N, M])): tuple of image and mask
         """
-        # reorder, because cv2 use BGR format
-        if image_desc['id'] in self.train_annotations:
-            image = cv2.imread(os.path.join(self.train_folder, image_desc['file_name']))
-            masks = [
-                self.coco_train.annToMask(i_img_ann)
-                for i_img_ann in self.train_annotations[image_desc['id']]
-            ]
+        if self.store is not None:
+            return self.store.load(image_desc['id'])
+        if image_desc['id'] in self.train_index:
+            folder, index = self.train_folder, self.train_index
         else:
-            image = cv2.imread(os.path.join(self.test_folder, image_desc['file_name']))
-            masks = [
-                self.coco_test.annToMask(i_img_ann)
-                for i_img_ann in self.test_annotations[image_desc['id']]
-            ]
+            folder, index = self.test_folder, self.test_index
+        # reorder, because cv2 use BGR format
+        image = cv2.imread(os.path.join(folder, image_desc['file_name']))
         image = image[:, :, [2, 1, 0]]
-        total_mask = np.bitwise_or.reduce(masks)
+        total_mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        for annotation in index.annotations(image_desc['id'], self.category_id, iscrowd=False):
+            total_mask |= annotation_to_mask(annotation, image.shape[0], image.shape[1])
         return (image, total_mask)
 
-    def batch_loader(self, images_descriptions, batch_size, height, width):
-        """Load batches of images and resize with padding to given shape
+    def load_batch(self, images_descriptions, idx, batch_size, height, width, out=None,
+                   mask_dtype=np.float32):
+        """Load single batch of images and resize with padding to given shape
+
+        :images_descriptions (dict): descriptions of images in coco format
+        :idx (int): index of batch
+        :batch_size (int): size of batch
+        :height (int): height of proccessed images
+        :width (int): width of proccesses images
+        :out (tuple, optional): buffers [batch_size, height, width, 3] and
+        [batch_size, height, width] to write images and masks into
+        :mask_dtype (numpy dtype): type of masks if buffers are not given
+
+        :return (tuple([n, height, width, 3], [n, height, width])):
+        tuple of images and masks, n is less than batch_size for the last batch
+        """
+        batch_descriptions = images_descriptions[idx * batch_size:(idx + 1) * batch_size]
+        if out is None:
+            out = (
+                np.empty([len(batch_descriptions), height, width, 3], dtype=np.uint8),
+                np.empty([len(batch_descriptions), height, width], dtype=mask_dtype)
+            )
+        images, masks = out[0][:len(batch_descriptions)], out[1][:len(batch_descriptions)]
+        for i, image_desc in enumerate(batch_descriptions):
+            image, mask = self.load_image_mask(image_desc)
+            resize_pad(image, height, width, out=images[i])
+            resize_pad(mask, height, width, cv2.INTER_NEAREST, out=masks[i])
+        return images, masks
+
+    def batch_sequence(self, images_descriptions, batch_size, height, width, mask_dtype=np.float32,
+                       augment_args=None):
+        """Indexable batches for loading with `data_pipeline.PrefetchLoader`
+
+        :images_descriptions (dict): descriptions of images in coco format
+        :batch_size (int): size of batch
+        :height (int): height of proccessed images
+        :width (int): width of proccesses images
+        :mask_dtype (numpy dtype): type of masks
+        :augment_args (dict): params of `BatchAugmenter`, augmentation runs
+        in loading process if given
+
+        :return (IndexedBatches): batches of images and masks
+        """
+        augmenter = BatchAugmenter(**augment_args) if augment_args is not None else None
+
+        def load(idx):
+            images, masks = self.load_batch(images_descriptions, idx, batch_size, height, width,
+                                            mask_dtype=mask_dtype)
+            if augmenter is not None:
+                return augmenter(images, masks)
+            return images, masks
+
+        return IndexedBatches(load, int(np.ceil(len(images_descriptions) / float(batch_size))))
+
+    def batch_loader(self, images_descriptions, batch_size, height, width, buffers_num=2,
+                     mask_dtype=np.float32):
+        """Load batches of images and resize with padding to given shape,
+        batches are assembled in ring of preallocated buffers, so yielded arrays
+        are overwritten after next `buffers_num - 1` batches
 
         :images_descriptions (dict): descriptions of images in coco format
         :batch_size (int): size of batch
         :height (int): height of proccessed images
         :width (int): width of proccesses images
+        :buffers_num (int): number of reused batch buffers
+        :mask_dtype (numpy dtype): type of masks, e.g. np.uint8 to save memory
 
         :return (generator): generator of batches with images and masks
         tuple of [batch_size, height, width, 3] and [batch_size, height, width]
         """
-        for start_ind in range(0, len(images_descriptions), batch_size):
-            images = np.empty([0, height, width, 3], dtype=np.uint8)
-            masks = np.empty([0, height, width], dtype=np.float32)
-            for image_desc in images_descriptions[start_ind:start_ind + batch_size]:
-                image, mask = self.load_image_mask(image_desc)
-                shaped_image = resize_pad(image, height, width)
-                shaped_mask = resize_pad(mask, height, width)
-
-                images = np.append(images, [shaped_image], axis=0)
-                masks = np.append(masks, [shaped_mask], axis=0)
-            yield (images, masks)
+        images_buffers = np.empty([buffers_num, batch_size, height, width, 3], dtype=np.uint8)
+        masks_buffers = np.empty([buffers_num, batch_size, height, width], dtype=mask_dtype)
+        batches_num = int(np.ceil(len(images_descriptions) / float(batch_size)))
+        for idx in range(batches_num):
+            slot = idx % buffers_num
+            yield self.load_batch(images_descriptions, idx, batch_size, height, width,
+                                  out=(images_buffers[slot], masks_buffers[slot]))
 
     def batch_augmentation(self, image_generator, augment_args):
         """Augmentate batch of images
 
         :image_generator (generator): generator with batches of images
         tuple of [batch_size, height, width, 3] and [batch_size, height, width]
-        :augment_args (dict): params for augmentation
+        :augment_args (dict): params of `augmentation.BatchAugmenter`
 
         :return (generator): generator with batches of augmented images
         tuple of [batch_size, height, width, 3] and [batch_size, height, width]
         """
-        augment = ImageDataGenerator(**augment_args)
+        augmenter = BatchAugmenter(seed=self.seed, **augment_args)
         for images, masks in image_generator:
-            stacked = np.concatenate([images, masks[:, :, :, np.newaxis]], axis=-1)
-            aug_batch = augment.flow(stacked, seed=self.seed, batch_size=stacked.shape[0],
-                                     shuffle=False)
-            for aug_stacked in aug_batch:
-                aug_images = aug_stacked[:, :, :, :3].astype(np.uint8)
-                aug_masks = aug_stacked[:, :, :, 3]#[:, :, :, np.newaxis]
-                yield (aug_images, aug_masks)
+            yield augmenter(images, masks)
 
     def batch_generator(self, images_descriptions, batch_size=100, height=512, width=512,
                         augment_args=None):
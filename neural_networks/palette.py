@@ -0,0 +1,102 @@
+"""Conversion between colour masks and label maps
+
+Colour of each pixel is packed into 24-bit key and mapped to label with
+one lookup, label maps are converted back to colours by indexing palette.
+"""
+
+import numpy as np
+
+from postprocessing import labels_to_onehot
+
+
+def pack_rgb(mask):
+    """Pack RGB colours into 24-bit integers
+
+    :mask (array [..., 3]): RGB image
+
+    :return (array [...]): uint32 keys
+    """
+    mask = np.asarray(mask)
+    return (mask[..., 0].astype(np.uint32) << 16) | (mask[..., 1].astype(np.uint32) << 8) | mask[..., 2]
+
+
+class OneHotView:
+    """One-hot masks of label maps, expanded only on access"""
+
+    def __init__(self, labels, num_classes, dtype=np.float32):
+        self.labels = labels
+        self.num_classes = num_classes
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def shape(self):
+        return self.labels.shape + (self.num_classes, )
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        return labels_to_onehot(self.labels[idx], self.num_classes, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return labels_to_onehot(self.labels, self.num_classes, dtype or self.dtype)
+
+
+class PaletteCodec:
+    """Lookup-table codec between colour masks and uint8 label maps"""
+
+    def __init__(self, colors, ignore_index=255, ignore_color=(224, 224, 192)):
+        """Create codec, lookup table is built on first encoding
+
+        :colors (list of arrays [3]): RGB colour of each class, index of colour is label
+        :ignore_index (int): label for colours not in palette (e.g. VOC border)
+        :ignore_color (tuple): colour used for ignore label in decoding
+        """
+        self.colors = np.array(colors, dtype=np.uint8)
+        self.num_classes = len(self.colors)
+        self.ignore_index = ignore_index
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        self.palette[:self.num_classes] = self.colors
+        self.palette[ignore_index] = ignore_color
+        self._lut = None
+
+    @property
+    def lut(self):
+        """Table of labels for all 2^24 colours, 16 Mb
+
+        :return (array [2^24]): uint8 labels
+        """
+        if self._lut is None:
+            lut = np.full(1 << 24, self.ignore_index, dtype=np.uint8)
+            lut[pack_rgb(self.colors)] = np.arange(self.num_classes)
+            self._lut = lut
+        return self._lut
+
+    def encode(self, mask, out=None):
+        """Convert colour mask to label map
+
+        :mask (array [..., H, W, 3]): RGB mask
+        :out (array [..., H, W], optional): uint8 buffer to write labels into
+
+        :return (array [..., H, W]): uint8 labels
+        """
+        return np.take(self.lut, pack_rgb(mask), out=out)
+
+    def decode(self, labels):
+        """Convert label map to colour mask
+
+        :labels (array [..., H, W]): integer labels
+
+        :return (array [..., H, W, 3]): uint8 RGB mask
+        """
+        return self.palette[labels]
+
+    def one_hot(self, labels, dtype=np.float32):
+        """Lazy one-hot view of label maps
+
+        :labels (array [..., H, W]): integer labels
+        :dtype (numpy dtype): type of expanded masks
+
+        :return (OneHotView): view, use np.asarray to materialize it
+        """
+        return OneHotView(labels, self.num_classes, dtype)
@@ -6,6 +6,10 @@ from os.path import join
 
 from keras.utils import Sequence
 
+from caching import MemmapCache
+from palette import PaletteCodec
+from postprocessing import labels_to_onehot
+
 class PascalVocGenerator(Sequence):
     
     classes = {
@@ -31,9 +35,29 @@ class PascalVocGenerator(Sequence):
         "train": np.array([128, 192, 0]),
         "tv": np.array([0, 64, 128])
     }
+    codec = PaletteCodec(list(classes.values()))
     
     def __init__(self, image_names_file, image_folder, mask_folder, batch_size,
-                 shape, augment=False, augmentation=None, repeat_num=1):
+                 shape, augment=False, augmentation=None, repeat_num=1, target='categorical', cache=None):
+        """Generator of batches of Pascal VOC images and masks
+
+        :image_names_file (str): file with names of images, one per line
+        :image_folder (str): folder with jpg images
+        :mask_folder (str): folder with png colour masks
+        :batch_size (int): size of batch
+        :shape (tuple): (width, height) of images after resize, order of `cv2.resize`
+        :augment (bool): apply augmentation or not
+        :augmentation (callable): albumentations-like augmentation of image and mask
+        :repeat_num (int): number of repeats of each image in epoch
+        :target (str): 'categorical' for float one-hot masks [B, H, W, 21],
+        'sparse' for uint8 label maps [B, H, W, 1] (trailing axis is required by keras)
+        :cache (LRUCache, MemmapCache or str): cache of resized images and label maps by (name, shape),
+        str is path prefix of new `MemmapCache`; augmentation runs after cache, so it stays random.
+        `LRUCache` is private to process, `MemmapCache` is shared by loader processes and runs
+        """
+        if target not in ('categorical', 'sparse'):
+            raise ValueError('Unknown target type: {}'.format(target))
+        self.target = target
         self.image_names_file = image_names_file
         self.images = open(self.image_names_file).readlines()
         self.images = [name[:-1] for name in self.images]
@@ -46,17 +70,26 @@ class PascalVocGenerator(Sequence):
             self.augmentation = augmentation
         
         self.images = np.repeat(self.images, repeat_num)
+        if isinstance(cache, str):
+            width, height = shape
+            cache = MemmapCache(cache, [(str(_name), tuple(shape)) for _name in self.images],
+                                [(height, width, 3), (height, width)])
+        self.cache = cache
         
     def __len__(self):
         return int(np.ceil(len(self.images) / float(self.batch_size)))
     
     def __getitem__(self, idx):
         batch_images = self.images[idx * self.batch_size:(idx + 1) * self.batch_size]
-        batch_x = [cv2.imread('{}.jpg'.format(join(self.image_folder, _im))) for _im in batch_images]
-        batch_y = [cv2.imread('{}.png'.format(join(self.mask_folder, _im))) for _im in batch_images]
-
-        batch_x = np.array([cv2.resize(_im, self.image_shape)[:, :, ::-1] for _im in batch_x])
-        batch_y = np.array([cv2.resize(_im, self.image_shape, cv2.INTER_NEAREST)[:, :, ::-1] for _im in batch_y])
+        if self.cache is None:
+            loaded = [self._load(_im) for _im in batch_images]
+        else:
+            loaded = [
+                self.cache.get_or_compute((str(_im), tuple(self.image_shape)), lambda _im=_im: self._load(_im))
+                for _im in batch_images
+            ]
+        batch_x = np.array([_image for _image, _ in loaded])
+        batch_y = np.array([_labels for _, _labels in loaded])
         
         if self.augment:
             augmented = [
@@ -65,21 +98,44 @@ class PascalVocGenerator(Sequence):
             batch_x = np.array([_aug['image'] for _aug in augmented])
             batch_y = np.array([_aug['mask'] for _aug in augmented])
         
-        batch_y = np.array([self.mask_to_categorical(_im) for _im in batch_y])
+        if self.target == 'sparse':
+            batch_y = batch_y[:, :, :, np.newaxis]
+        else:
+            batch_y = labels_to_onehot(batch_y, len(self.classes), np.float64)
         
         return batch_x, batch_y
     
+    def _load(self, name):
+        image = cv2.imread('{}.jpg'.format(join(self.image_folder, name)))
+        mask = cv2.imread('{}.png'.format(join(self.mask_folder, name)))
+        image = np.ascontiguousarray(cv2.resize(image, self.image_shape)[:, :, ::-1])
+        labels = cv2.resize(self.codec.encode(mask[:, :, ::-1]), self.image_shape, interpolation=cv2.INTER_NEAREST)
+        return image, labels
+
+    def subsample(self, num_samples, seed=0):
+        """Keep random subset of images, lists of splits are sorted by year and id,
+        so first images are not representative
+
+        :num_samples (int): number of images, 0 keeps all
+        :seed (int): random seed
+        """
+        if 0 < num_samples < len(self.images):
+            chosen = np.random.RandomState(seed).choice(len(self.images), num_samples, replace=False)
+            self.images = self.images[np.sort(chosen)]
+
+    @property
+    def cache_stats(self):
+        """Hits, misses and hit rate of cache in this process, None without cache"""
+        return None if self.cache is None else self.cache.stats
+
     def mask_to_categorical(self, mask):
-        cat = np.zeros((mask.shape[0], mask.shape[1], len(self.classes)), np.float)
-        for i, (cls, color) in enumerate(self.classes.items()):
-            cat[:, :, i] = (mask == color).all(axis=2).astype(np.float)
-        return cat
+        return labels_to_onehot(self.codec.encode(mask), len(self.classes), np.float64)
     
     def categorical_to_mask(self, categorical):
-        mask = np.zeros((categorical.shape[0], categorical.shape[1], 3), np.int)
-        for i, (cls, color) in enumerate(self.classes.items()):
-            mask[categorical[:, :, i] == 1.] = color
-        return mask
+        return self.labels_to_mask(categorical.argmax(axis=-1))
+
+    def labels_to_mask(self, labels):
+        return self.codec.decode(labels)
     
     def on_epoch_end(self):
         np.random.shuffle(self.images)
@@ -109,4 +165,33 @@ class PascalVocGenerator(Sequence):
         axs[2].imshow(blend_image)
         if name is not None:
             axs[1].set_title(name)
-        return fig
\ No newline at end of file
+        return fig
+
+
+class MultiScaleGenerator(Sequence):
+    """Wrap generator to produce targets for several model outputs,
+    e.g. ICNet with train=True has outputs at 1/4, 1/8 and 1/16 of input
+    """
+
+    def __init__(self, generator, scales=(4, 8, 16)):
+        """
+        :generator (Sequence): generator of (images, targets) batches
+        :scales (tuple of int): downsampling factor of each output
+        """
+        self.generator = generator
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.generator)
+
+    def __getitem__(self, idx):
+        batch_x, batch_y = self.generator[idx]
+        height, width = batch_y.shape[1:3]
+        # nearest downsampling of both label maps and one-hot masks is plain striding
+        return batch_x, [
+            np.ascontiguousarray(batch_y[:, :height // _s * _s:_s, :width // _s * _s:_s])
+            for _s in self.scales
+        ]
+
+    def on_epoch_end(self):
+        self.generator.on_epoch_end()
@@ -0,0 +1,65 @@
+"""Vectorized post-processing of network outputs
+
+All models in this repo return either per-class scores [N, H, W, C]
+(ICNet, UNet, ENet and DeepLabV3 tflite) or ready label maps [N, H, W]
+(DeepLabV3 frozen graph `SemanticPredictions`). Functions below convert
+both kinds of outputs to compact uint8 label maps and expand label maps
+to one-hot masks only when it is really needed.
+"""
+
+import numpy as np
+
+
+def softmax_to_labels(pred, out=None):
+    """Convert batch of per-class scores to label maps
+
+    :pred (array [N, H, W, C]): softmax output or logits of network
+    :out (array [N, H, W], optional): buffer to write labels into
+
+    :return (array [N, H, W]): uint8 label maps
+    """
+    if pred.shape[-1] > 256:
+        raise ValueError('Can not store {} classes in uint8 labels'.format(pred.shape[-1]))
+    if out is None:
+        out = np.empty(pred.shape[:-1], dtype=np.uint8)
+    elif out.shape != pred.shape[:-1]:
+        raise ValueError('Output buffer has shape {}, expected {}'.format(out.shape, pred.shape[:-1]))
+    out[...] = pred.argmax(axis=-1)
+    return out
+
+
+def to_labels(pred, out=None):
+    """Convert output of any network to batch of label maps
+
+    :pred (array): scores [N, H, W, C] or [H, W, C], or integer labels [N, H, W]
+    :out (array [N, H, W], optional): buffer to write labels into,
+    single image is treated as batch of size 1
+
+    :return (array [N, H, W]): uint8 label maps
+    """
+    if np.issubdtype(pred.dtype, np.integer):
+        if out is None:
+            return pred.astype(np.uint8)
+        out[...] = pred
+        return out
+    if pred.ndim == 3:
+        pred = pred[np.newaxis]
+    return softmax_to_labels(pred, out=out)
+
+
+def labels_to_onehot(labels, num_classes=21, dtype=np.float32, out=None):
+    """Expand label maps to one-hot masks,
+    labels outside of [0, num_classes) (e.g. 255 border) become zero vectors
+
+    :labels (array [..., H, W]): integer label maps
+    :num_classes (int): number of classes
+    :dtype (numpy dtype): type of result
+    :out (array [..., H, W, num_classes], optional): buffer to write masks into
+
+    :return (array [..., H, W, num_classes]): one-hot masks
+    """
+    if out is None:
+        out = np.empty(labels.shape + (num_classes, ), dtype=dtype)
+    classes = np.arange(num_classes, dtype=labels.dtype)
+    np.equal(labels[..., np.newaxis], classes, out=out, casting='unsafe')
+    return out
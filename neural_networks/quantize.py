@@ -0,0 +1,203 @@
+"""Post-training conversion of models to float32, float16 and int8 tflite
+
+Int8 variant is fully integer (weights and activations), its ranges are
+calibrated on representative images drawn from `PascalVocGenerator`.
+Every variant is evaluated on held-out images with `evaluate.evaluate`,
+e.g. for IC-Net weights:
+
+    python quantize.py icnet ICNet/weights.h5 /data/VOC2012 --height 256 --width 256 --output-dir tflite
+    python quantize.py pb ICNet/ICNet_256x256.pb /data/VOC2012 --height 256 --width 256 \\
+        --input image --output predictions/ResizeBilinear --output-dir tflite
+"""
+
+import argparse
+import json
+import os
+from os.path import join
+
+import numpy as np
+import tensorflow as tf
+
+from evaluate import evaluate
+from inference import NORMALIZATIONS, TFLiteRunner, normalize_batch
+from pascal_voc_data import PascalVocGenerator
+
+VARIANTS = ('float32', 'float16', 'int8')
+# tf.lite.TFLiteConverter is v2 API in tensorflow 2, frozen graphs and sessions need v1 converter
+TFLiteConverter = tf.compat.v1.lite.TFLiteConverter
+
+
+def keras_converter(model):
+    """Converter of keras model built in default session, e.g. by `ICNet.model.build_bn`
+
+    :model (keras.Model): model with loaded weights
+
+    :return (callable): function without arguments returning new converter
+    """
+    import keras.backend as K
+
+    return lambda: TFLiteConverter.from_session(K.get_session(), model.inputs, model.outputs)
+
+
+def frozen_graph_converter(path, input_name, output_name, input_shape):
+    """Converter of frozen graph
+
+    :path (str): path to .pb file
+    :input_name (str): name of input tensor without 'import/' prefix
+    :output_name (str): name of output tensor without 'import/' prefix
+    :input_shape (list): shape of input, e.g. [1, 256, 256, 3]
+
+    :return (callable): function without arguments returning new converter
+    """
+    input_name, output_name = input_name.split(':')[0], output_name.split(':')[0]
+    return lambda: TFLiteConverter.from_frozen_graph(
+        path, [input_name], [output_name], input_shapes={input_name: input_shape}
+    )
+
+
+def representative_dataset(generator, num_samples, normalization='none'):
+    """Calibration images for int8 conversion
+
+    :generator (PascalVocGenerator): generator of images
+    :num_samples (int): number of images
+    :normalization (str): one of `inference.NORMALIZATIONS`, same as for inference
+
+    :return (callable): generator function of lists with single float32 batch [1, H, W, 3]
+    """
+    def samples():
+        count = 0
+        for idx in range(len(generator)):
+            images, _ = generator[idx]
+            for image in images:
+                if count == num_samples:
+                    return
+                yield [normalize_batch(image[np.newaxis], normalization, np.float32)]
+                count += 1
+    return samples
+
+
+def convert(make_converter, variant, calibration=None):
+    """Convert model into tflite
+
+    :make_converter (callable): function returning new converter
+    :variant (str): one of VARIANTS
+    :calibration (callable): representative dataset, required for 'int8'
+
+    :return (bytes): tflite model
+    """
+    converter = make_converter()
+    if variant == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        if calibration is None:
+            raise ValueError('Full integer quantization requires representative dataset')
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = calibration
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # input and output stay float, so all variants are used in the same way
+    elif variant != 'float32':
+        raise ValueError('Unknown variant: {}'.format(variant))
+    return converter.convert()
+
+
+def quantize(make_converter, output_prefix, calibration, variants=VARIANTS):
+    """Write all variants of model
+
+    :make_converter (callable): function returning new converter
+    :output_prefix (str): prefix of output files, variant and extension are appended
+    :calibration (callable): representative dataset
+    :variants (tuple): variants to produce
+
+    :return (dict): paths of tflite files by variant
+    """
+    paths = {}
+    for variant in variants:
+        paths[variant] = '{}_{}.tflite'.format(output_prefix, variant)
+        with open(paths[variant], 'wb') as model_file:
+            model_file.write(convert(make_converter, variant, calibration))
+    return paths
+
+
+def report(paths, dataset, normalization='none', threads=None):
+    """Measure size, latency and quality of tflite variants
+
+    :paths (dict): paths of tflite files by variant
+    :dataset (Sequence): held-out batches of uint8 images and sparse labels
+    :normalization (str): one of `inference.NORMALIZATIONS`
+    :threads (int): number of interpreter threads
+
+    :return (list of dict): size in Mb, model latency percentiles and mIoU of each variant
+    """
+    rows = []
+    for variant, path in paths.items():
+        result = evaluate(lambda: TFLiteRunner(path, num_threads=threads), dataset, normalization)
+        rows.append({
+            'variant': variant, 'path': path, 'size_mb': os.path.getsize(path) / 2 ** 20,
+            'p50_ms': result['model']['p50_ms'], 'p90_ms': result['model']['p90_ms'],
+            'mean_iou': result['metrics']['mean_iou']
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert model to float32, float16 and int8 tflite')
+    parser.add_argument('source', choices=('icnet', 'pb'), help='IC-Net keras weights or frozen graph')
+    parser.add_argument('model', help='path to weights of IC-Net or to .pb file')
+    parser.add_argument('voc_path', help='path to VOC2012 folder')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--input', default=None, help='input tensor of frozen graph')
+    parser.add_argument('--output', default=None, help='output tensor of frozen graph')
+    parser.add_argument('--normalization', default='none', choices=NORMALIZATIONS)
+    parser.add_argument('--calibration-split', default='train', help='file in ImageSets/Segmentation')
+    parser.add_argument('--calibration-samples', type=int, default=200)
+    parser.add_argument('--eval-split', default='val', help='file in ImageSets/Segmentation')
+    parser.add_argument('--eval-samples', type=int, default=300, help='number of held-out images, 0 for all')
+    parser.add_argument('--seed', type=int, default=0, help='seed of random calibration and held-out images')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument('--threads', type=int, default=None, help='interpreter threads')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--json', default=None, help='file to write report into')
+    args = parser.parse_args()
+
+    def voc_split(split, batch_size):
+        return PascalVocGenerator(
+            join(args.voc_path, 'ImageSets', 'Segmentation', split + '.txt'),
+            join(args.voc_path, 'JPEGImages'),
+            join(args.voc_path, 'SegmentationClass'),
+            batch_size, (args.width, args.height), target='sparse'
+        )
+
+    if args.source == 'icnet':
+        from ICNet.model import build_bn
+
+        model = build_bn(args.width, args.height, len(PascalVocGenerator.classes), weights_path=args.model)
+        make_converter = keras_converter(model)
+    else:
+        make_converter = frozen_graph_converter(args.model, args.input, args.output, [1, args.height, args.width, 3])
+    calibration_images = voc_split(args.calibration_split, 1)
+    calibration_images.subsample(args.calibration_samples, args.seed)
+    calibration = representative_dataset(calibration_images, args.calibration_samples, args.normalization)
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_prefix = join(args.output_dir, os.path.splitext(os.path.basename(args.model))[0])
+    paths = quantize(make_converter, output_prefix, calibration, args.variants)
+    if args.source == 'icnet':
+        import keras.backend as K
+
+        K.clear_session()
+
+    held_out = voc_split(args.eval_split, 1)
+    held_out.subsample(args.eval_samples, args.seed)
+    rows = report(paths, held_out, args.normalization, args.threads)
+    print('| Variant | Size (mb) | p50 (ms) | p90 (ms) | mIoU  |')
+    print('|---------|-----------|----------|----------|-------|')
+    for row in rows:
+        print('| {variant:7} | {size_mb:9.1f} | {p50_ms:8.2f} | {p90_ms:8.2f} | {mean_iou:.3f} |'.format(**row))
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+"""Local HTTP inference service with dynamic micro-batching
+
+Single images from many clients are queued and grouped into batches of
+up to `max_batch_size` images or whatever arrived within `max_delay`
+seconds, so model works at batch > 1 without adding latency under low load.
+
+    python serving.py serve ICNet/ICNet_256x256.pb --input image:0 \\
+        --output predictions/ResizeBilinear:0 --port 8000
+    python serving.py load --url http://127.0.0.1:8000 --concurrency 16 --requests 500
+
+POST /predict with encoded image (jpg, png) returns png label map of the same size,
+503 is returned when queue is full. GET /metrics returns latency statistics in JSON.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from inference import NORMALIZATIONS, RunnerPool, normalize_batch
+from postprocessing import to_labels
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50_ms': 0., 'p90_ms': 0., 'p99_ms': 0.}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+    return {'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99)}
+
+
+class MicroBatcher:
+    """Queue of single images served by threads running batched prediction"""
+
+    def __init__(self, predict, max_batch_size=8, max_delay=0.01, max_queue=64, num_workers=1, history=10000):
+        """
+        :predict (callable): function of batch [N, H, W, 3] returning scores or labels of model
+        :max_batch_size (int): maximum number of images in batch
+        :max_delay (float): seconds to wait for batch to fill after its first image arrived
+        :max_queue (int): maximum number of waiting images, new ones are rejected after it
+        :num_workers (int): number of threads calling predict, e.g. size of `RunnerPool`
+        :history (int): number of last requests used for latency statistics
+        """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=history)
+        self._waits = deque(maxlen=history)
+        self._batch_sizes = deque(maxlen=history)
+        self._counters = {'accepted': 0, 'rejected': 0, 'failed': 0}
+        self._workers = [threading.Thread(target=self._serve, daemon=True) for _ in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image):
+        """Put image into queue
+
+        :image (array [H, W, 3]): input of model
+
+        :return (Future): future of uint8 label map [H, W]
+        :raises queue.Full: queue is full, client should retry later
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((image, future, time.perf_counter()))
+        except queue.Full:
+            with self._lock:
+                self._counters['rejected'] += 1
+            raise
+        with self._lock:
+            self._counters['accepted'] += 1
+        return future
+
+    def _next_batch(self):
+        requests = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                requests.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return requests
+
+    def _serve(self):
+        while True:
+            requests = self._next_batch()
+            start = time.perf_counter()
+            try:
+                labels = to_labels(self.predict(np.stack([_image for _image, _, _ in requests])))
+            except Exception as error:
+                with self._lock:
+                    self._counters['failed'] += len(requests)
+                for _, future, _ in requests:
+                    future.set_exception(error)
+                continue
+            end = time.perf_counter()
+            with self._lock:
+                self._batch_sizes.append(len(requests))
+                for _, _, arrival in requests:
+                    self._waits.append(start - arrival)
+                    self._latencies.append(end - arrival)
+            for (_, future, _), label in zip(requests, labels):
+                future.set_result(label)
+
+    @property
+    def metrics(self):
+        """Statistics of last requests
+
+        :return (dict): counters, queue depth, mean batch size, latency and queue wait percentiles
+        """
+        with self._lock:
+            return {
+                'requests': dict(self._counters),
+                'queue_depth': self._queue.qsize(),
+                'mean_batch_size': float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.,
+                'latency': _percentiles(list(self._latencies)),
+                'queue_wait': _percentiles(list(self._waits))
+            }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """Handler of /predict and /metrics, server provides `batcher`, `input_size` and `request_timeout`"""
+
+    def _send(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if code == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, code, data):
+        self._send(code, json.dumps(data).encode(), 'application/json')
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self._send_json(404, {'error': 'unknown path'})
+            return
+        self._send_json(200, self.server.batcher.metrics)
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': 'unknown path'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            self._send_json(400, {'error': 'body is not an image'})
+            return
+        height, width = self.server.input_size
+        resized = cv2.resize(image, (width, height))[:, :, ::-1]
+        try:
+            future = self.server.batcher.submit(resized)
+        except queue.Full:
+            self._send_json(503, {'error': 'queue is full'})
+            return
+        try:
+            labels = future.result(timeout=self.server.request_timeout)
+        except Exception as error:
+            self._send_json(500, {'error': str(error)})
+            return
+        labels = cv2.resize(labels, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+        self._send(200, cv2.imencode('.png', labels)[1].tobytes(), 'image/png')
+
+    def log_message(self, format, *args):
+        # access log of every request slows down server under load
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # default backlog of 5 connections makes concurrent clients wait for tcp retransmission
+    request_queue_size = 128
+
+
+def make_server(batcher, input_size, host='127.0.0.1', port=8000, timeout=30):
+    """Create HTTP server, call `serve_forever` to start it
+
+    :batcher (MicroBatcher): batcher of loaded model
+    :input_size (tuple): height and width of model input
+    :host (str): address to listen
+    :port (int): port to listen, 0 for any free port
+    :timeout (float): seconds to wait for prediction of single request
+
+    :return (PredictionServer): server
+    """
+    server = PredictionServer((host, port), PredictionHandler)
+    server.batcher = batcher
+    server.input_size = input_size
+    server.request_timeout = timeout
+    return server
+
+
+def load_test(url, images, concurrency=8, requests=200, timeout=60):
+    """Send images to server from several threads
+
+    :url (str): address of server, e.g. http://127.0.0.1:8000
+    :images (list of bytes): encoded images sent in turn
+    :concurrency (int): number of client threads
+    :requests (int): total number of requests
+    :timeout (float): seconds to wait for single response
+
+    :return (dict): throughput, client side latency percentiles, number of rejected requests
+    and of failed ones (error status or no response)
+    """
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies, statuses = [], []
+
+    def client():
+        while True:
+            with lock:
+                idx = next(counter, None)
+            if idx is None:
+                return
+            request = urllib.request.Request(
+                url + '/predict', data=images[idx % len(images)], headers={'Content-Type': 'image/jpeg'}
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as error:
+                status = error.code
+            except (urllib.error.URLError, OSError):
+                # refused or reset connection and timeout, request has no status
+                status = None
+            with lock:
+                statuses.append(status)
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    result = {
+        'requests': requests,
+        'succeeded': statuses.count(200),
+        'rejected': statuses.count(503),
+        'failed': len(statuses) - statuses.count(200) - statuses.count(503),
+        'seconds': elapsed,
+        'images_per_second': statuses.count(200) / elapsed
+    }
+    result.update(_percentiles(latencies))
+    return result
+
+
+def synthetic_images(num, height, width, seed=7):
+    """Random jpg encoded images for load test
+
+    :num (int): number of images
+    :height (int): height of images
+    :width (int): width of images
+    :seed (int): random seed
+
+    :return (list of bytes): encoded images
+    """
+    rng = np.random.RandomState(seed)
+    return [
+        cv2.imencode('.jpg', rng.randint(0, 256, (height, width, 3)).astype(np.uint8))[1].tobytes()
+        for _ in range(num)
+    ]
+
+
+def serve(args):
+    pool = RunnerPool(args.model, size=args.runners, input_name=args.input, output_name=args.output,
+                      threads=args.threads)
+    _, height, width, _ = pool.input_shape
+    height, width = args.height or height, args.width or width
+    if height is None or width is None:
+        raise ValueError('Model has dynamic input shape, set --height and --width')
+    max_batch_size = args.max_batch_size
+    if pool.fixed_batch_size is not None and max_batch_size > pool.fixed_batch_size:
+        # e.g. frozen DeepLab V3 accepts only single image
+        print('Model accepts batches of {0} images only, max batch size is reduced to {0}'.format(
+            pool.fixed_batch_size
+        ))
+        max_batch_size = pool.fixed_batch_size
+    dtype = pool.input_dtype
+    batcher = MicroBatcher(
+        lambda batch: pool.predict(normalize_batch(batch, args.normalization, dtype)),
+        max_batch_size=max_batch_size, max_delay=args.max_delay_ms / 1000., max_queue=args.max_queue,
+        num_workers=args.runners
+    )
+    server = make_server(batcher, (height, width), args.host, args.port)
+    print('Serving {} on http://{}:{}'.format(args.model, *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+def load(args):
+    images = synthetic_images(args.images, args.height or 256, args.width or 256)
+    result = load_test(args.url, images, args.concurrency, args.requests)
+    print('{succeeded}/{requests} succeeded, {rejected} rejected, {failed} failed, {images_per_second:.2f} img/s, '
+          'p50 {p50_ms:.2f} ms, p90 {p90_ms:.2f} ms, p99 {p99_ms:.2f} ms'.format(**result))
+    with urllib.request.urlopen(args.url + '/metrics') as response:
+        print('server metrics:', response.read().decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-batching inference server and load generator')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve_parser = subparsers.add_parser('serve', help='serve .pb or .tflite model')
+    serve_parser.add_argument('model', help='path to .pb or .tflite file')
+    serve_parser.add_argument('--input', default=None, help='input tensor of frozen graph')
+    serve_parser.add_argument('--output', default=None, help='output tensor of frozen graph')
+    serve_parser.add_argument('--normalization', default='none', choices=NORMALIZATIONS)
+    serve_parser.add_argument('--runners', type=int, default=1, help='number of sessions or interpreters')
+    serve_parser.add_argument('--threads', type=int, default=None, help='threads of each runner')
+    serve_parser.add_argument('--max-batch-size', type=int, default=8)
+    serve_parser.add_argument('--max-delay-ms', type=float, default=10)
+    serve_parser.add_argument('--max-queue', type=int, default=64)
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--height', type=int, default=None, help='input height for dynamic shapes')
+    serve_parser.add_argument('--width', type=int, default=None, help='input width for dynamic shapes')
+    serve_parser.set_defaults(func=serve)
+
+    load_parser = subparsers.add_parser('load', help='send synthetic images to server')
+    load_parser.add_argument('--url', default='http://127.0.0.1:8000')
+    load_parser.add_argument('--concurrency', type=int, default=16)
+    load_parser.add_argument('--requests', type=int, default=500)
+    load_parser.add_argument('--images', type=int, default=16, help='number of distinct synthetic images')
+    load_parser.add_argument('--height', type=int, default=None, help='height of synthetic images')
+    load_parser.add_argument('--width', type=int, default=None, help='width of synthetic images')
+    load_parser.set_defaults(func=load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Sliding-window inference of large images with fixed-size models
+
+Image is split into overlapping tiles of model input size, tiles of one row
+are run through model in batches and their scores are blended with 2D Hann
+window, so seams between tiles vanish. Only scores of current row of tiles
+are kept, rows above it are turned into labels as soon as no later tile
+covers them, so memory of scores does not depend on image height:
+
+    runner = load_runner('ICNet/ICNet_256x256.pb', 'image:0', 'predictions/ResizeBilinear:0')
+    predictor = TiledPredictor(runner.predict, (256, 256), overlap=0.25)
+    labels = predictor.predict(image)
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from inference import normalize_batch
+
+
+def tile_positions(length, tile, stride):
+    """Starts of tiles covering segment, last tile is aligned to the end
+
+    :length (int): length of segment, not less than tile
+    :tile (int): size of tile
+    :stride (int): step between tiles
+
+    :return (list of int): starts of tiles
+    """
+    positions = list(range(0, length - tile, stride))
+    return positions + [length - tile]
+
+
+def blending_window(height, width):
+    """2D Hann window without zero borders, so pixels at image border have positive weight
+
+    :height (int): height of tile
+    :width (int): width of tile
+
+    :return (array [height, width, 1]): float32 weights
+    """
+    window = np.outer(np.hanning(height + 2)[1:-1], np.hanning(width + 2)[1:-1])
+    return window.astype(np.float32)[:, :, np.newaxis]
+
+
+class TiledPredictor:
+    """Overlapping-tile inference around any model with per-class scores output"""
+
+    def __init__(self, predict, tile_size, overlap=0.25, batch_size=4, normalization='none', dtype=np.float32):
+        """
+        :predict (callable): function of batch of normalized images [N, h, w, 3] returning scores
+        [N, h', w', C], e.g. `runner.predict`, scores of lower resolution are resized to tile size
+        :tile_size (tuple): height and width of model input
+        :overlap (float): fraction of tile shared with neighbour tile, in [0, 1)
+        :batch_size (int): number of tiles in one model call
+        :normalization (str): one of `inference.NORMALIZATIONS`
+        :dtype (numpy dtype): input type of model
+        """
+        if not 0 <= overlap < 1:
+            raise ValueError('Overlap must be in [0, 1), got {}'.format(overlap))
+        self.predict_batch = predict
+        self.tile_height, self.tile_width = tile_size
+        self.stride = (max(1, int(round(self.tile_height * (1 - overlap)))),
+                       max(1, int(round(self.tile_width * (1 - overlap)))))
+        self.batch_size = batch_size
+        self.normalization = normalization
+        self.dtype = dtype
+        self.window = blending_window(self.tile_height, self.tile_width)
+        self.stats = {'tiles': 0, 'model_seconds': 0.}
+
+    def _tile_scores(self, tiles):
+        start = time.perf_counter()
+        scores = self.predict_batch(normalize_batch(tiles, self.normalization, self.dtype))
+        self.stats['model_seconds'] += time.perf_counter() - start
+        self.stats['tiles'] += len(tiles)
+        if scores.ndim != 4 or np.issubdtype(scores.dtype, np.integer):
+            raise ValueError('Tiles can be blended only by per-class scores, model returns {} {}'.format(
+                scores.dtype, scores.shape
+            ))
+        if scores.shape[1:3] != (self.tile_height, self.tile_width):
+            scores = np.array([
+                cv2.resize(_s, (self.tile_width, self.tile_height), interpolation=cv2.INTER_LINEAR)
+                .reshape(self.tile_height, self.tile_width, -1) for _s in scores
+            ])
+        return scores
+
+    def predict(self, image, out=None):
+        """Label map of image of any size
+
+        :image (array [H, W, 3]): uint8 RGB image
+        :out (array [H, W], optional): buffer to write labels into, e.g. np.memmap for huge images
+
+        :return (array [H, W]): uint8 labels
+        """
+        height, width = image.shape[:2]
+        if out is None:
+            out = np.empty((height, width), dtype=np.uint8)
+        # images smaller than tile are padded with zeros, as in `utils.resize_pad`
+        padded_height, padded_width = max(height, self.tile_height), max(width, self.tile_width)
+        if (padded_height, padded_width) != (height, width):
+            image = np.pad(image, ((0, padded_height - height), (0, padded_width - width), (0, 0)), 'constant')
+        rows = tile_positions(padded_height, self.tile_height, self.stride[0])
+        cols = tile_positions(padded_width, self.tile_width, self.stride[1])
+
+        # weighted sum of scores of rows [top, top + tile_height)
+        scores, top = None, 0
+        for idx, row in enumerate(rows):
+            if scores is not None:
+                shift = row - top
+                scores[:-shift] = scores[shift:]
+                scores[-shift:] = 0
+            top = row
+            for start in range(0, len(cols), self.batch_size):
+                batch_cols = cols[start:start + self.batch_size]
+                tiles = np.array([image[row:row + self.tile_height, _c:_c + self.tile_width] for _c in batch_cols])
+                tile_scores = self._tile_scores(tiles)
+                if scores is None:
+                    scores = np.zeros((self.tile_height, padded_width, tile_scores.shape[-1]), np.float32)
+                for col, score in zip(batch_cols, tile_scores):
+                    scores[:, col:col + self.tile_width] += score * self.window
+            # rows above next tile are final, argmax does not need division by sum of weights
+            bottom = min(rows[idx + 1] if idx + 1 < len(rows) else padded_height, height)
+            if bottom > row:
+                out[row:bottom] = scores[:bottom - row, :width].argmax(axis=-1)
+        return out
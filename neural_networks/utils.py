@@ -1,5 +1,8 @@
 import tensorflow as tf
 import numpy as np
+import cv2
+
+from postprocessing import softmax_to_labels, labels_to_onehot
 
 EPS = 1e-12
 
@@ -22,20 +25,18 @@ def freeze_session(session, keep_var_names=None, output_names=None, quantize=Tru
 
 
 def softmax2classes(pred, height=256, width=256, num_classes=21):
-    pred_mask = np.zeros_like(pred)
-    for _i in range(height):
-        for _j in range(width):
-            cur_top = -1
-            cur_max = -1
-            for _cl in range(num_classes):
-                if pred[_i, _j, _cl] > cur_max:
-                    cur_max = pred[_i, _j, _cl]
-                    cur_top = _cl
-            pred_mask[_i, _j, cur_top] = 1.
-    return pred_mask
+    """Replace scores of each pixel with one-hot vector of the best class
+
+    :pred (array [height, width, num_classes]): softmax output of network
+
+    :return (array [height, width, num_classes]): one-hot mask with type of pred
+    """
+    labels = softmax_to_labels(pred[np.newaxis])[0]
+    return labels_to_onehot(labels, num_classes, dtype=pred.dtype)
 
 
 def get_iou( gt , pr , n_classes=21):
+    # per-image IoU of one-hot masks, use metrics.ConfusionMatrix for dataset mIoU
     class_wise = np.zeros(n_classes)
     for cl in range(n_classes):
         intersection = np.sum(( gt[:, :, cl] == 1. )*( pr[:, :, cl] == 1. ))
@@ -59,3 +60,34 @@ def load_graph(frozen_graph_filename):
         # Since we load everything in a new graph, this is not needed
         tf.import_graph_def(graph_def)
     return graph
+
+
+def resize_pad(image, height, width, interpolation=cv2.INTER_LINEAR, out=None):
+    """Resize image keeping aspect ratio and pad it with zeros to given shape
+
+    :image (array [N, M, ...]): source image or mask
+    :height (int): height of result
+    :width (int): width of result
+    :interpolation (int): cv2 interpolation, use cv2.INTER_NEAREST for masks
+    :out (array [height, width, ...], optional): buffer to write result into
+
+    :return (array [height, width, ...]): resized and padded image
+    """
+    if image.shape[:2] == (height, width):
+        if out is None:
+            return image
+        out[...] = image
+        return out
+    scale = min(height / image.shape[0], width / image.shape[1])
+    new_height = min(height, max(1, int(round(image.shape[0] * scale))))
+    new_width = min(width, max(1, int(round(image.shape[1] * scale))))
+    resized = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+    if out is None:
+        result = np.zeros((height, width) + image.shape[2:], dtype=image.dtype)
+    else:
+        result = out
+        result[...] = 0
+    top = (height - new_height) // 2
+    left = (width - new_width) // 2
+    result[top:top + new_height, left:left + new_width] = resized.reshape((new_height, new_width) + image.shape[2:])
+    return result
@@ -0,0 +1,267 @@
+"""Video segmentation with full model only on keyframes
+
+Frame becomes keyframe when it differs from previous keyframe by more than
+threshold (mean absolute difference of small grayscale copies) or when too
+many frames passed. Between keyframes labels are produced cheaply:
+    - 'hold' reuses labels of keyframe;
+    - 'flow' warps labels of previous frame by Farneback optical flow;
+    - 'sub1' runs only full resolution branch of IC-Net over context features
+      of keyframe (see `ICNet.model.split_branches`).
+Effective FPS and mIoU of every frame are reported for each mode, against
+ground truth of synthetic clip (camera panning over VOC image) or against
+full model on every frame for recorded clip:
+
+    python video.py ICNet/141_epochs_fine_tuning.h5 --voc-path /data/VOC2012 --modes full hold flow sub1
+    python video.py ICNet/141_epochs_fine_tuning.h5 --video clip.mp4 --thresholds 0.02 0.05 0.1
+"""
+
+import argparse
+import json
+import time
+from os.path import join
+
+import cv2
+import numpy as np
+
+from metrics import ConfusionMatrix
+from postprocessing import to_labels
+
+MODES = ('full', 'hold', 'flow', 'sub1')
+
+
+def read_frames(path, height, width):
+    """Frames of video file
+
+    :path (str): path to video readable by OpenCV
+    :height (int): height of frames after resize
+    :width (int): width of frames after resize
+
+    :return (generator of array [height, width, 3]): uint8 RGB frames
+    """
+    capture = cv2.VideoCapture(path)
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield cv2.resize(frame, (width, height))[:, :, ::-1]
+    finally:
+        capture.release()
+
+
+def synthetic_clip(image, labels, height, width, num_frames=60, zoom=1.5):
+    """Camera panning over image, window moves from top left to bottom right corner
+
+    :image (array [H, W, 3]): uint8 RGB image
+    :labels (array [H, W]): uint8 labels of image
+    :height (int): height of frames
+    :width (int): width of frames
+    :num_frames (int): number of frames
+    :zoom (float): ratio of image size to window size
+
+    :return (generator of tuple(array [height, width, 3], array [height, width])): frames and their labels
+    """
+    image = cv2.resize(image, (int(width * zoom), int(height * zoom)))
+    labels = cv2.resize(labels, (int(width * zoom), int(height * zoom)), interpolation=cv2.INTER_NEAREST)
+    for idx in range(num_frames):
+        progress = idx / max(1, num_frames - 1)
+        top = int(round(progress * (image.shape[0] - height)))
+        left = int(round(progress * (image.shape[1] - width)))
+        yield image[top:top + height, left:left + width], labels[top:top + height, left:left + width]
+
+
+def frame_difference(first, second, size=64):
+    """Cheap measure of change between frames
+
+    :first (array [H, W, 3]): uint8 RGB frame
+    :second (array [H, W, 3]): uint8 RGB frame
+    :size (int): frames are compared at size x size
+
+    :return (float): mean absolute difference of grayscale frames in [0, 1]
+    """
+    first = cv2.resize(cv2.cvtColor(first, cv2.COLOR_RGB2GRAY), (size, size), interpolation=cv2.INTER_AREA)
+    second = cv2.resize(cv2.cvtColor(second, cv2.COLOR_RGB2GRAY), (size, size), interpolation=cv2.INTER_AREA)
+    return float(np.mean(cv2.absdiff(first, second))) / 255
+
+
+def warp_labels(labels, previous, current, scale=0.5):
+    """Move labels of previous frame to current one by dense optical flow
+
+    :labels (array [H, W]): uint8 labels of previous frame
+    :previous (array [H, W, 3]): uint8 RGB previous frame
+    :current (array [H, W, 3]): uint8 RGB current frame
+    :scale (float): flow is computed at this fraction of frame size
+
+    :return (array [H, W]): uint8 labels of current frame
+    """
+    height, width = labels.shape
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    previous = cv2.resize(cv2.cvtColor(previous, cv2.COLOR_RGB2GRAY), size, interpolation=cv2.INTER_AREA)
+    current = cv2.resize(cv2.cvtColor(current, cv2.COLOR_RGB2GRAY), size, interpolation=cv2.INTER_AREA)
+    # flow from current to previous frame, so every pixel of current frame takes label from where it came
+    flow = cv2.calcOpticalFlowFarneback(current, previous, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    flow = cv2.resize(flow, (width, height)) / scale
+    grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+    return cv2.remap(labels, grid_x + flow[..., 0], grid_y + flow[..., 1], cv2.INTER_NEAREST,
+                     borderMode=cv2.BORDER_REPLICATE)
+
+
+class VideoSegmenter:
+    """Per-frame labels of video with adaptive keyframes"""
+
+    def __init__(self, predict, mode='flow', threshold=0.05, max_interval=30, context=None, light=None):
+        """
+        :predict (callable): full model, function of batch of RGB frames [1, H, W, 3] in [0, 255] returning scores
+        :mode (str): one of MODES, 'full' runs model on every frame
+        :threshold (float): frame difference from keyframe which triggers new keyframe
+        :max_interval (int): maximum number of frames between keyframes
+        :context (callable): context branch for 'sub1' mode, function of batch of frames returning features
+        :light (callable): light branch for 'sub1' mode, function of batch of frames and features returning scores
+        """
+        if mode not in MODES:
+            raise ValueError('Unknown mode: {}'.format(mode))
+        if mode == 'sub1' and (context is None or light is None):
+            raise ValueError("Mode 'sub1' requires context and light branches")
+        self.predict = predict
+        self.mode = mode
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self.context = context
+        self.light = light
+        self.reset()
+
+    def reset(self):
+        self.keyframe = None
+        self.features = None
+        self.previous = None
+        self.labels = None
+        self.since_keyframe = 0
+
+    def _labels(self, scores, shape):
+        labels = to_labels(scores)[0]
+        if labels.shape != shape:
+            labels = cv2.resize(labels, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+        return labels
+
+    def segment(self, frame):
+        """Labels of next frame of video
+
+        :frame (array [H, W, 3]): uint8 RGB frame
+
+        :return (tuple(array [H, W], bool)): uint8 labels and whether frame was keyframe
+        """
+        batch = frame[np.newaxis].astype(np.float32)
+        is_keyframe = self.mode == 'full' or self.keyframe is None or self.since_keyframe >= self.max_interval \
+            or frame_difference(frame, self.keyframe) > self.threshold
+        if is_keyframe:
+            self.keyframe, self.since_keyframe = frame, 0
+            if self.mode == 'sub1':
+                self.features = self.context(batch)
+                self.labels = self._labels(self.light(batch, self.features), frame.shape[:2])
+            else:
+                self.labels = self._labels(self.predict(batch), frame.shape[:2])
+        else:
+            self.since_keyframe += 1
+            if self.mode == 'flow':
+                self.labels = warp_labels(self.labels, self.previous, frame)
+            elif self.mode == 'sub1':
+                self.labels = self._labels(self.light(batch, self.features), frame.shape[:2])
+        self.previous = frame
+        return self.labels, is_keyframe
+
+
+def run(segmenter, clip, reference=None, num_classes=21):
+    """Segment clip and measure speed and quality of every frame
+
+    :segmenter (VideoSegmenter): segmenter
+    :clip (list of tuple(array, array)): frames and their labels, labels may be None if reference is given
+    :reference (list of array): labels of full model for every frame, used when clip has no labels
+    :num_classes (int): number of classes
+
+    :return (dict): effective FPS, fraction of keyframes, mIoU over clip and per-frame mIoU
+    """
+    segmenter.reset()
+    frame_iou, keyframes, elapsed = [], 0, 0.
+    total = ConfusionMatrix(num_classes)
+    for idx, (frame, labels) in enumerate(clip):
+        start = time.perf_counter()
+        pred, is_keyframe = segmenter.segment(frame)
+        elapsed += time.perf_counter() - start
+        keyframes += is_keyframe
+        target = labels if reference is None else reference[idx]
+        confusion = ConfusionMatrix(num_classes)
+        confusion.update(target[np.newaxis], pred[np.newaxis])
+        total.merge(confusion)
+        frame_iou.append(confusion.mean_iou)
+    return {
+        'fps': len(clip) / elapsed, 'keyframes': keyframes / len(clip), 'mean_iou': total.mean_iou,
+        'frame_iou': frame_iou
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Video segmentation with keyframe reuse')
+    parser.add_argument('weights', help='path to weights of IC-Net')
+    parser.add_argument('--video', default=None, help='recorded clip, quality is measured against full model')
+    parser.add_argument('--voc-path', default=None, help='VOC2012 folder for synthetic clip with ground truth')
+    parser.add_argument('--image', default='2007_000129', help='name of VOC image for synthetic clip')
+    parser.add_argument('--frames', type=int, default=60, help='number of frames of synthetic clip')
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.05])
+    parser.add_argument('--max-interval', type=int, default=30)
+    parser.add_argument('--json', default=None, help='file to write per-frame report into')
+    args = parser.parse_args()
+    if (args.video is None) == (args.voc_path is None):
+        parser.error('exactly one of --video and --voc-path is required')
+
+    from ICNet.model import build_bn, split_branches
+    from pascal_voc_data import PascalVocGenerator
+
+    model = build_bn(args.width, args.height, len(PascalVocGenerator.classes), weights_path=args.weights)
+    context, light = split_branches(model)
+    predict = model.predict
+
+    def light_predict(batch, features):
+        return light.predict([batch, features])
+
+    if args.video is not None:
+        clip = [(_frame, None) for _frame in read_frames(args.video, args.height, args.width)]
+        full = VideoSegmenter(predict, 'full')
+        reference = [full.segment(_frame)[0] for _frame, _ in clip]
+    else:
+        image = cv2.imread(join(args.voc_path, 'JPEGImages', args.image + '.jpg'))[:, :, ::-1]
+        mask = cv2.imread(join(args.voc_path, 'SegmentationClass', args.image + '.png'))[:, :, ::-1]
+        clip = list(synthetic_clip(image, PascalVocGenerator.codec.encode(mask), args.height, args.width, args.frames))
+        reference = None
+    # first calls build predict functions of keras models
+    warmup = clip[0][0][np.newaxis].astype(np.float32)
+    light_predict(warmup, context.predict(warmup))
+    predict(warmup)
+
+    rows = []
+    for mode in args.modes:
+        for threshold in (args.thresholds if mode != 'full' else [0]):
+            segmenter = VideoSegmenter(predict, mode, threshold, args.max_interval, context.predict, light_predict)
+            result = run(segmenter, clip, reference)
+            result.update({'mode': mode, 'threshold': threshold})
+            rows.append(result)
+
+    full_iou = np.array(rows[0]['frame_iou']) if args.modes[0] == 'full' else None
+    print('| Mode | Threshold | FPS    | Keyframes | mIoU  | Drift |')
+    print('|------|-----------|--------|-----------|-------|-------|')
+    for row in rows:
+        # drift is mean per-frame loss of mIoU relative to full model on every frame
+        drift = np.nanmean(full_iou - np.array(row['frame_iou'])) if full_iou is not None else float('nan')
+        row['drift'] = float(drift)
+        print('| {mode:4} | {threshold:9.3f} | {fps:6.1f} | {keyframes:9.2f} | {mean_iou:.3f} | {drift:.3f} |'.format(
+            **row
+        ))
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump(rows, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()